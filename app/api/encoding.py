@@ -0,0 +1,163 @@
+# app/api/encoding.py
+"""
+Codifica delle risposte di forecast.
+
+- Layout: "records" (una dict per riga, formato storico) oppure "columnar"
+  (array paralleli, date come epoch in millisecondi).
+- Formato (header Accept): JSON, MessagePack o Arrow IPC stream. I formati binari sono sempre colonnari.
+- Compressione (header Accept-Encoding): brotli se disponibile, altrimenti gzip.
+"""
+import gzip
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+try:
+    import msgpack
+except ImportError:  # dipendenza opzionale
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # dipendenza opzionale
+    brotli = None
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+
+FORECAST_COLUMNS = ["ds", "yhat", "yhat_lower", "yhat_upper"]
+# Sotto questa soglia comprimere costa più di quanto si risparmia
+MIN_COMPRESS_BYTES = 1024
+
+
+def to_columnar(forecast_data: Any) -> Dict[str, List[Any]]:
+    """Da lista di record (o già colonnare) ad array paralleli con date in epoch ms"""
+    if isinstance(forecast_data, dict):
+        return forecast_data
+
+    df = pd.DataFrame(forecast_data, columns=FORECAST_COLUMNS)
+    ds = pd.to_datetime(df["ds"])
+    if ds.dt.tz is not None:
+        ds = ds.dt.tz_convert("UTC").dt.tz_localize(None)
+    columns = {"ds": (ds.to_numpy(dtype="datetime64[ms]").astype("int64")).tolist()}
+    for col in FORECAST_COLUMNS[1:]:
+        columns[col] = df[col].to_numpy(dtype="float64").tolist()
+    return columns
+
+
+def apply_layout(payload: Dict[str, Any], layout: str) -> Dict[str, Any]:
+    """Converte forecast_data (singolo o dentro 'results' di un batch) nel layout richiesto"""
+    if layout != "columnar":
+        return payload
+
+    payload = dict(payload)
+    if "forecast_data" in payload:
+        payload["forecast_data"] = to_columnar(payload["forecast_data"])
+    if "results" in payload:
+        payload["results"] = [
+            {**r, "forecast_data": to_columnar(r["forecast_data"])} if "forecast_data" in r else r
+            for r in payload["results"]
+        ]
+    payload["layout"] = "columnar"
+    return payload
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Tipo non serializzabile: {type(obj)}")
+
+
+def _pyarrow():
+    """pyarrow (opzionale) importato solo alla prima risposta Arrow: le richieste JSON non lo caricano"""
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _to_arrow(payload: Dict[str, Any]) -> bytes:
+    """
+    Arrow IPC stream in formato lungo: una riga per (cliente, data).
+    Tutto ciò che non è forecast_data (metriche, freshness, ...) va nei metadata dello schema come JSON.
+    """
+    pa = _pyarrow()
+    rows = payload["results"] if "results" in payload else [payload]
+    clients, columns = [], {c: [] for c in FORECAST_COLUMNS}
+    for r in rows:
+        data = r.get("forecast_data")
+        if data is None:
+            continue
+        data = to_columnar(data)
+        clients.extend([r.get("client_name")] * len(data["ds"]))
+        for c in FORECAST_COLUMNS:
+            columns[c].extend(data[c])
+
+    arrays = {
+        "client_name": pa.array(clients, type=pa.string()),
+        "ds": pa.array(np.asarray(columns["ds"], dtype="int64").astype("datetime64[ms]")),
+    }
+    for c in FORECAST_COLUMNS[1:]:
+        arrays[c] = pa.array(np.asarray(columns[c], dtype="float64"))
+
+    meta = {k: v for k, v in payload.items() if k != "forecast_data"}
+    if "results" in meta:
+        meta["results"] = [{k: v for k, v in r.items() if k != "forecast_data"} for r in meta["results"]]
+    table = pa.table(arrays).replace_schema_metadata(
+        {"payload": json.dumps(meta, default=_json_default)}
+    )
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _accepts(request: Request, media_types) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(m in accept for m in media_types)
+
+
+def _compress(body: bytes, request: Request) -> Tuple[bytes, Optional[str]]:
+    if len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if brotli is not None and "br" in accept_encoding:
+        return brotli.compress(body, quality=4), "br"
+    if "gzip" in accept_encoding:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
+
+
+def encode_response(request: Request, payload: Dict[str, Any], layout: str = "records") -> Response:
+    """Sceglie formato e compressione in base agli header della richiesta"""
+    if _accepts(request, (ARROW_TYPE,)):
+        if _pyarrow() is None:
+            raise HTTPException(status_code=406, detail="Formato Arrow non disponibile sul server (pyarrow mancante)")
+        body, media_type = _to_arrow(payload), ARROW_TYPE
+    elif _accepts(request, MSGPACK_TYPES):
+        if msgpack is None:
+            raise HTTPException(status_code=406, detail="Formato MessagePack non disponibile sul server (msgpack mancante)")
+        body = msgpack.packb(apply_layout(payload, "columnar"), default=_json_default, use_bin_type=True)
+        media_type = MSGPACK_TYPES[0]
+    else:
+        body = json.dumps(apply_layout(payload, layout), default=_json_default, separators=(",", ":")).encode("utf-8")
+        media_type = JSON_TYPE
+
+    body, encoding = _compress(body, request)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
@@ -1,11 +1,14 @@
 # app/api/server.py
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
 from pydantic import BaseModel
-import pandas as pd
-import io
+from typing import Dict, List, Literal, Optional, Union
 import sys
 import os
-from fastapi.responses import Response
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from app.services.pdf_generator import PDFReportGenerator
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -14,12 +17,43 @@ from fastapi.staticfiles import StaticFiles
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from app.services.forecasting import ForecastingService
-from app.services.agent_engine import AgentEngine
+from app.services.engines import AVAILABLE_ENGINES
+from app.services.backtesting import BacktestService
+from app.services.hierarchy import HierarchicalForecaster
+from app.services.scenarios import ScenarioService
+from app.services.forecast_store import forecast_store, ForecastPrecomputer
+from app.services.agent_engine import get_agent_engine, reset_agent_engine
+from app.services.http_clients import aclose_http_clients
+from app.services.llm_cache import llm_cache_stats
+from app.services.web_search import web_search_stats
+from app.core.config import settings
+from app.data.ingestion import ingest_csv, IngestionError
+from app.api.encoding import encode_response
+
+# Scheduler che tiene aggiornato lo store dei forecast materializzati
+precomputer = ForecastPrecomputer()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.FORECAST_PRECOMPUTE_ENABLED:
+        precomputer.start()
+    # Motore degli agenti creato all'avvio (LLM, Tavily, RAG, grafo compilato): le richieste lo riusano
+    try:
+        await run_in_threadpool(get_agent_engine)
+    except Exception as e:
+        # Non blocca l'avvio: verrà ritentato alla prima richiesta /agent
+        print(f"⚠️ Motore agenti non inizializzato all'avvio: {e}")
+    yield
+    precomputer.stop()
+    # Motore e pool HTTP insieme: un motore sopravvissuto userebbe client già chiusi
+    reset_agent_engine()
+    await aclose_http_clients()
 
 app = FastAPI(
     title="Progetto Manhattan API",
     description="Backend Enterprise per Forecasting Strategico Multi-Agente",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 # 1. ABILITA CORS (Fondamentale per il frontend)
 app.add_middleware(
@@ -43,6 +77,57 @@ app.mount("/dashboard", StaticFiles(directory=static_path, html=True), name="sta
 class ForecastRequest(BaseModel):
     client_name: str
     months: int = 12
+    # Warm start dal modello precedente (None = default da settings)
+    incremental: Optional[bool] = None
+    # "prophet" oppure un motore NumPy veloce: "holt_winters", "seasonal_naive", "ets"
+    engine: str = "prophet"
+    # "records" (lista di dict) oppure "columnar" (array paralleli, date in epoch ms)
+    layout: Literal["records", "columnar"] = "records"
+
+class BatchForecastRequest(BaseModel):
+    # Lista di clienti oppure "all" per l'intero portafoglio
+    clients: Union[List[str], str] = "all"
+    months: int = 12
+    # Se assente si usa FORECAST_MAX_WORKERS (o il numero di core)
+    max_workers: Optional[int] = None
+    engine: str = "prophet"
+    layout: Literal["records", "columnar"] = "records"
+
+class HierarchyRequest(BaseModel):
+    months: int = 12
+    # Solo motori vettoriali: tutta la gerarchia è calcolata in una passata
+    engine: str = "holt_winters"
+    method: Literal["bottom_up", "mint_wls", "mint_shrink"] = "mint_shrink"
+    include_forecast_data: bool = False
+
+class ScenarioShock(BaseModel):
+    start: str                 # mese iniziale, es. "2025-07"
+    end: Optional[str] = None  # mese finale incluso (default = start)
+    pct: float                 # variazione percentuale, es. -20
+
+class ScenarioSpec(BaseModel):
+    name: str
+    shocks: List[ScenarioShock] = []
+    # Sostituisce la pendenza del trend con questa crescita annua (%)
+    growth_pct_annual: Optional[float] = None
+    # Mese dell'anno (1-12) -> moltiplicatore
+    seasonal_multipliers: Dict[int, float] = {}
+
+class ScenarioRequest(BaseModel):
+    client_name: str
+    months: int = 12
+    engine: str = "prophet"
+    scenarios: List[ScenarioSpec]
+    include_forecast_data: bool = False
+
+class BacktestRequest(BaseModel):
+    engines: List[str] = ["prophet"]
+    clients: Union[List[str], str] = "all"
+    horizon: int = 6      # mesi previsti per fold
+    initial: int = 30     # mesi minimi di training (oltre 2 anni: la stagionalità annuale è stimabile)
+    period: int = 3       # passo tra un'origine e la successiva
+    max_workers: Optional[int] = None
+    include_folds: bool = False
 
 class AnalysisRequest(BaseModel):
     client_name: str
@@ -59,18 +144,93 @@ class ReportRequest(BaseModel):
     sector: str
     report_text: str
 
+# --- Helpers ---
+
+def _forecast_payload(client_name: str, months: int = 12, engine: str = "prophet", incremental: Optional[bool] = None) -> dict:
+    """
+    Forecast servito dallo store materializzato se fresco, altrimenti calcolato on-demand.
+    I calcoli on-demand di Prophet vengono scritti nello store per le richieste successive.
+    """
+    fs = ForecastingService()
+    use_store = engine == settings.FORECAST_STORE_ENGINE and not incremental
+
+    if use_store:
+        entry = forecast_store.get(client_name, months, engine)
+        if entry and forecast_store.is_fresh(entry, fs.dataset.series_hashes.get(client_name)):
+            return {
+                "metrics": entry["metrics"],
+                "forecast_data": entry["forecast_data"],
+                "freshness": {"source": "store", "computed_at": entry["computed_at"]}
+            }
+
+    result = fs.generate_forecast(client_name, months, include_plot=False, incremental=incremental, engine=engine)
+    # Estraiamo i dati per il grafico (frontend deve disegnarlo)
+    records = ForecastingService.forecast_records(result["raw_forecast"], months)
+
+    if use_store:
+        forecast_store.put(client_name, months, engine, {
+            "metrics": result["metrics"],
+            "forecast_data": records,
+            "series_hash": fs.dataset.series_hashes[client_name],
+            "dataset_version": fs.dataset.version,
+        })
+
+    return {
+        "metrics": result["metrics"],
+        "forecast_data": records,
+        "freshness": {"source": "on_demand", "computed_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+    }
+
+def _sse_response(events) -> StreamingResponse:
+    """
+    Server-Sent Events da un generatore (tipo, dati): una riga "event" e una "data" JSON per evento.
+    Il generatore è sincrono e Starlette lo scorre in un thread, senza bloccare l'event loop.
+    Un errore a metà flusso diventa un evento "error" (lo status 200 è già stato inviato).
+    """
+    def stream():
+        try:
+            for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+    # no-transform / X-Accel-Buffering: niente buffering o compressione dei proxy sul flusso
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
+
 # --- Endpoints ---
 
 @app.post("/agent/chat")
 def chat_agent(req: ChatRequest):
     try:
-        engine = AgentEngine()
+        engine = get_agent_engine()
         # Qui il Server CHIAMA il Cervello
         answer = engine.chat_with_director(req.question, req.context_report)
         return {"answer": answer}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/agent/chat/stream")
+def chat_agent_stream(req: ChatRequest):
+    """Come /agent/chat, in SSE: fonti RAG ("rag"), token della risposta ("token"), risposta intera ("done")"""
+    try:
+        engine = get_agent_engine()
+        return _sse_response(engine.stream_chat(req.question, req.context_report))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/agent/cache")
+def agent_cache_stats():
+    """
+    Cache delle risposte LLM (hit/miss per nodo, voci, scadute ed eliminate per il limite di dimensione)
+    e della ricerca web (hit, miss, richieste coalescenti, errori)
+    """
+    try:
+        # Statistiche lette dalle cache condivise: l'endpoint non deve creare il motore agenti
+        return {**llm_cache_stats(), "web_search": web_search_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/")
 def health_check():
     return {"status": "active", "system": "Manhattan Core v1.0"}
@@ -80,25 +240,95 @@ def get_clients():
     """Restituisce la lista dei clienti disponibili nel dataset"""
     try:
         fs = ForecastingService()
-        clients = fs.raw_df["cliente"].unique().tolist()
-        return {"clients": clients}
+        return {"clients": fs.list_clients(), "sectors": fs.list_sectors()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/clients/{client_name}/history")
+def get_client_history(client_name: str, start: Optional[str] = None, end: Optional[str] = None):
+    """Storico del cliente, opzionalmente limitato a un intervallo di date (es. ?start=2024-01-01)"""
+    try:
+        df = ForecastingService()._prepare_data(client_name, start, end)
+        return {"client_name": client_name, "history": df.to_dict(orient="records")}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/forecast")
-def generate_forecast(req: ForecastRequest):
-    """Esegue Prophet e restituisce JSON puro"""
+def generate_forecast(req: ForecastRequest, request: Request):
+    """
+    Restituisce il forecast del cliente (default Prophet).
+    Se disponibile e fresco viene letto dallo store precalcolato, altrimenti è calcolato al volo.
+    Formato di risposta negoziato via Accept (JSON, MessagePack, Arrow) e Accept-Encoding (br/gzip).
+    """
+    if req.engine not in AVAILABLE_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Motore non supportato. Disponibili: {AVAILABLE_ENGINES}")
+    try:
+        payload = _forecast_payload(req.client_name, req.months, req.engine, req.incremental)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return encode_response(request, payload, req.layout)
+
+@app.post("/forecast/batch")
+def generate_batch_forecast(req: BatchForecastRequest, request: Request):
+    """Forecast di più clienti (o di tutti) in parallelo su un pool di processi"""
+    if isinstance(req.clients, str) and req.clients != "all":
+        raise HTTPException(status_code=400, detail="clients deve essere una lista di nomi oppure 'all'")
+    if req.engine not in AVAILABLE_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Motore non supportato. Disponibili: {AVAILABLE_ENGINES}")
     try:
         fs = ForecastingService()
-        result = fs.generate_forecast(req.client_name, req.months)
-        
-        # Estraiamo i dati per il grafico (frontend deve disegnarlo)
-        forecast_df = result["raw_forecast"][['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(req.months + 12)
-        
-        return {
-            "metrics": result["metrics"],
-            "forecast_data": forecast_df.to_dict(orient="records")
-        }
+        payload = fs.generate_batch_forecast(req.clients, req.months, req.max_workers, engine=req.engine)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return encode_response(request, payload, req.layout)
+
+@app.post("/forecast/hierarchy")
+def generate_hierarchical_forecast(req: HierarchyRequest):
+    """Forecast riconciliato Totale → Settore → Cliente, con metriche a ogni livello"""
+    try:
+        return HierarchicalForecaster(ForecastingService()).forecast(
+            req.months, req.engine, req.method, req.include_forecast_data
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/forecast/scenario")
+def evaluate_scenarios(req: ScenarioRequest):
+    """
+    Scenari what-if (shock, trend, stagionalità) applicati ai campioni predittivi del modello
+    già addestrato: nessun refit, quantili e KPI ricalcolati in millisecondi.
+    """
+    try:
+        return ScenarioService().evaluate(
+            req.client_name,
+            [s.model_dump() for s in req.scenarios],
+            months=req.months,
+            engine=req.engine,
+            include_forecast_data=req.include_forecast_data,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/backtest")
+def run_backtest(req: BacktestRequest):
+    """Cross-validation rolling-origin: accuratezza (MAPE/sMAPE/copertura) e tempi per motore"""
+    unknown = [e for e in req.engines if e not in AVAILABLE_ENGINES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Motori non supportati: {unknown}. Disponibili: {AVAILABLE_ENGINES}")
+    if isinstance(req.clients, str) and req.clients != "all":
+        raise HTTPException(status_code=400, detail="clients deve essere una lista di nomi oppure 'all'")
+    try:
+        service = BacktestService(ForecastingService())
+        return service.run(
+            req.engines, req.clients, req.horizon, req.initial, req.period,
+            req.max_workers, include_folds=req.include_folds
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -109,39 +339,61 @@ def run_agent(req: AnalysisRequest):
         # Se il frontend non passa le metriche, le calcoliamo al volo
         metrics = req.metrics
         if not metrics:
-            fs = ForecastingService()
-            f_res = fs.generate_forecast(req.client_name)
-            metrics = f_res["metrics"]
+            metrics = _forecast_payload(req.client_name)["metrics"]
 
-        engine = AgentEngine()
+        engine = get_agent_engine()
         result = engine.run_analysis(req.client_name, req.sector, metrics)
         
         return {
             "analyst_output": result["analyst_output"],
             "researcher_output": result["researcher_output"],
-            "final_report": result["final_report"]
+            "final_report": result["final_report"],
+            "node_timings": result.get("node_timings", {}),
+            "node_metadata": result.get("node_metadata", {})
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/agent/analyze/stream")
+def run_agent_stream(req: AnalysisRequest):
+    """
+    Pipeline LangGraph in SSE: un evento "node" quando ogni agente termina (analista, RAG, ricerca web),
+    i token del report del Direttore ("token") mentre vengono generati e lo stato finale ("done").
+    """
+    try:
+        metrics = req.metrics
+        if not metrics:
+            metrics = _forecast_payload(req.client_name)["metrics"]
+
+        engine = get_agent_engine()
+        return _sse_response(engine.stream_analysis(req.client_name, req.sector, metrics))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/upload-data")
 async def upload_csv(file: UploadFile = File(...)):
-    """Endpoint per caricare CSV custom"""
+    """
+    Endpoint per caricare CSV custom.
+    Il file viene letto a blocchi dal temporaneo di upload (memoria limitata), salvato come
+    versione Parquet e attivato subito: i forecast successivi usano i nuovi dati.
+    """
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Il file deve essere un CSV")
     
     try:
-        content = await file.read()
-        df = pd.read_csv(io.StringIO(content.decode('utf-8')))
-        
-        # Check colonne minime
-        required = {'data_commessa', 'cliente', 'settore', 'fatturato'}
-        if not required.issubset(df.columns):
-            raise HTTPException(status_code=400, detail=f"CSV mancante di colonne: {required}")
-        
-        # Salviamo come file custom
-        df.to_csv("app/data/custom_upload.csv", index=False)
-        return {"message": "Upload completato", "rows": len(df)}
+        # Parsing e scrittura sono bloccanti: fuori dall'event loop
+        manifest = await run_in_threadpool(ingest_csv, file.file, file.filename)
+        # Lo store dei forecast viene ricalcolato sulla nuova versione
+        precomputer.trigger()
+        return {
+            "message": "Upload completato",
+            "rows": manifest["rows"],
+            "rows_rejected": manifest["rows_rejected"],
+            "clients": manifest["clients"],
+            "version": manifest["version"],
+        }
+    except IngestionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,129 @@
+"""
+Benchmark: costo di setup delle richieste /agent con motore per richiesta vs motore condiviso.
+
+1. "per richiesta" (comportamento precedente): AgentEngine() + build_graph() a ogni chiamata,
+   cioè nuovo ChatOpenAI, nuovo tool Tavily, nuovo RAGService (apertura del vector store) e grafo ricompilato;
+2. "condiviso": get_agent_engine() restituisce il motore creato all'avvio, grafo già compilato;
+3. connessioni HTTP: N richieste verso un server locale con un client nuovo per richiesta
+   vs il client condiviso (keep-alive). Un client nuovo costa anche la creazione del contesto SSL; in locale manca l'handshake TLS verso l'API,
+   quindi il guadagno reale su OpenAI/Tavily è maggiore.
+L'indice RAG viene costruito in una cartella temporanea con embedding locali (nessuna chiamata API).
+
+Uso:
+    python -m app.benchmarks.agent_engine [--repeat 20] [--vector-backend chroma flat] [--http-requests 200]
+"""
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import numpy as np
+
+from app.core.config import settings
+from app.data.rag_index_repo import build_vectorstore
+from app.services import agent_engine
+from app.services.embeddings import get_embeddings
+from app.services.http_clients import get_http_client
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Header e body in due write: senza TCP_NODELAY il delayed ACK aggiunge ~40 ms a risposta
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _median_ms(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def _bench_setup(vector_backend: str, repeat: int, repo_root: str):
+    work_dir = tempfile.mkdtemp(prefix="bench_agent_")
+    settings.RAG_PERSIST_DIR = work_dir
+    settings.RAG_VECTOR_BACKEND = vector_backend
+    try:
+        build_vectorstore(repo_root, work_dir, settings.RAG_COLLECTION_NAME,
+                          embedding=get_embeddings(), backend=vector_backend)
+
+        def per_request():
+            engine = agent_engine.AgentEngine()
+            engine.build_graph()
+
+        per_request()  # import e inizializzazioni una tantum fuori dalla misura
+        old_ms = _median_ms(per_request, repeat)
+        agent_engine.reset_agent_engine()
+        startup_ms = _median_ms(agent_engine.get_agent_engine, 1)
+        shared_ms = _median_ms(agent_engine.get_agent_engine, repeat)
+        compile_ms = _median_ms(agent_engine.get_agent_engine().build_graph, repeat)
+        agent_engine.reset_agent_engine()
+        return old_ms, shared_ms, startup_ms, compile_ms
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _bench_http(requests_count: int):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        start = time.perf_counter()
+        for _ in range(requests_count):
+            with httpx.Client() as client:
+                client.get(url)
+        fresh_s = time.perf_counter() - start
+
+        client = get_http_client()
+        client.get(url)
+        start = time.perf_counter()
+        for _ in range(requests_count):
+            client.get(url)
+        pooled_s = time.perf_counter() - start
+        return fresh_s, pooled_s
+    finally:
+        server.shutdown()
+
+
+def run(repeat: int = 20, vector_backends=("chroma", "flat"), http_requests: int = 200,
+        embedding_backend: str = "local", repo_root: str = "."):
+    settings.EMBEDDING_BACKEND = embedding_backend
+
+    print(f"{'Vector store':<14}{'Per richiesta (ms)':>20}{'Condiviso (ms)':>16}{'Avvio (ms)':>12}{'Compile (ms)':>14}")
+    for backend in vector_backends:
+        old_ms, shared_ms, startup_ms, compile_ms = _bench_setup(backend, repeat, repo_root)
+        print(f"{backend:<14}{old_ms:>20.2f}{shared_ms:>16.4f}{startup_ms:>12.2f}{compile_ms:>14.2f}")
+
+    if http_requests:
+        fresh_s, pooled_s = _bench_http(http_requests)
+        print(f"\nHTTP locale, {http_requests} richieste: client per richiesta {fresh_s * 1000 / http_requests:.2f} ms/req, "
+              f"pool condiviso {pooled_s * 1000 / http_requests:.2f} ms/req")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Setup del motore agenti: per richiesta vs condiviso")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--vector-backend", nargs="+", default=["chroma", "flat"], choices=["chroma", "flat"])
+    parser.add_argument("--http-requests", type=int, default=200)
+    parser.add_argument("--backend", choices=["openai", "local"], default="local",
+                        help="Backend degli embedding per l'indice temporaneo")
+    parser.add_argument("--repo-root", default=settings.RAG_REPO_ROOT)
+    args = parser.parse_args()
+
+    run(args.repeat, args.vector_backend, args.http_requests, args.backend, args.repo_root)
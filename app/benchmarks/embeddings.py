@@ -0,0 +1,100 @@
+"""
+Benchmark: indicizzazione e retrieval con la cache degli embedding.
+
+1. indicizzazione completa con cache vuota (tutti i chunk vanno al backend, in batch concorrenti);
+2. stessa indicizzazione con --full ma cache piena (nessuna chiamata al backend);
+3. query ripetute sul RAGService: prima chiamata vs chiamate successive.
+Con --latency-ms il backend locale simula la latenza di rete di ogni chiamata,
+per misurare l'effetto di batch e concorrenza senza usare l'API.
+
+Uso:
+    python -m app.benchmarks.embeddings [--latency-ms 300] [--concurrency 1 4 8] [--backend local]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+from app.data.rag_index_repo import build_vectorstore
+from app.services.embeddings import CachedEmbeddings, EmbeddingStore, _base_embeddings, embedding_model_name
+
+QUERIES = [
+    "Qual è la strategia commerciale per Brunello Cucinelli?",
+    "Modello organizzativo 231 di Akkodis",
+    "Clienti strategici 2026",
+]
+
+
+class _SlowEmbeddings(Embeddings):
+    """Backend con latenza fissa per chiamata (simula il round trip verso l'API)"""
+
+    def __init__(self, base: Embeddings, latency_s: float):
+        self.base = base
+        self.latency_s = latency_s
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_s)
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_s)
+        return self.base.embed_query(text)
+
+
+def run(backend: str = "local", latency_ms: float = 200.0, concurrency=(1, 4), repo_root: str = "."):
+    work_dir = tempfile.mkdtemp(prefix="bench_embeddings_")
+    base = _base_embeddings(backend)
+    if latency_ms > 0:
+        base = _SlowEmbeddings(base, latency_ms / 1000)
+    model = embedding_model_name(backend)
+
+    try:
+        print(f"{'Run':<34}{'Tempo (s)':>10}{'Chunk':>8}{'Hit':>8}{'Miss':>8}{'Chiamate':>10}")
+        for workers in concurrency:
+            store = EmbeddingStore(os.path.join(work_dir, f"cache_{workers}.sqlite"))
+            embedding = CachedEmbeddings(base, model, store, max_concurrency=workers)
+            persist_dir = os.path.join(work_dir, f"chroma_{workers}")
+
+            for label, full in ((f"index cache vuota, conc={workers}", False), (f"index cache piena, conc={workers}", True)):
+                before = embedding.stats()
+                stats = build_vectorstore(repo_root, persist_dir, "bench", full=full, embedding=embedding)
+                after = embedding.stats()
+                print(f"{label:<34}{stats['seconds']:>10.3f}{stats['chunks_added']:>8}"
+                      f"{after['hits'] - before['hits']:>8}{after['misses'] - before['misses']:>8}"
+                      f"{after['backend_calls'] - before['backend_calls']:>10}")
+            store.close()
+
+        # Retrieval: latenza dell'embedding delle query, prima e dopo la cache
+        from langchain_chroma import Chroma
+        store = EmbeddingStore(os.path.join(work_dir, "cache_queries.sqlite"))
+        embedding = CachedEmbeddings(base, model, store)
+        vs = Chroma(persist_directory=os.path.join(work_dir, f"chroma_{concurrency[0]}"),
+                    embedding_function=embedding, collection_name="bench")
+        for label in ("query a freddo", "query dalla cache"):
+            timings = []
+            for q in QUERIES:
+                start = time.perf_counter()
+                vs.similarity_search(q, k=settings.RAG_TOP_K)
+                timings.append(time.perf_counter() - start)
+            print(f"{label:<34}{np.mean(timings) * 1000:>9.1f}ms (media su {len(QUERIES)} query)")
+        store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache degli embedding: indicizzazione e retrieval")
+    parser.add_argument("--backend", choices=["openai", "local"], default="local")
+    parser.add_argument("--latency-ms", type=float, default=200.0,
+                        help="Latenza simulata per chiamata al backend (0 = nessuna)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--repo-root", default=settings.RAG_REPO_ROOT)
+    args = parser.parse_args()
+
+    run(args.backend, args.latency_ms, args.concurrency, args.repo_root)
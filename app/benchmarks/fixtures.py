@@ -0,0 +1,40 @@
+"""
+Dataset sintetici riproducibili per i benchmark.
+
+Ogni combinazione (clienti, mesi, seed, formato) viene generata una volta sola con il
+generatore vettoriale di app.data.seeder e riusata dai run successivi.
+
+Uso:
+    from app.benchmarks.fixtures import synthetic_dataset
+    path = synthetic_dataset(clients=10_000, months=240, seed=42)
+"""
+import os
+
+import numpy as np
+
+from app.data.seeder import iter_panel_blocks, make_client_profiles, write_dataset
+
+FIXTURES_DIR = "app/data/.cache/fixtures"
+
+
+def synthetic_dataset(
+    clients: int = 1000,
+    months: int = 120,
+    seed: int = 42,
+    fmt: str = "csv",
+    start_date: str = "2015-01-15",
+    fixtures_dir: str = FIXTURES_DIR,
+) -> str:
+    """Path del dataset (CSV o cartella Parquet), generato solo se non esiste già"""
+    ext = ".csv" if fmt == "csv" else ""
+    path = os.path.join(fixtures_dir, f"commesse_{clients}x{months}_s{seed}{ext}")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    # Scrittura su un path temporaneo: un run interrotto non lascia fixture a metà
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    profiles = make_client_profiles(clients, np.random.default_rng(seed))
+    write_dataset(iter_panel_blocks(profiles, start_date, months, seed), tmp_path, fmt)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,87 @@
+"""
+Benchmark: refit incrementale (warm start) vs fit a freddo.
+
+Per ogni cliente seedato simuliamo l'arrivo di un nuovo mese:
+1. fit sul dataset senza l'ultimo mese (modello "precedente");
+2. fit a freddo sul dataset completo;
+3. fit warm-start sul dataset completo, partendo dai parametri del modello precedente.
+Confrontiamo i tempi di fit e la deriva della previsione warm rispetto a quella a freddo.
+
+Uso:
+    python -m app.benchmarks.warm_start [--months 12] [--repeat 3] [--synthetic 20]
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from app.benchmarks.fixtures import synthetic_dataset
+from app.services.forecasting import ForecastingService
+
+
+def _timed_fit(df, warm_from=None, repeat: int = 1):
+    """Restituisce (modello, tempo mediano in secondi)"""
+    timings = []
+    model = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model = ForecastingService.fit_model(df, warm_from=warm_from)
+        timings.append(time.perf_counter() - start)
+    return model, float(np.median(timings))
+
+
+def _predict(model, months: int):
+    future = model.make_future_dataframe(periods=months, freq="M")
+    return model.predict(future)["yhat"].iloc[-months:].to_numpy()
+
+
+def run(data_path: str = "app/data/storico_commesse.csv", months: int = 12, repeat: int = 3):
+    # Stan/cmdstanpy è molto verboso a livello INFO
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+
+    service = ForecastingService(data_path)
+    rows = []
+
+    for client in service.list_clients():
+        df = service._prepare_data(client)
+        previous_df = df.iloc[:-1]
+
+        previous_model = ForecastingService.fit_model(previous_df)
+        cold_model, cold_time = _timed_fit(df, repeat=repeat)
+        warm_model, warm_time = _timed_fit(df, warm_from=previous_model, repeat=repeat)
+
+        cold_pred = _predict(cold_model, months)
+        warm_pred = _predict(warm_model, months)
+        drift_pct = float(np.mean(np.abs(warm_pred - cold_pred) / np.abs(cold_pred)) * 100)
+
+        rows.append({
+            "cliente": client,
+            "cold_s": cold_time,
+            "warm_s": warm_time,
+            "speedup": cold_time / warm_time if warm_time > 0 else float("nan"),
+            "drift_pct": drift_pct,
+        })
+
+    print(f"{'Cliente':<22}{'Cold (s)':>10}{'Warm (s)':>10}{'Speedup':>10}{'Drift %':>10}")
+    for r in rows:
+        print(f"{r['cliente']:<22}{r['cold_s']:>10.3f}{r['warm_s']:>10.3f}{r['speedup']:>10.2f}{r['drift_pct']:>10.3f}")
+
+    total_cold = sum(r["cold_s"] for r in rows)
+    total_warm = sum(r["warm_s"] for r in rows)
+    print(f"{'TOTALE':<22}{total_cold:>10.3f}{total_warm:>10.3f}{total_cold / total_warm:>10.2f}"
+          f"{np.mean([r['drift_pct'] for r in rows]):>10.3f}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm start vs cold fit di Prophet")
+    parser.add_argument("--data", default="app/data/storico_commesse.csv")
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic", type=int, default=None,
+                        help="Usa un dataset sintetico con N clienti (fixture riproducibile) invece di --data")
+    args = parser.parse_args()
+
+    data_path = synthetic_dataset(clients=args.synthetic, months=60) if args.synthetic else args.data
+    run(data_path, args.months, args.repeat)
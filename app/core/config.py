@@ -1,4 +1,5 @@
 # app/core/config.py
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -6,15 +7,112 @@ class Settings(BaseSettings):
     DEBUG_MODE: bool = True
 
     # API KEYS (Le leggerà dal file .env)
-    OPENAI_API_KEY: str
-    TAVILY_API_KEY: str
+    # Facoltative all'avvio: servono solo ad agenti, embedding OpenAI e ricerca web (vedi require),
+    # così forecast, indicizzatore locale e CLI funzionano anche senza
+    OPENAI_API_KEY: Optional[str] = None
+    TAVILY_API_KEY: Optional[str] = None
 
     # RAG (Repo-based)
     RAG_PERSIST_DIR: str = "./app/data/.rag/chroma"
     RAG_COLLECTION_NAME: str = "internal_repo"
     RAG_TOP_K: int = 4
     RAG_REPO_ROOT: str = "."
+    # Vector store: "chroma" oppure "flat" (matrice float32 memory-mapped, top-k esatto con NumPy;
+    # caricamento istantaneo e memoria condivisa tra worker, adatto a poche migliaia di chunk)
+    RAG_VECTOR_BACKEND: str = "chroma"
+    # Cache dei risultati del retrieval (query normalizzata, k, versione dell'indice)
+    RAG_QUERY_CACHE_SIZE: int = 256
+    RAG_QUERY_CACHE_TTL_SECONDS: int = 600
+    # Retrieval ibrido: BM25 + vettori fusi con Reciprocal Rank Fusion
+    RAG_HYBRID_ENABLED: bool = True
+    RAG_HYBRID_CANDIDATES: int = 20
+    RAG_RRF_K: int = 60
+    # Percorso solo lessicale (niente embedding della query) se il primo risultato BM25 copre
+    # almeno questa frazione della query (pesata per IDF) e contiene un termine raro (df <= MAX_DF)
+    RAG_LEXICAL_MIN_COVERAGE: float = 0.8
+    RAG_LEXICAL_MAX_DF: float = 0.05
+    # Deduplicazione dei chunk in indicizzazione: oltre ai duplicati esatti, unisce i chunk di pagine
+    # diverse che differiscono per i soli marcatori di pagina (False = solo duplicati esatti)
+    RAG_DEDUP_NEAR: bool = True
+    # Intestazioni e piè di pagina: righe ai bordi ripetute su almeno questa frazione delle pagine
+    # di un file, tolte prima dello splitting (None = nessuna rimozione)
+    RAG_DEDUP_REPEATED_LINES: Optional[float] = 0.5
+
+    # Embedding: "openai" oppure "local" (hashing deterministico, per benchmark/sviluppo offline)
+    EMBEDDING_BACKEND: str = "openai"
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_LOCAL_DIM: int = 384
+    # Cache su disco dei vettori, chiave (modello, hash del testo): condivisa da indicizzazione e retrieval
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "./app/data/.cache/embeddings.sqlite"
+    # Limite di vettori in cache (None = illimitata): oltre si eliminano quelli usati meno di recente
+    EMBEDDING_CACHE_MAX_ENTRIES: Optional[int] = 100_000
+    # Testi per chiamata al backend e chiamate contemporanee durante l'indicizzazione
+    EMBEDDING_BATCH_SIZE: int = 128
+    EMBEDDING_MAX_CONCURRENCY: int = 4
+
+    # Agenti: pool di connessioni HTTP condiviso (OpenAI, Tavily) dal motore unico dell'applicazione
+    HTTP_MAX_CONNECTIONS: int = 32
+    HTTP_MAX_KEEPALIVE: int = 16
+    HTTP_TIMEOUT_SECONDS: float = 120.0
+    # Cache su disco delle risposte LLM per nodo, chiave (configurazione del modello, hash del prompt):
+    # con temperature=0 un rerun con gli stessi input torna in millisecondi senza consumare token
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_NODES: str = "analyst,internal_researcher,researcher,director"
+    LLM_CACHE_PATH: str = "./app/data/.cache/llm.sqlite"
+    LLM_CACHE_MAX_ENTRIES: int = 5000
+    LLM_CACHE_TTL_SECONDS: Optional[int] = 7 * 24 * 3600
+    # Ricerca web del ricercatore: "tavily" oppure "local" (nessuna chiamata esterna)
+    WEB_SEARCH_PROVIDER: str = "tavily"
+    WEB_SEARCH_MAX_RESULTS: int = 5
+    # Risultati per query tenuti in memoria: le news non cambiano di minuto in minuto
+    WEB_SEARCH_CACHE_SIZE: int = 256
+    WEB_SEARCH_CACHE_TTL_SECONDS: int = 1800
+
+    # Dataset commesse: CSV di default, sostituito dall'ultimo upload attivo se presente
+    DATA_PATH: str = "app/data/storico_commesse.csv"
+    # Upload versionati (Parquet partizionato, una cartella per hash del contenuto)
+    DATASET_STORE_DIR: str = "./app/data/datasets"
+    DATASET_KEEP_VERSIONS: int = 3
+    # Righe per blocco in ingestione: limita la memoria anche per export ERP da centinaia di MB
+    INGEST_CHUNK_ROWS: int = 100_000
+    # Backend dello storico: "memory" (DataFrame in memoria) o "columnar" (row group Parquet su richiesta)
+    HISTORY_BACKEND: str = "memory"
+    HISTORY_ROW_GROUP_ROWS: int = 8192
+    # Serie per cliente tenute in cache dal backend colonnare
+    HISTORY_CACHE_CLIENTS: int = 256
+
+    # Forecasting (cache dei modelli Prophet addestrati)
+    FORECAST_CACHE_DIR: str = "./app/data/.cache/models"
+    FORECAST_CACHE_SIZE: int = 64
+    # Processi per i forecast batch (None = numero di core disponibili)
+    FORECAST_MAX_WORKERS: Optional[int] = None
+    # Refit incrementali: warm start di Stan dal modello addestrato sulla versione precedente dei dati
+    FORECAST_WARM_START: bool = False
+    # Risultati delle fold di backtesting (riusati tra un run e l'altro)
+    BACKTEST_CACHE_DIR: str = "./app/data/.cache/backtests"
+
+    # Forecast materializzati (precalcolati in background e serviti da /forecast)
+    FORECAST_STORE_DIR: str = "./app/data/.cache/forecast_store"
+    FORECAST_STORE_MAX_AGE_SECONDS: int = 24 * 3600
+    FORECAST_STORE_MONTHS: int = 12
+    FORECAST_STORE_ENGINE: str = "prophet"
+    FORECAST_PRECOMPUTE_ENABLED: bool = True   # False se gira il worker separato
+    FORECAST_REFRESH_INTERVAL_SECONDS: int = 6 * 3600
+    FORECAST_REFRESH_POLL_SECONDS: int = 30
+
+    # Scenari what-if: campioni predittivi tenuti in memoria (LRU) per cliente/motore/orizzonte
+    SCENARIO_CACHE_SIZE: int = 128
+    # Numero di campioni generati per i motori NumPy (Prophet usa uncertainty_samples)
+    SCENARIO_SAMPLES: int = 1000
 
     model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True)
 
+    def require(self, name: str) -> str:
+        """Valore di una chiave API, con errore esplicito se manca (chiamato da chi la usa davvero)"""
+        value = getattr(self, name)
+        if not value:
+            raise RuntimeError(f"{name} non configurata: impostala nel file .env o nell'ambiente")
+        return value
+
 settings = Settings()
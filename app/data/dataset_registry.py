@@ -0,0 +1,172 @@
+import os
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+
+if TYPE_CHECKING:  # pyarrow si importa solo con il backend colonnare
+    from app.data.history_store import ColumnarSnapshot
+
+
+@dataclass
+class DatasetSnapshot:
+    """
+    Vista immutabile di una versione del dataset commesse.
+    Le serie sono già raggruppate per cliente: l'accesso è un lookup su dizionario.
+    """
+    path: str
+    version: str
+    raw_df: pd.DataFrame
+    series: Dict[str, Tuple[np.ndarray, np.ndarray]]  # cliente -> (ds, y)
+    series_hashes: Dict[str, str]                      # cliente -> hash delle sue righe
+    clients: List[str]
+    sectors: Dict[str, str]                            # cliente -> settore
+    loaded_at: float = 0.0
+
+    def read_series(self, client: str, start=None, end=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Serie (ds, y) del cliente, eventualmente limitata a [start, end]. KeyError se assente."""
+        ds, y = self.series[client]
+        if start is None and end is None:
+            return ds, y
+        mask = np.ones(len(ds), dtype=bool)
+        if start is not None:
+            mask &= ds >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            mask &= ds <= np.datetime64(pd.Timestamp(end))
+        return ds[mask], y[mask]
+
+    def client_frame(self, client_name: str, start=None, end=None) -> pd.DataFrame:
+        """Serie del cliente nel formato Prophet (ds, y). Solleva KeyError se assente."""
+        ds, y = self.read_series(client_name, start, end)
+        return pd.DataFrame({"ds": ds, "y": y})
+
+    def iter_series(self, clients: Optional[List[str]] = None) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+        for client in (self.clients if clients is None else clients):
+            if client in self.series:
+                ds, y = self.series[client]
+                yield client, ds, y
+
+
+# Entrambi i backend espongono version, clients, sectors, series_hashes, read_series, client_frame, iter_series
+Snapshot = Union[DatasetSnapshot, "ColumnarSnapshot"]
+
+
+def _file_version(path: str) -> str:
+    if os.path.isdir(path):
+        # Versioni Parquet caricate via ingestione: immutabili, il nome è l'hash del contenuto
+        return os.path.basename(os.path.normpath(path))
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def _read_dataset(path: str) -> pd.DataFrame:
+    """CSV originale oppure cartella Parquet prodotta da app.data.ingestion"""
+    if os.path.isdir(path):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def load_snapshot(path: str) -> DatasetSnapshot:
+    """Legge il dataset una volta e precalcola serie, hash, clienti e settori"""
+    version = _file_version(path)
+    raw_df = _read_dataset(path)
+
+    ds_all = pd.to_datetime(raw_df["data_commessa"]).to_numpy()
+    y_all = raw_df["fatturato"].to_numpy(dtype="float64")
+
+    # Hash per riga calcolato una volta sola su tutto il frame (vettoriale)
+    row_hashes = pd.util.hash_pandas_object(
+        pd.DataFrame({"ds": ds_all, "y": y_all}), index=False
+    ).to_numpy()
+
+    series: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    series_hashes: Dict[str, str] = {}
+    # groupby(...).indices restituisce le posizioni di ogni gruppo nell'ordine del file
+    for client, idx in raw_df.groupby("cliente", sort=False).indices.items():
+        series[client] = (ds_all[idx], y_all[idx])
+        series_hashes[client] = hashlib.sha256(row_hashes[idx].tobytes()).hexdigest()
+
+    clients = raw_df["cliente"].drop_duplicates().tolist()
+    sectors: Dict[str, str] = {}
+    if "settore" in raw_df.columns:
+        first_rows = raw_df.drop_duplicates("cliente")
+        sectors = dict(zip(first_rows["cliente"], first_rows["settore"]))
+
+    return DatasetSnapshot(
+        path=path,
+        version=version,
+        raw_df=raw_df,
+        series=series,
+        series_hashes=series_hashes,
+        clients=clients,
+        sectors=sectors,
+        loaded_at=pd.Timestamp.now().timestamp(),
+    )
+
+
+def open_snapshot(path: str, backend: Optional[str] = None) -> Snapshot:
+    """
+    backend "memory": tutto il dataset in un DataFrame (veloce, memoria proporzionale alle righe).
+    backend "columnar": solo l'indice in memoria, serie lette dai row group Parquet su richiesta.
+    Con il backend colonnare un CSV viene prima convertito in una versione Parquet (non attivata).
+    """
+    backend = backend or settings.HISTORY_BACKEND
+    if backend == "memory":
+        return load_snapshot(path)
+    if backend != "columnar":
+        raise ValueError(f"Backend dello storico sconosciuto: {backend}")
+
+    from app.data.history_store import ColumnarSnapshot
+    if not os.path.isdir(path):
+        # Import locale: ingestion dipende da history_store, non dal registry
+        from app.data.ingestion import ingest_csv
+        with open(path, "rb") as f:
+            manifest = ingest_csv(f, os.path.basename(path), activate=False)
+        path = os.path.join(settings.DATASET_STORE_DIR, manifest["version"])
+    return ColumnarSnapshot(path, _file_version(path))
+
+
+class DatasetRegistry:
+    """
+    Registro dei dataset condiviso a livello di processo.
+    Ogni file viene letto una sola volta e ricaricato solo quando cambia
+    (mtime/dimensione) oppure dopo un invalidate() esplicito.
+    Il backend (memoria o colonnare) è scelto da settings.HISTORY_BACKEND.
+    """
+
+    def __init__(self):
+        self._snapshots: Dict[str, Tuple[Snapshot, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Snapshot:
+        key = os.path.abspath(path)
+        version = _file_version(key)
+
+        snapshot, loaded_version = self._snapshots.get(key, (None, None))
+        if snapshot is not None and loaded_version == version:
+            return snapshot
+
+        with self._lock:
+            # Double-check: un altro thread potrebbe averlo già ricaricato
+            snapshot, loaded_version = self._snapshots.get(key, (None, None))
+            if snapshot is None or loaded_version != version:
+                snapshot = open_snapshot(key)
+                # La versione è quella del path richiesto (un CSV convertito ha la versione del Parquet)
+                self._snapshots[key] = (snapshot, version)
+            return snapshot
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        with self._lock:
+            if path is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(os.path.abspath(path), None)
+
+
+# Istanza condivisa a livello di processo
+dataset_registry = DatasetRegistry()
@@ -0,0 +1,138 @@
+"""
+Deduplicazione del testo prima dell'embedding.
+
+I PDF ripetono intestazioni, piè di pagina e numeri di pagina su ogni pagina. Dentro un chunk
+che contiene anche altro testo queste righe non si possono più togliere, quindi:
+- Righe ripetute: prima dello splitting, le righe ai bordi della pagina (le prime e le ultime
+  EDGE_LINES non vuote) che si ripetono, a meno del numero di pagina, su gran parte delle pagine
+  dello stesso file vengono tolte da tutte le pagine tranne la prima che le contiene.
+- Duplicati esatti: stesso testo normalizzato (minuscole, spazi compattati) -> stesso ID.
+- Quasi-duplicati: stesso testo normalizzato una volta tolti i marcatori di pagina ("Pagina 3 di 10",
+  "pag. 4", una riga con il solo numero). Basta una mappa skeleton_hash -> ID: ogni altra differenza,
+  anche solo un importo o un cliente in due clausole dello stesso modello, è contenuto e il chunk
+  viene embeddato. I quasi-duplicati si cercano solo tra pagine diverse: nella stessa pagina chunk
+  simili sono voci di elenco o clausole parallele (con l'overlap dello splitter), non testo ripetuto.
+Ogni duplicato viene ricondotto al chunk canonico (il primo visto): viene embeddato una volta sola
+e tutte le sue fonti restano nel manifest dell'indice.
+"""
+import re
+import hashlib
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+# Marcatori di pagina: "Pagina 3 di 10", "pag. 3", "page 3 of 10", "p. 3" oppure una riga con il solo numero ("- 3 -", "3/10")
+_PAGE_MARKER_RE = re.compile(r"\b(?:pagina|pag|page|p)\.?\s*\d+(?:\s*(?:di|of|/)\s*\d+)?\b", re.IGNORECASE)
+_PAGE_LINE_RE = re.compile(r"^[ \t\-–]*\d{1,4}(?:\s*(?:di|of|/)\s*\d{1,4})?[ \t\-–]*$", re.MULTILINE | re.IGNORECASE)
+
+# Righe per bordo (inizio e fine pagina) in cui si cercano intestazioni e piè di pagina
+EDGE_LINES = 3
+
+
+def normalize_chunk(text: str) -> str:
+    return _SPACE_RE.sub(" ", text).strip().lower()
+
+
+def content_id(text: str) -> str:
+    """ID del chunk dal contenuto normalizzato: i duplicati esatti hanno lo stesso ID"""
+    return hashlib.sha1(normalize_chunk(text).encode("utf-8")).hexdigest()
+
+
+def _skeleton(text: str) -> str:
+    return normalize_chunk(_PAGE_MARKER_RE.sub("#", _PAGE_LINE_RE.sub("#", text)))
+
+
+def skeleton_hash(text: str) -> str:
+    """Hash del testo normalizzato senza marcatori e numeri di pagina: i quasi-duplicati uniti lo hanno uguale"""
+    return hashlib.sha1(_skeleton(text).encode("utf-8")).hexdigest()[:16]
+
+
+def strip_repeated_lines(pages: List[str], min_share: float = 0.5, min_pages: int = 3) -> Tuple[List[str], int]:
+    """
+    Toglie intestazioni e piè di pagina dalle pagine di un file: righe ai bordi che si ripetono
+    (a meno del numero di pagina) su almeno min_share delle pagine e su almeno min_pages pagine.
+    Restano solo sulla prima pagina che le contiene. Restituisce (pagine, righe tolte).
+    """
+    split = [page.splitlines() for page in pages]
+    edges: List[Dict[int, str]] = []
+    counts: Counter = Counter()
+    for lines in split:
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        keys = {i: _skeleton(lines[i]) for i in filled[:EDGE_LINES] + filled[-EDGE_LINES:]}
+        edges.append(keys)
+        counts.update(set(keys.values()))
+
+    threshold = max(min_pages, min_share * len(pages))
+    repeated = {key for key, n in counts.items() if n >= threshold}
+    if not repeated:
+        return list(pages), 0
+
+    seen = set()
+    out, removed = [], 0
+    for page, lines, keys in zip(pages, split, edges):
+        drop = {i for i, key in keys.items() if key in repeated and key in seen}
+        seen.update(key for key in keys.values() if key in repeated)
+        if drop:
+            page = "\n".join(line for i, line in enumerate(lines) if i not in drop).strip()
+            removed += len(drop)
+        out.append(page)
+    return out, removed
+
+
+class ChunkDeduplicator:
+    """
+    Registro dei chunk canonici dell'indice (ID -> skeleton hash), persistito nel manifest
+    così che anche le indicizzazioni incrementali riconoscano i duplicati dei chunk già presenti.
+    near=False: solo duplicati esatti.
+    """
+
+    def __init__(self, known: Optional[Dict[str, str]] = None, near: bool = True, min_words: int = 8):
+        self.near = near
+        # Chunk molto corti (una sigla, un titolo): solo deduplicazione esatta
+        self.min_words = min_words
+        self.skeletons: Dict[str, Optional[str]] = {}
+        self._by_skeleton: Dict[str, List[str]] = defaultdict(list)
+        # Pagina/file da cui proviene il chunk canonico (solo per quelli registrati in questo run)
+        self._scopes: Dict[str, str] = {}
+        # Quasi-duplicati già risolti: le loro copie esatte non ripetono la ricerca
+        self._aliases: Dict[str, str] = {}
+        for chunk_id, skeleton in (known or {}).items():
+            self._register(chunk_id, skeleton or None)
+
+    def _register(self, chunk_id: str, skeleton: Optional[str]) -> None:
+        self.skeletons[chunk_id] = skeleton
+        if skeleton is not None:
+            self._by_skeleton[skeleton].append(chunk_id)
+
+    def _near(self, skeleton: str, scope: Optional[str]) -> Optional[str]:
+        for candidate in self._by_skeleton.get(skeleton, ()):
+            if scope is None or self._scopes.get(candidate) != scope:
+                return candidate
+        return None
+
+    def resolve(self, text: str, scope: Optional[str] = None) -> Tuple[str, str]:
+        """
+        (ID canonico, tipo): "new" se il chunk va embeddato (e viene registrato),
+        "exact" o "near" se è un duplicato di un chunk già registrato.
+        scope: pagina/file del chunk; i quasi-duplicati nella stessa scope non vengono uniti.
+        """
+        chunk_id = content_id(text)
+        if chunk_id in self.skeletons:
+            return chunk_id, "exact"
+        if chunk_id in self._aliases:
+            return self._aliases[chunk_id], "exact"
+        skeleton = skeleton_hash(text) if len(_WORD_RE.findall(text)) >= self.min_words else None
+        if self.near and skeleton is not None:
+            match = self._near(skeleton, scope)
+            if match is not None:
+                self._aliases[chunk_id] = match
+                return match, "near"
+        self._register(chunk_id, skeleton)
+        if scope is not None:
+            self._scopes[chunk_id] = scope
+        return chunk_id, "new"
+
+    def export(self, chunk_ids: Iterable[str]) -> Dict[str, str]:
+        """Mappa ID -> skeleton hash dei chunk indicati, da salvare nel manifest"""
+        return {c: self.skeletons.get(c) or "" for c in chunk_ids}
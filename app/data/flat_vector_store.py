@@ -0,0 +1,212 @@
+"""
+Vector store "piatto" in-process: alternativa leggera a Chroma per corpus piccoli (migliaia di chunk).
+
+Layout su disco (una cartella per collection):
+    index.json              -> generazione attiva, dimensione, ID/testi/metadata dei chunk
+    vectors-<gen>.f32       -> matrice float32 (n_chunk × dim), righe già normalizzate L2
+
+La matrice viene aperta con np.memmap in sola lettura: l'apertura è istantanea e le pagine
+stanno nella page cache del sistema operativo, condivise tra tutti i worker che leggono lo stesso file.
+La ricerca è esatta (similarità coseno = prodotto scalare tra vettori normalizzati) con un solo matmul.
+Ogni scrittura produce una nuova generazione e sostituisce index.json in modo atomico:
+chi sta leggendo la generazione precedente continua a vederla coerente.
+"""
+import os
+import glob
+import json
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+INDEX_FILE = "index.json"
+
+
+class FlatVectorStore(VectorStore):
+    """VectorStore LangChain con top-k coseno esatto su una matrice memory-mapped"""
+
+    def __init__(self, persist_dir: str, embedding_function: Embeddings):
+        self.persist_dir = persist_dir
+        self._embedding = embedding_function
+        self._lock = threading.Lock()
+        self._index_mtime: Optional[int] = None
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    # --- Persistenza ---
+    def _index_path(self) -> str:
+        return os.path.join(self.persist_dir, INDEX_FILE)
+
+    def _read_index(self) -> Tuple[Optional[int], Dict[str, Any], np.ndarray]:
+        path = self._index_path()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with open(path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except OSError:
+            mtime, index = None, {"generation": None, "dim": 0, "ids": [], "texts": [], "metadatas": []}
+        if not index["ids"]:
+            return mtime, index, np.zeros((0, index["dim"]), dtype="float32")
+        matrix = np.memmap(os.path.join(self.persist_dir, f"vectors-{index['generation']}.f32"),
+                           dtype="float32", mode="r", shape=(len(index["ids"]), index["dim"]))
+        return mtime, index, matrix
+
+    def _load(self) -> None:
+        """Apre la generazione indicata da index.json (collection vuota se non esiste)"""
+        for attempt in range(3):
+            try:
+                mtime, index, matrix = self._read_index()
+                break
+            except FileNotFoundError:
+                # Generazione sostituita e rimossa tra la lettura di index.json e l'apertura: si riprova
+                if attempt == 2:
+                    raise
+        ids = index["ids"]
+
+        with self._lock:
+            self._ids: List[str] = ids
+            self._texts: List[str] = index["texts"]
+            self._metadatas: List[Dict[str, Any]] = index["metadatas"]
+            self._matrix = matrix
+            self._index_mtime = mtime
+
+    def refresh(self) -> bool:
+        """Riapre l'indice se un altro processo ha pubblicato una nuova generazione"""
+        try:
+            mtime = os.stat(self._index_path()).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._index_mtime:
+            return False
+        self._load()
+        return True
+
+    def _write(self, ids: List[str], texts: List[str], metadatas: List[Dict], matrix: np.ndarray) -> None:
+        os.makedirs(self.persist_dir, exist_ok=True)
+        generation = uuid.uuid4().hex[:12]
+        vectors_path = os.path.join(self.persist_dir, f"vectors-{generation}.f32")
+        np.ascontiguousarray(matrix, dtype="float32").tofile(vectors_path)
+
+        tmp_path = os.path.join(self.persist_dir, f"{INDEX_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "dim": int(matrix.shape[1]) if matrix.size else 0,
+                       "ids": ids, "texts": texts, "metadatas": metadatas}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path())
+
+        # Le generazioni vecchie possono essere rimosse: i processi che le hanno in memmap
+        # mantengono il file aperto finché non ricaricano
+        for old in glob.glob(os.path.join(self.persist_dir, "vectors-*.f32")):
+            if old != vectors_path:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        self._load()
+
+    # --- Scrittura (usata dall'indicizzatore) ---
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        vectors = np.asarray(self._embedding.embed_documents(texts), dtype="float32")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1.0)
+
+        replaced = set(ids)
+        with self._lock:
+            keep = [i for i, chunk_id in enumerate(self._ids) if chunk_id not in replaced]
+            matrix = np.vstack([np.asarray(self._matrix[keep]), vectors]) if len(self._ids) else vectors
+            all_ids = [self._ids[i] for i in keep] + ids
+            all_texts = [self._texts[i] for i in keep] + texts
+            all_metadatas = [self._metadatas[i] for i in keep] + [dict(m or {}) for m in metadatas]
+        self._write(all_ids, all_texts, all_metadatas, matrix)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        drop = set(ids)
+        with self._lock:
+            keep = [i for i, chunk_id in enumerate(self._ids) if chunk_id not in drop]
+            if len(keep) == len(self._ids):
+                return False
+            matrix = np.asarray(self._matrix[keep])
+            args = ([self._ids[i] for i in keep], [self._texts[i] for i in keep],
+                    [self._metadatas[i] for i in keep], matrix)
+        self._write(*args)
+        return True
+
+    def delete_collection(self) -> None:
+        self._write([], [], [], np.zeros((0, 0), dtype="float32"))
+
+    def get(self, include: Optional[List[str]] = None, **kwargs: Any) -> Dict[str, List]:
+        """Stesso formato di Chroma.get (ids, documents, metadatas)"""
+        with self._lock:
+            return {"ids": list(self._ids), "documents": list(self._texts), "metadatas": list(self._metadatas)}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # --- Ricerca ---
+    def _top_k(self, query_vector: List[float], k: int) -> List[Tuple[Document, float]]:
+        # Stato letto una volta: un refresh concorrente non mescola due generazioni
+        with self._lock:
+            ids, texts, metadatas, matrix = self._ids, self._texts, self._metadatas, self._matrix
+        n = matrix.shape[0]
+        if n == 0:
+            return []
+        q = np.asarray(query_vector, dtype="float32")
+        norm = float(np.linalg.norm(q))
+        if norm > 0:
+            q = q / norm
+        scores = matrix @ q
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(Document(id=ids[i], page_content=texts[i], metadata=dict(metadatas[i])), float(scores[i]))
+                for i in top]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self._top_k(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Punteggio = similarità coseno (più alto = più simile)"""
+        return self._top_k(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # Coseno in [-1, 1] -> rilevanza in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[Dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        persist_dir: str = "./flat_index",
+        **kwargs: Any,
+    ) -> "FlatVectorStore":
+        store = cls(persist_dir, embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
@@ -0,0 +1,271 @@
+"""
+Backend colonnare dello storico commesse (Parquet) con lettura per cliente.
+
+Invece di tenere tutto il dataset in un DataFrame per processo, si tiene in memoria solo
+un indice (cliente -> row group che lo contengono, settore, hash della serie) e si leggono
+dal disco i soli row group necessari. Anche l'intervallo di date viene spinto sui row group
+tramite le statistiche min/max di data_commessa: i blocchi fuori intervallo non vengono letti.
+
+L'indice è un file sidecar nella cartella della versione, costruito una volta sola
+(durante l'ingestione, o alla prima apertura) con una passata in streaming.
+La memoria residente dipende quindi dal numero di clienti e dalla cache LRU delle serie,
+non dal numero di righe del dataset.
+"""
+import os
+import glob
+import json
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from app.core.config import settings
+
+INDEX_FILE = "_history_index.json"
+COLUMNS = ["data_commessa", "cliente", "fatturato"]
+
+
+def _part_files(version_dir: str) -> List[str]:
+    return sorted(os.path.basename(p) for p in glob.glob(os.path.join(version_dir, "part-*.parquet")))
+
+
+def _row_hashes(ds: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Stesso hash per riga usato da load_snapshot: gli hash delle serie coincidono tra i backend"""
+    return pd.util.hash_pandas_object(pd.DataFrame({"ds": ds, "y": y}), index=False).to_numpy()
+
+
+def build_history_index(version_dir: str) -> Dict:
+    """
+    Una passata in streaming, un row group alla volta: posizione di ogni cliente,
+    settore, hash della serie e intervallo di date. Scrive il sidecar e lo restituisce.
+    """
+    parts = _part_files(version_dir)
+    row_groups: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    digests: Dict[str, "hashlib._Hash"] = {}
+    sectors: Dict[str, str] = {}
+    clients: List[str] = []
+    rows = 0
+    min_ds, max_ds = None, None
+
+    for part_idx, part in enumerate(parts):
+        pf = pq.ParquetFile(os.path.join(version_dir, part))
+        for rg in range(pf.num_row_groups):
+            table = pf.read_row_group(rg, columns=COLUMNS + ["settore"])
+            df = table.to_pandas()
+            ds_all = df["data_commessa"].to_numpy(dtype="datetime64[ns]")
+            y_all = df["fatturato"].to_numpy(dtype="float64")
+            hashes = _row_hashes(ds_all, y_all)
+            rows += len(df)
+            if len(df):
+                lo, hi = ds_all.min(), ds_all.max()
+                min_ds = lo if min_ds is None else min(min_ds, lo)
+                max_ds = hi if max_ds is None else max(max_ds, hi)
+
+            for client, idx in df.groupby("cliente", sort=False).indices.items():
+                if client not in digests:
+                    digests[client] = hashlib.sha256()
+                    clients.append(client)
+                    sectors[client] = df["settore"].iloc[idx[0]]
+                digests[client].update(hashes[idx].tobytes())
+                row_groups[client].append((part_idx, rg))
+
+    index = {
+        "parts": parts,
+        "rows": rows,
+        "clients": clients,
+        "sectors": sectors,
+        "series_hashes": {c: d.hexdigest() for c, d in digests.items()},
+        "row_groups": row_groups,
+        "min_ds": str(pd.Timestamp(min_ds)) if min_ds is not None else None,
+        "max_ds": str(pd.Timestamp(max_ds)) if max_ds is not None else None,
+    }
+    tmp_path = os.path.join(version_dir, f"{INDEX_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, os.path.join(version_dir, INDEX_FILE))
+    return index
+
+
+def load_history_index(version_dir: str) -> Dict:
+    path = os.path.join(version_dir, INDEX_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return build_history_index(version_dir)
+
+
+class _LazySeries:
+    """Mapping cliente -> (ds, y) letto dal disco su richiesta, con cache LRU"""
+
+    def __init__(self, snapshot: "ColumnarSnapshot"):
+        self._snapshot = snapshot
+
+    def __getitem__(self, client: str) -> Tuple[np.ndarray, np.ndarray]:
+        return self._snapshot.read_series(client)
+
+    def __contains__(self, client: str) -> bool:
+        return client in self._snapshot.row_groups
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._snapshot.clients)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.clients)
+
+    def get(self, client: str, default=None):
+        return self[client] if client in self else default
+
+
+class ColumnarSnapshot:
+    """
+    Stessa interfaccia di DatasetSnapshot (version, series, series_hashes, clients, sectors,
+    client_frame), ma le serie vengono lette dai row group Parquet solo quando servono.
+    """
+
+    def __init__(self, version_dir: str, version: str, cache_size: Optional[int] = None):
+        self.path = version_dir
+        self.version = version
+        index = load_history_index(version_dir)
+        self.parts: List[str] = index["parts"]
+        self.clients: List[str] = index["clients"]
+        self.sectors: Dict[str, str] = index["sectors"]
+        self.series_hashes: Dict[str, str] = index["series_hashes"]
+        self.row_groups: Dict[str, List[Tuple[int, int]]] = {
+            c: [tuple(rg) for rg in rgs] for c, rgs in index["row_groups"].items()
+        }
+        self.rows: int = index["rows"]
+        self.loaded_at = pd.Timestamp.now().timestamp()
+        self.series = _LazySeries(self)
+
+        self._cache_size = cache_size or settings.HISTORY_CACHE_CLIENTS
+        self._cache: "OrderedDict[str, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._footers: Dict[int, pq.FileMetaData] = {}
+        # Protegge solo la cache delle serie e dei footer: le letture dal disco avvengono fuori dal lock
+        self._lock = threading.Lock()
+
+    # --- Lettura dei row group ---
+    def _open(self, part_idx: int) -> pq.ParquetFile:
+        """
+        Un ParquetFile per lettura (un handle condiviso non è thread-safe), ma il footer
+        (metadata e statistiche) viene letto una volta per file e riusato.
+        """
+        with self._lock:
+            footer = self._footers.get(part_idx)
+        pf = pq.ParquetFile(os.path.join(self.path, self.parts[part_idx]), metadata=footer)
+        if footer is None:
+            with self._lock:
+                self._footers.setdefault(part_idx, pf.metadata)
+        return pf
+
+    def _by_part(self, groups: Iterable[Tuple[int, int]]) -> Iterator[Tuple[pq.ParquetFile, List[int]]]:
+        """Row group raggruppati per file: ogni file viene aperto una volta per lettura"""
+        by_part: Dict[int, List[int]] = defaultdict(list)
+        for part_idx, rg in sorted(groups):
+            by_part[part_idx].append(rg)
+        for part_idx, rgs in by_part.items():
+            with self._open(part_idx) as pf:
+                yield pf, rgs
+
+    def _overlaps(self, pf: pq.ParquetFile, rg: int, start, end) -> bool:
+        """Pushdown dell'intervallo di date sulle statistiche min/max del row group"""
+        if start is None and end is None:
+            return True
+        col = pf.schema_arrow.get_field_index("data_commessa")
+        stats = pf.metadata.row_group(rg).column(col).statistics
+        if stats is None or not stats.has_min_max:
+            return True
+        lo, hi = pd.Timestamp(stats.min), pd.Timestamp(stats.max)
+        return not ((start is not None and hi < start) or (end is not None and lo > end))
+
+    def _read_groups(self, groups: Iterable[Tuple[int, int]], clients: List[str], start=None, end=None) -> pa.Table:
+        tables = []
+        wanted = pa.array(clients, type=pa.string())
+        for pf, rgs in self._by_part(groups):
+            for rg in rgs:
+                if not self._overlaps(pf, rg, start, end):
+                    continue
+                table = pf.read_row_group(rg, columns=COLUMNS)
+                tables.append(table.filter(pc.is_in(table["cliente"], value_set=wanted)))
+        if not tables:
+            return pa.table({c: pa.array([], type=t) for c, t in
+                             (("data_commessa", pa.timestamp("ns")), ("cliente", pa.string()), ("fatturato", pa.float64()))})
+        return pa.concat_tables(tables)
+
+    @staticmethod
+    def _to_arrays(table: pa.Table) -> Tuple[np.ndarray, np.ndarray]:
+        ds = table["data_commessa"].to_numpy().astype("datetime64[ns]")
+        y = table["fatturato"].to_numpy().astype("float64")
+        return ds, y
+
+    @staticmethod
+    def _filter_dates(ds: np.ndarray, y: np.ndarray, start, end) -> Tuple[np.ndarray, np.ndarray]:
+        mask = np.ones(len(ds), dtype=bool)
+        if start is not None:
+            mask &= ds >= np.datetime64(start)
+        if end is not None:
+            mask &= ds <= np.datetime64(end)
+        return ds[mask], y[mask]
+
+    # --- API ---
+    def read_series(self, client: str, start=None, end=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Serie (ds, y) del cliente. Solleva KeyError se il cliente non esiste."""
+        groups = self.row_groups[client]
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+
+        if start is None and end is None:
+            with self._lock:
+                cached = self._cache.get(client)
+                if cached is not None:
+                    self._cache.move_to_end(client)
+                    return cached
+
+        # Lettura fuori dal lock: più richieste leggono clienti diversi in parallelo
+        ds, y = self._to_arrays(self._read_groups(groups, [client], start, end))
+        if start is not None or end is not None:
+            return self._filter_dates(ds, y, start, end)
+
+        with self._lock:
+            self._cache[client] = (ds, y)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return ds, y
+
+    def client_frame(self, client_name: str, start=None, end=None) -> pd.DataFrame:
+        """Serie del cliente nel formato Prophet (ds, y). Solleva KeyError se assente."""
+        ds, y = self.read_series(client_name, start, end)
+        return pd.DataFrame({"ds": ds, "y": y})
+
+    def iter_series(self, clients: Optional[List[str]] = None) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+        """
+        Serie di molti clienti leggendo ogni row group una sola volta
+        (i clienti piccoli condividono lo stesso row group).
+        """
+        clients = self.clients if clients is None else [c for c in clients if c in self.row_groups]
+        wanted = set(clients)
+        groups = sorted({g for c in clients for g in self.row_groups[c]})
+
+        collected: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = defaultdict(list)
+        for pf, rgs in self._by_part(groups):
+            for rg in rgs:
+                df = pf.read_row_group(rg, columns=COLUMNS).to_pandas()
+                ds_all = df["data_commessa"].to_numpy(dtype="datetime64[ns]")
+                y_all = df["fatturato"].to_numpy(dtype="float64")
+                for client, idx in df.groupby("cliente", sort=False).indices.items():
+                    if client in wanted:
+                        collected[client].append((ds_all[idx], y_all[idx]))
+
+        for client in clients:
+            pieces = collected.get(client, [])
+            yield client, np.concatenate([p[0] for p in pieces]), np.concatenate([p[1] for p in pieces])
+
+    @property
+    def raw_df(self) -> pd.DataFrame:
+        """Intero dataset in memoria: solo per compatibilità, annulla i vantaggi del backend"""
+        return pd.read_parquet(self.path)
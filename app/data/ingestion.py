@@ -0,0 +1,260 @@
+"""
+Ingestione in streaming dei CSV caricati dagli utenti (export ERP).
+
+Il CSV viene letto a blocchi di righe (memoria limitata anche per file da centinaia di MB),
+validato e scritto come dataset Parquet partizionato in una cartella di staging.
+A fine lettura la cartella prende il nome dell'hash del contenuto (versione immutabile)
+e il puntatore CURRENT viene sostituito in modo atomico: da quel momento ForecastingService
+usa i nuovi dati, mentre le richieste in corso continuano sulla versione precedente.
+
+Layout su disco:
+    <DATASET_STORE_DIR>/
+        CURRENT                     -> id della versione attiva
+        <hash>/part-00000.parquet   -> un file per blocco, righe ordinate per cliente e data
+        <hash>/_manifest.json
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import uuid
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.core.config import settings
+
+REQUIRED_COLUMNS = ["data_commessa", "cliente", "settore", "fatturato"]
+CURRENT_POINTER = "CURRENT"
+# Prefisso "_": i lettori Parquet ignorano il file quando leggono la cartella
+MANIFEST = "_manifest.json"
+
+
+class IngestionError(ValueError):
+    """CSV non valido (colonne mancanti, nessuna riga utilizzabile, tipi incoerenti)"""
+
+
+class _HashingReader:
+    """File-like che calcola lo sha256 dei byte letti mentre pandas li consuma"""
+
+    def __init__(self, raw: BinaryIO):
+        self._raw = raw
+        self.digest = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._raw.read(size)
+        self.digest.update(chunk)
+        self.bytes_read += len(chunk)
+        return chunk
+
+    def readable(self) -> bool:
+        return True
+
+    def __iter__(self):
+        # pandas riconosce un file-like dalla presenza di read e __iter__
+        for line in self._raw:
+            self.digest.update(line)
+            self.bytes_read += len(line)
+            yield line
+
+
+def _normalize_chunk(chunk: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+    """Tipi coerenti tra i blocchi; scarta le righe senza data, cliente o fatturato validi"""
+    chunk = chunk.copy()
+    chunk["data_commessa"] = pd.to_datetime(chunk["data_commessa"], errors="coerce")
+    chunk["fatturato"] = pd.to_numeric(chunk["fatturato"], errors="coerce").astype("float64")
+    for col in ("cliente", "settore"):
+        chunk[col] = chunk[col].astype("string").str.strip()
+
+    valid = chunk["data_commessa"].notna() & chunk["fatturato"].notna() & chunk["cliente"].fillna("").ne("")
+    rejected = int((~valid).sum())
+    chunk = chunk[valid]
+
+    # Colonne extra (es. margine_pct): numeriche -> float64, tutto il resto -> stringa
+    for col in chunk.columns:
+        if col in REQUIRED_COLUMNS:
+            continue
+        if pd.api.types.is_numeric_dtype(chunk[col]):
+            chunk[col] = chunk[col].astype("float64")
+        else:
+            chunk[col] = chunk[col].astype("string")
+
+    # Ordinamento per cliente: le statistiche min/max dei row group permettono di saltare i blocchi
+    chunk = chunk.sort_values(["cliente", "data_commessa"], kind="stable")
+    return chunk, rejected
+
+
+def active_version(store_dir: Optional[str] = None) -> Optional[str]:
+    """Id della versione attiva, None se non è mai stato caricato nulla"""
+    pointer = os.path.join(store_dir or settings.DATASET_STORE_DIR, CURRENT_POINTER)
+    try:
+        with open(pointer, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def active_dataset_path(store_dir: Optional[str] = None) -> str:
+    """Dataset da usare per i forecast: l'ultimo upload attivo, altrimenti il CSV di default"""
+    store_dir = store_dir or settings.DATASET_STORE_DIR
+    version = active_version(store_dir)
+    if version:
+        path = os.path.join(store_dir, version)
+        if os.path.isdir(path):
+            return path
+    return settings.DATA_PATH
+
+
+def _activate(store_dir: str, version: str) -> None:
+    """Scambio atomico del puntatore CURRENT (os.replace è atomico sullo stesso filesystem)"""
+    tmp_path = os.path.join(store_dir, f"{CURRENT_POINTER}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(store_dir, CURRENT_POINTER))
+
+
+def list_versions(store_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Versioni presenti su disco, dalla più recente"""
+    store_dir = store_dir or settings.DATASET_STORE_DIR
+    if not os.path.isdir(store_dir):
+        return []
+    versions = []
+    for name in os.listdir(store_dir):
+        manifest_path = os.path.join(store_dir, name, MANIFEST)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                versions.append(json.load(f))
+    return sorted(versions, key=lambda m: m["created_at"], reverse=True)
+
+
+def prune_versions(store_dir: Optional[str] = None, keep: Optional[int] = None) -> List[str]:
+    """Elimina le versioni più vecchie oltre le ultime `keep` (la versione attiva non viene mai eliminata)"""
+    store_dir = store_dir or settings.DATASET_STORE_DIR
+    keep = settings.DATASET_KEEP_VERSIONS if keep is None else keep
+    current = active_version(store_dir)
+    removed = []
+    for manifest in list_versions(store_dir)[keep:]:
+        if manifest["version"] != current:
+            shutil.rmtree(os.path.join(store_dir, manifest["version"]), ignore_errors=True)
+            removed.append(manifest["version"])
+    return removed
+
+
+def ingest_csv(
+    fileobj: BinaryIO,
+    source_name: str = "upload.csv",
+    store_dir: Optional[str] = None,
+    chunk_rows: Optional[int] = None,
+    activate: bool = True,
+) -> Dict[str, Any]:
+    """
+    Legge il CSV a blocchi, lo scrive come Parquet versionato e (di default) lo attiva.
+    Restituisce il manifest della versione.
+    """
+    # Import locali: pyarrow serve solo qui, mentre forecasting importa il modulo per active_dataset_path
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from app.data.history_store import build_history_index
+
+    store_dir = store_dir or settings.DATASET_STORE_DIR
+    chunk_rows = chunk_rows or settings.INGEST_CHUNK_ROWS
+    os.makedirs(store_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    staging = os.path.join(store_dir, f"_staging-{uuid.uuid4().hex}")
+    os.makedirs(staging)
+
+    reader = _HashingReader(fileobj)
+    schema: Optional[pa.Schema] = None
+    rows = rejected = parts = 0
+    clients = set()
+
+    try:
+        try:
+            chunks = pd.read_csv(reader, chunksize=chunk_rows, dtype={"cliente": "string", "settore": "string"})
+            for chunk in chunks:
+                if schema is None:
+                    missing = [c for c in REQUIRED_COLUMNS if c not in chunk.columns]
+                    if missing:
+                        raise IngestionError(f"CSV mancante di colonne: {missing}")
+
+                chunk, chunk_rejected = _normalize_chunk(chunk)
+                rejected += chunk_rejected
+                if chunk.empty:
+                    continue
+
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if schema is None:
+                    schema = table.schema.remove_metadata()
+                try:
+                    table = table.cast(schema)
+                except (pa.ArrowInvalid, ValueError) as e:
+                    raise IngestionError(f"Colonne con tipi incoerenti tra le righe del CSV: {e}")
+
+                # Row group piccoli: il backend colonnare legge solo quelli del cliente richiesto
+                pq.write_table(
+                    table, os.path.join(staging, f"part-{parts:05d}.parquet"),
+                    row_group_size=settings.HISTORY_ROW_GROUP_ROWS,
+                )
+                parts += 1
+                rows += len(chunk)
+                clients.update(chunk["cliente"].unique().tolist())
+        except pd.errors.EmptyDataError:
+            raise IngestionError("Il file CSV è vuoto")
+
+        if rows == 0:
+            raise IngestionError("Nessuna riga valida nel CSV")
+
+        version = reader.digest.hexdigest()[:16]
+        manifest = {
+            "version": version,
+            "source": source_name,
+            "rows": rows,
+            "rows_rejected": rejected,
+            "clients": len(clients),
+            "parts": parts,
+            "bytes": reader.bytes_read,
+            "columns": schema.names,
+            "created_at": time.time(),
+            "ingest_seconds": round(time.perf_counter() - start, 3),
+        }
+        with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        # Indice per cliente del backend colonnare, pronto prima che la versione diventi visibile
+        build_history_index(staging)
+
+        # Versione indirizzata dal contenuto: lo stesso file caricato due volte non viene duplicato
+        final_dir = os.path.join(store_dir, version)
+        if os.path.isdir(final_dir):
+            shutil.rmtree(staging, ignore_errors=True)
+            with open(os.path.join(final_dir, MANIFEST), "r", encoding="utf-8") as f:
+                manifest = {**json.load(f), "reused": True}
+        else:
+            os.rename(staging, final_dir)
+            manifest["reused"] = False
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if activate:
+        _activate(store_dir, version)
+        prune_versions(store_dir)
+    manifest["active"] = activate
+    return manifest
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingestione di un CSV commesse nel dataset Parquet versionato")
+    parser.add_argument("csv_path")
+    parser.add_argument("--chunk-rows", type=int, default=None)
+    parser.add_argument("--no-activate", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.csv_path, "rb") as f:
+        result = ingest_csv(f, os.path.basename(args.csv_path), chunk_rows=args.chunk_rows, activate=not args.no_activate)
+    print(f"✅ Versione {result['version']}: {result['rows']} righe ({result['rows_rejected']} scartate), "
+          f"{result['clients']} clienti in {result['ingest_seconds']}s")
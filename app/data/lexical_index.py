@@ -0,0 +1,136 @@
+"""
+Indice lessicale (BM25) dei chunk del RAG, accanto alla collection Chroma.
+
+Su disco si tiene solo testo e metadata di ogni chunk, con gli stessi ID di Chroma:
+l'indicizzatore lo aggiorna in modo incrementale (add/delete per ID) e le statistiche BM25
+(posting list, lunghezze, IDF) vengono calcolate in memoria al caricamento.
+Serve per le domande che nominano un documento, un cliente o un progetto: termini rari
+che la ricerca densa tende a diluire.
+"""
+import os
+import re
+import json
+import math
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+LEXICAL_FILE = "lexical_index.json"
+# Parametri standard di Okapi BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# "_" escluso: i nomi dei file (Documento_Interno_...) vengono divisi in parole
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+STOPWORDS = frozenset("""
+a ad al alla alle agli ai all che chi ci come con da dal dalla dalle dei del della delle dello di e ed è
+gli i il in io la le lo ma mi ne nei nel nella nelle non o per più quale quali qual quanto se si sono su
+sul sulla tra fra un una uno cosa cui questo questa quello quella loro suo sua essere ha hanno
+the of and or to in on for is are what which who with by an be this that from as at it
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Minuscole, senza accenti, senza stopword e token di un carattere"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [t for t in _TOKEN_RE.findall(text) if len(t) > 1 and t not in STOPWORDS]
+
+
+def _indexed_text(text: str, metadata: Dict) -> str:
+    # Il nome del file fa parte del testo: "documento interno X" trova il file anche se il testo non lo ripete
+    source = str(metadata.get("source", "")).split("#", 1)[0]
+    return f"{os.path.splitext(os.path.basename(source))[0]} {text}"
+
+
+class LexicalIndex:
+    """Chunk (ID -> testo, metadata) persistiti + indice BM25 costruito su richiesta"""
+
+    def __init__(self, chunks: Optional[Dict[str, Dict]] = None):
+        self.chunks: Dict[str, Dict] = chunks or {}
+        self._postings: Optional[Dict[str, List[Tuple[int, int]]]] = None
+
+    # --- Persistenza / aggiornamento incrementale ---
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["LexicalIndex"]:
+        """None se l'indice lessicale non è mai stato costruito"""
+        path = os.path.join(persist_dir, LEXICAL_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["chunks"])
+
+    def save(self, persist_dir: str) -> None:
+        os.makedirs(persist_dir, exist_ok=True)
+        path = os.path.join(persist_dir, LEXICAL_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"chunks": self.chunks}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def add(self, ids: Iterable[str], docs: Iterable[Document]) -> None:
+        for chunk_id, doc in zip(ids, docs):
+            self.chunks[chunk_id] = {"text": doc.page_content, "metadata": doc.metadata}
+        self._postings = None
+
+    def delete(self, ids: Iterable[str]) -> None:
+        for chunk_id in ids:
+            self.chunks.pop(chunk_id, None)
+        self._postings = None
+
+    # --- BM25 ---
+    def _build(self) -> None:
+        self._ids = list(self.chunks)
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths = []
+        for i, chunk_id in enumerate(self._ids):
+            chunk = self.chunks[chunk_id]
+            counts = Counter(tokenize(_indexed_text(chunk["text"], chunk["metadata"])))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((i, tf))
+        n = len(self._ids)
+        self._lengths = lengths
+        self._avg_len = (sum(lengths) / n) if n else 0.0
+        self._idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in postings.items()}
+        # IDF di un termine assente dal corpus: il massimo possibile (df = 0)
+        self._unknown_idf = math.log(1 + (n + 0.5) / 0.5)
+        self._postings = postings
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def idf(self, term: str) -> float:
+        if self._postings is None:
+            self._build()
+        return self._idf.get(term, self._unknown_idf)
+
+    def document_frequency(self, term: str) -> float:
+        """Frazione dei chunk che contengono il termine"""
+        if self._postings is None:
+            self._build()
+        return len(self._postings.get(term, ())) / max(len(self._ids), 1)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float, List[str]]]:
+        """Top-k per BM25: (ID del chunk, punteggio, termini della query trovati nel chunk)"""
+        if self._postings is None:
+            self._build()
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, List[str]] = defaultdict(list)
+        for term in terms:
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self._postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[i] / self._avg_len)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                matched[i].append(term)
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+        return [(self._ids[i], score, matched[i]) for i, score in ranked]
+
+    def document(self, chunk_id: str) -> Document:
+        chunk = self.chunks[chunk_id]
+        return Document(id=chunk_id, page_content=chunk["text"], metadata=dict(chunk["metadata"]))
@@ -1,9 +1,18 @@
-import os, glob
+import os, glob, json, time, hashlib, logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+from pypdf import PdfReader
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import PyPDFLoader
+
+from app.core.config import settings
+from app.data.flat_vector_store import FlatVectorStore
+from app.data.dedup import ChunkDeduplicator, strip_repeated_lines
+from app.data.lexical_index import LexicalIndex
+from app.services.embeddings import get_embeddings, embedding_model_name
 
 EXCLUDE_SUBSTRINGS = [
     ".git/", "node_modules/", "dist/", "build/", "__pycache__/", ".venv/",
@@ -17,6 +26,19 @@ INCLUDE_GLOBS = [
     "docs/**/*.pdf",
 ]
 
+# Parametri che, se cambiano (insieme al modello di embedding), invalidano tutti i vettori
+CHUNK_SIZE = 400
+CHUNK_OVERLAP = 50
+
+# Manifest dell'indicizzazione incrementale, accanto al vector store
+MANIFEST_FILE = "index_manifest.json"
+# Chroma limita la dimensione di ogni batch di inserimento
+ADD_BATCH_SIZE = 1000
+# I PDF grandi vengono divisi in intervalli di pagine parsati in parallelo
+PDF_PAGES_PER_TASK = 25
+
+logger = logging.getLogger(__name__)
+
 def _load_text_file(path: str, repo_root: str) -> list[Document]:
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
         text = f.read().strip()
@@ -25,66 +47,435 @@ def _load_text_file(path: str, repo_root: str) -> list[Document]:
     rel = os.path.relpath(path, repo_root).replace("\\", "/")
     return [Document(page_content=text, metadata={"source": rel})]
 
-def _load_pdf_file(path: str, repo_root: str) -> list[Document]:
-    loader = PyPDFLoader(path)
-    pages = loader.load()  # 1 Document per pagina
-    rel = os.path.relpath(path, repo_root).replace("\\", "/")
-
-    out: list[Document] = []
-    for d in pages:
-        page = d.metadata.get("page")
-        src = f"{rel}#page={page}" if page is not None else rel
-        d.metadata["source"] = src
-        out.append(d)
-    return out
-
-def load_repo_docs(repo_root: str) -> list[Document]:
+def list_repo_files(repo_root: str) -> list[str]:
+    """File indicizzabili (path assoluti/relativi alla cwd), ordinati e già filtrati"""
     files: list[str] = []
     for pattern in INCLUDE_GLOBS:
         files += glob.glob(os.path.join(repo_root, pattern), recursive=True)
 
-    docs: list[Document] = []
+    out: list[str] = []
     for path in sorted(set(files)):
         norm = path.replace("\\", "/")
         if any(x in norm for x in EXCLUDE_SUBSTRINGS):
             continue
         if os.path.isdir(path):
             continue
+        out.append(path)
+    return out
+
+# --- Parsing parallelo ---
+
+@dataclass
+class ParsedFile:
+    """Risultato del parsing di un file: documenti (pagine in ordine) o errore, con i tempi"""
+    path: str
+    docs: List[Document] = field(default_factory=list)
+    parse_seconds: float = 0.0   # somma dei tempi dei task (CPU spesa sul file)
+    wall_seconds: float = 0.0    # dal primo invio all'ultimo task completato
+    error: Optional[str] = None
+
+def _parse_pdf_pages(path: str, repo_root: str, start: int, end: int) -> Tuple[List[Document], float]:
+    """
+    Parsing di un intervallo di pagine [start, end) con pypdf (eseguito nei processi del pool).
+    Testo e source sono gli stessi del PyPDFLoader usato in precedenza: gli hash delle pagine nel manifest restano validi.
+    """
+    t0 = time.perf_counter()
+    reader = PdfReader(path)
+    rel = os.path.relpath(path, repo_root).replace("\\", "/")
+    total = len(reader.pages)
+    docs = []
+    for page in range(start, int(min(end, total))):
+        text = reader.pages[page].extract_text(extraction_mode="plain").strip()
+        docs.append(Document(page_content=text, metadata={
+            "source": f"{rel}#page={page}",
+            "page": page,
+            "page_label": reader.page_labels[page],
+            "total_pages": total,
+        }))
+    return docs, time.perf_counter() - t0
 
-        ext = os.path.splitext(path)[1].lower()
+def _parse_text(path: str, repo_root: str) -> Tuple[List[Document], float]:
+    t0 = time.perf_counter()
+    return _load_text_file(path, repo_root), time.perf_counter() - t0
+
+def _plan_tasks(path: str, pages_per_task: Optional[int]) -> List[Tuple]:
+    """Task di parsing del file: uno per i testi, uno per intervallo di pagine per i PDF"""
+    if os.path.splitext(path)[1].lower() != ".pdf":
+        return [(_parse_text,)]
+    if pages_per_task is None:
+        # Esecuzione sequenziale: un task per file, senza aprire il PDF due volte
+        return [(_parse_pdf_pages, 0, float("inf"))]
+    total = len(PdfReader(path).pages)
+    return [(_parse_pdf_pages, start, start + pages_per_task) for start in range(0, max(total, 1), pages_per_task)]
+
+def iter_parsed_files(
+    paths: List[str],
+    repo_root: str,
+    max_workers: Optional[int] = None,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+) -> Iterator[ParsedFile]:
+    """
+    Parsing in parallelo su un pool di processi (file e intervalli di pagine dei PDF grandi).
+    Ogni file viene restituito appena tutti i suoi task sono completati, senza aspettare gli altri.
+    Un errore resta confinato al suo file: viene loggato e riportato in ParsedFile.error.
+    """
+    workers = max(1, max_workers or os.cpu_count() or 1)
+    results: Dict[str, ParsedFile] = {}
+    pending: Dict[str, int] = {}
+    chunks: Dict[str, Dict[int, List[Document]]] = {}
+    tasks = []
+    for path in paths:
+        results[path] = ParsedFile(path)
         try:
-            if ext == ".pdf":
-                docs.extend(_load_pdf_file(path, repo_root))
-            else:
-                docs.extend(_load_text_file(path, repo_root))
-        except Exception:
+            planned = _plan_tasks(path, pages_per_task if workers > 1 else None)
+        except Exception as e:
+            logger.warning("Parsing fallito per %s: %s", path, e)
+            results[path].error = str(e)
             continue
+        pending[path] = len(planned)
+        chunks[path] = {}
+        tasks += [(path, order, task) for order, task in enumerate(planned)]
+
+    for path, parsed in results.items():
+        if parsed.error:
+            yield parsed
+
+    def _complete(path: str, order: int, outcome, started: float):
+        parsed = results[path]
+        if parsed.error is None:
+            if isinstance(outcome, Exception):
+                logger.warning("Parsing fallito per %s: %s", path, outcome)
+                parsed.error = str(outcome)
+            else:
+                docs, seconds = outcome
+                chunks[path][order] = docs
+                parsed.parse_seconds += seconds
+        pending[path] -= 1
+        if pending[path] == 0:
+            parsed.wall_seconds = time.perf_counter() - started
+            if parsed.error is None:
+                parsed.docs = [d for order in sorted(chunks[path]) for d in chunks[path][order]]
+            logger.info("Parsing %s: %d documenti in %.2fs (CPU %.2fs)",
+                        path, len(parsed.docs), parsed.wall_seconds, parsed.parse_seconds)
+            return parsed
+        return None
+
+    workers = min(workers, len(tasks) or 1)
+    started = time.perf_counter()
+    if workers == 1:
+        # Un solo worker: niente pool, stesso flusso
+        for path, order, (fn, *args) in tasks:
+            try:
+                outcome = fn(path, repo_root, *args)
+            except Exception as e:
+                outcome = e
+            done = _complete(path, order, outcome, started)
+            if done:
+                yield done
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fn, path, repo_root, *args): (path, order) for path, order, (fn, *args) in tasks}
+        for future in as_completed(futures):
+            path, order = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = e
+            done = _complete(path, order, outcome, started)
+            if done:
+                yield done
+
+def iter_repo_docs(repo_root: str, max_workers: Optional[int] = None) -> Iterator[Document]:
+    """Documenti del repo in streaming, man mano che i file vengono parsati"""
+    for parsed in iter_parsed_files(list_repo_files(repo_root), repo_root, max_workers):
+        yield from parsed.docs
+
+def load_repo_docs(repo_root: str, max_workers: Optional[int] = None) -> list[Document]:
+    return list(iter_repo_docs(repo_root, max_workers))
+
+# --- Indicizzazione incrementale ---
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-    return docs
+VECTOR_BACKENDS = ["chroma", "flat"]
 
-def build_vectorstore(repo_root: str, persist_dir: str, collection_name: str) -> None:
-    docs = load_repo_docs(repo_root)
-    print(f"📄 Documenti caricati (incl. pagine PDF): {len(docs)}")
+def _index_config(model_name: Optional[str] = None, backend: Optional[str] = None) -> Dict[str, object]:
+    return {"embedding_model": model_name or embedding_model_name(),
+            "vector_backend": backend or settings.RAG_VECTOR_BACKEND,
+            # ID dei chunk dal contenuto, testo senza numeri di pagina e righe ripetute tolte: cambiare
+            # la regola cambia testo e raggruppamento (gli indici con la regola precedente vengono ricostruiti)
+            "dedup": f"skeleton-near{settings.RAG_DEDUP_NEAR}-lines{settings.RAG_DEDUP_REPEATED_LINES}",
+            "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=50)
-    chunks = splitter.split_documents(docs)
-    print(f"✂️  Chunk generati: {len(chunks)}")
+def load_manifest(persist_dir: str) -> Dict:
+    """
+    Manifest: per ogni file stat (mtime, size), hash del contenuto e, per ogni unità
+    (file di testo intero o pagina PDF), hash del testo -> ID dei chunk nel vector store.
+    "chunks": ID dei chunk canonici presenti nell'indice -> skeleton hash (per la deduplicazione incrementale).
+    """
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"index_version": 0, "config": _index_config(), "files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
+def manifest_backend(manifest: Dict) -> str:
+    """Backend vettoriale con cui è stato costruito l'indice (i manifest precedenti ai backend sono Chroma)"""
+    return manifest.get("config", {}).get("vector_backend", "chroma")
+
+def _save_manifest(persist_dir: str, manifest: Dict) -> None:
     os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def chunk_sources(manifest: Dict) -> Dict[str, List[str]]:
+    """Fonti di ogni chunk: un chunk deduplicato è referenziato da più pagine/file"""
+    sources: Dict[str, List[str]] = {}
+    for entry in manifest["files"].values():
+        for source, unit in entry["units"].items():
+            for chunk_id in unit["ids"]:
+                sources.setdefault(chunk_id, []).append(source)
+    return sources
+
+def read_index_version(persist_dir: str) -> int:
+    """Versione dell'indice: cambia a ogni reindex che modifica i vettori"""
+    return int(load_manifest(persist_dir).get("index_version", 0))
+
+def open_vector_store(
+    persist_dir: str, collection_name: str, embedding: Embeddings, backend: Optional[str] = None,
+) -> VectorStore:
+    """
+    Vector store dell'indice: Chroma, oppure la matrice memory-mapped di FlatVectorStore
+    (cartella flat/<collection> accanto al manifest). Chroma viene importato solo se serve.
+    """
+    backend = backend or settings.RAG_VECTOR_BACKEND
+    if backend == "flat":
+        return FlatVectorStore(os.path.join(persist_dir, "flat", collection_name), embedding)
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        return Chroma(
+            persist_directory=persist_dir,
+            embedding_function=embedding,
+            collection_name=collection_name,
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+    raise ValueError(f"Backend vettoriale sconosciuto: {backend}. Disponibili: {VECTOR_BACKENDS}")
+
+def build_vectorstore(
+    repo_root: str,
+    persist_dir: str,
+    collection_name: str,
+    full: bool = False,
+    embedding: Optional[Embeddings] = None,
+    max_workers: Optional[int] = None,
+    backend: Optional[str] = None,
+) -> Dict[str, object]:
+    """
+    Indicizzazione incrementale:
+    - file con stat invariato: saltati senza leggerli;
+    - file modificati: si ricalcolano gli hash delle pagine e si embeddano solo quelle nuove/cambiate;
+    - file o pagine rimossi: i loro vettori vengono cancellati (se nessun'altra pagina li referenzia);
+    - chunk duplicati (esatti o quasi, vedi app.data.dedup) vengono embeddati una volta sola.
+    Se non c'è nulla da fare il vector store e l'API di embedding non vengono nemmeno inizializzati.
+    full=True, un manifest mancante o un cambio di modello/chunking/backend ricostruiscono tutto da zero.
+    """
+    start = time.perf_counter()
+    backend = backend or settings.RAG_VECTOR_BACKEND
+    config = _index_config(getattr(embedding, "model_name", None) if embedding is not None else None, backend)
+    manifest = load_manifest(persist_dir)
+    if not os.path.exists(os.path.join(persist_dir, MANIFEST_FILE)):
+        # Senza manifest non si sa cosa c'è nel vector store (es. manifest cancellato o run interrotto):
+        # si riparte da una collection vuota invece di accumulare vettori orfani
+        full = True
+    # I manifest precedenti all'introduzione dei backend sono indici Chroma
+    if full or {"vector_backend": "chroma", **manifest.get("config", {})} != config:
+        if manifest["files"]:
+            print("♻️  Configurazione cambiata o --full: ricostruzione completa")
+        full = True
+        manifest = {"index_version": manifest.get("index_version", 0), "config": config, "files": {}}
+
+    # Chunk canonici già nell'indice: riconosciuti anche come duplicati dei chunk nuovi
+    previous_chunks = manifest.get("chunks", {})
+    dedup = ChunkDeduplicator(previous_chunks, near=settings.RAG_DEDUP_NEAR)
+
+    # Indice lessicale (BM25) con gli stessi ID dei vettori; se manca su un indice esistente lo si ricostruisce dal vector store
+    lexical = None if full else LexicalIndex.load(persist_dir)
+    backfill_lexical = lexical is None and bool(manifest["files"])
+    lexical = lexical or LexicalIndex()
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    to_add: List[Document] = []
+    to_add_ids: List[str] = []
+    stats = {"files_scanned": 0, "files_unchanged": 0, "files_changed": 0, "files_removed": 0, "files_failed": 0,
+             "units_embedded": 0, "units_reused": 0, "chunks_added": 0, "chunks_deleted": 0,
+             "chunks_split": 0, "dedup_exact": 0, "dedup_near": 0, "dedup_lines": 0}
+
+    seen = set()
+    changed: Dict[str, Tuple[str, os.stat_result, str]] = {}
+    for path in list_repo_files(repo_root):
+        rel = os.path.relpath(path, repo_root).replace("\\", "/")
+        seen.add(rel)
+        stats["files_scanned"] += 1
+        st = os.stat(path)
+        entry = manifest["files"].get(rel)
+
+        # 1. Stat invariato: nessuna lettura del file
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            stats["files_unchanged"] += 1
+            continue
+
+        # 2. Stat cambiato ma contenuto identico (es. touch, checkout): aggiorniamo solo lo stat
+        file_hash = _file_sha256(path)
+        if entry and entry["sha256"] == file_hash:
+            entry.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+            stats["files_unchanged"] += 1
+            continue
 
-    # Persistenza automatica (NO vs.persist())
-    Chroma.from_documents(
-        chunks,
-        embedding=OpenAIEmbeddings(model="text-embedding-3-small"),
-        persist_directory=persist_dir,
-        collection_name=collection_name,
-        collection_metadata={"hnsw:space": "cosine"},
-    )
+        changed[path] = (rel, st, file_hash)
+
+    # 3. Contenuto cambiato: parsing in parallelo, confronto pagina per pagina appena un file è pronto
+    parse_times: Dict[str, float] = {}
+    for parsed in iter_parsed_files(list(changed), repo_root, max_workers):
+        rel, st, file_hash = changed[parsed.path]
+        if parsed.error is not None:
+            # File illeggibile: si tengono i vettori esistenti (l'errore è già nel log)
+            stats["files_failed"] += 1
+            continue
+        parse_times[rel] = round(parsed.wall_seconds, 3)
+
+        entry = manifest["files"].get(rel)
+        old_units = entry["units"] if entry else {}
+        new_units: Dict[str, Dict] = {}
+        docs = parsed.docs
+        if settings.RAG_DEDUP_REPEATED_LINES is not None and len(docs) > 1:
+            # Intestazioni e piè di pagina tolti prima dello splitting; l'hash della pagina è sul testo
+            # ripulito, così un cambio delle righe ripetute riembedda le pagine toccate
+            texts, removed = strip_repeated_lines([d.page_content for d in docs], settings.RAG_DEDUP_REPEATED_LINES)
+            docs = [Document(page_content=text, metadata=d.metadata) for text, d in zip(texts, docs)]
+            stats["dedup_lines"] += removed
+        for doc in docs:
+            source = doc.metadata["source"]
+            unit_hash = _sha256(doc.page_content.encode("utf-8"))
+            old = old_units.get(source)
+            if old and old["hash"] == unit_hash:
+                new_units[source] = old
+                stats["units_reused"] += 1
+                continue
+
+            ids: Dict[str, None] = {}
+            for chunk in splitter.split_documents([doc]):
+                chunk_id, kind = dedup.resolve(chunk.page_content, scope=source)
+                stats["chunks_split"] += 1
+                if kind == "new":
+                    to_add.append(chunk)
+                    to_add_ids.append(chunk_id)
+                else:
+                    # Duplicato: nessun nuovo vettore, la pagina referenzia il chunk canonico
+                    stats[f"dedup_{kind}"] += 1
+                ids[chunk_id] = None
+            new_units[source] = {"hash": unit_hash, "ids": list(ids)}
+            stats["units_embedded"] += 1
+
+        manifest["files"][rel] = {
+            "mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": file_hash, "units": new_units,
+        }
+        stats["files_changed"] += 1
+
+    # 4. File rimossi dal repo
+    for rel in [r for r in manifest["files"] if r not in seen]:
+        manifest["files"].pop(rel)
+        stats["files_removed"] += 1
+
+    # Un chunk resta finché almeno una pagina lo referenzia (i duplicati condividono lo stesso ID)
+    live = {chunk_id: None for entry in manifest["files"].values()
+            for unit in entry["units"].values() for chunk_id in unit["ids"]}
+    to_delete = [chunk_id for chunk_id in previous_chunks if chunk_id not in live]
+    manifest["chunks"] = dedup.export(live)
+
+    if full or to_add or to_delete or backfill_lexical:
+        os.makedirs(persist_dir, exist_ok=True)
+        embedding = embedding or get_embeddings()
+        before = embedding.stats() if hasattr(embedding, "stats") else None
+        vs = open_vector_store(persist_dir, collection_name, embedding, backend)
+        if full:
+            # Ricostruzione: si riparte da una collection vuota
+            vs.delete_collection()
+            vs = open_vector_store(persist_dir, collection_name, embedding, backend)
+        elif backfill_lexical:
+            # Testi già nel vector store: nessuna chiamata di embedding
+            existing = vs.get(include=["documents", "metadatas"])
+            lexical.add(existing["ids"], [Document(page_content=text, metadata=meta or {})
+                                          for text, meta in zip(existing["documents"], existing["metadatas"])])
+        if to_delete:
+            vs.delete(ids=to_delete)
+        for i in range(0, len(to_add), ADD_BATCH_SIZE):
+            vs.add_documents(to_add[i:i + ADD_BATCH_SIZE], ids=to_add_ids[i:i + ADD_BATCH_SIZE])
+        manifest["index_version"] = manifest.get("index_version", 0) + 1
+        if before is not None:
+            # Chunk serviti dalla cache su disco vs inviati al backend in questo run
+            stats["embedding_cache"] = {k: v - before[k] for k, v in embedding.stats().items()}
+
+        lexical.delete(to_delete)
+        lexical.add(to_add_ids, to_add)
+        lexical.save(persist_dir)
+
+    # Il manifest viene salvato solo dopo che vettori e indice lessicale sono aggiornati
+    _save_manifest(persist_dir, manifest)
+
+    stats["chunks_added"] = len(to_add)
+    stats["chunks_removed_by_dedup"] = stats["dedup_exact"] + stats["dedup_near"]
+    stats["chunks_deleted"] = len(to_delete)
+    stats["lexical_chunks"] = len(lexical)
+    stats["index_version"] = manifest["index_version"]
+    stats["parse_seconds"] = parse_times
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Indicizzazione (incrementale) dei documenti interni per il RAG")
+    parser.add_argument("--full", action="store_true", help="Ricostruisce l'indice da zero")
+    parser.add_argument("--workers", type=int, default=None, help="Processi per il parsing (default: numero di core)")
+    parser.add_argument("--backend", choices=["openai", "local"], default=None,
+                        help="Backend di embedding (default: EMBEDDING_BACKEND)")
+    parser.add_argument("--vector-backend", choices=VECTOR_BACKENDS, default=None,
+                        help="Vector store (default: RAG_VECTOR_BACKEND)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+
     repo_root = os.getenv("RAG_REPO_ROOT", ".")
     persist_dir = os.getenv("RAG_PERSIST_DIR", "./app/data/.rag/chroma")
     collection = os.getenv("RAG_COLLECTION_NAME", "internal_repo")
 
-    build_vectorstore(repo_root, persist_dir, collection)
-    print(f"✅ Indicizzazione completata: {persist_dir} (collection={collection})")
+    embedding = get_embeddings(args.backend) if args.backend else None
+    stats = build_vectorstore(repo_root, persist_dir, collection, full=args.full,
+                              embedding=embedding, max_workers=args.workers, backend=args.vector_backend)
+    print(f"📄 File: {stats['files_scanned']} ({stats['files_changed']} modificati, "
+          f"{stats['files_unchanged']} invariati, {stats['files_removed']} rimossi, {stats['files_failed']} in errore)")
+    for rel, seconds in sorted(stats["parse_seconds"].items(), key=lambda kv: -kv[1]):
+        print(f"   ⏱️  {seconds:>7.2f}s  {rel}")
+    print(f"✂️  Chunk: +{stats['chunks_added']} / -{stats['chunks_deleted']} "
+          f"(pagine embeddate: {stats['units_embedded']}, riusate: {stats['units_reused']})")
+    if stats["chunks_split"]:
+        print(f"🧹 Deduplicazione: {stats['chunks_removed_by_dedup']} chunk su {stats['chunks_split']} "
+              f"({stats['chunks_removed_by_dedup'] / stats['chunks_split']:.1%}) non embeddati: "
+              f"{stats['dedup_exact']} identici, {stats['dedup_near']} quasi identici; "
+              f"{stats['dedup_lines']} righe ripetute (intestazioni, piè di pagina) tolte prima dello splitting")
+    if "embedding_cache" in stats:
+        cache = stats["embedding_cache"]
+        print(f"🧠 Embedding: {cache['hits']} dalla cache, {cache['misses']} calcolati in {cache['backend_calls']} chiamate")
+    print(f"✅ Indicizzazione completata in {stats['seconds']}s: {persist_dir} "
+          f"(collection={collection}, versione indice {stats['index_version']})")
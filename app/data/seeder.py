@@ -1,7 +1,10 @@
+import os
+import shutil
+import argparse
+import time
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import random
+from datetime import timedelta
 
 # Clienti target per la POC
 CLIENTI = [
@@ -12,6 +15,16 @@ CLIENTI = [
     {"name": "Gucci", "sector": "Fashion", "trend": 0.85, "volatility": 0.15} # In calo, volatile
 ]
 
+# Settori usati per i clienti sintetici dei dataset di carico
+SETTORI = ["Automotive", "Aerospace", "Luxury Auto", "Fashion", "Energy", "Banking",
+           "Telco", "Retail", "Pharma", "Food", "Logistics", "Public Sector"]
+
+# Stagionalità fissa per mese (1-12); NaN = mese "normale", 1 ± 5% casuale
+_SEASONALITY = np.full(13, np.nan)
+_SEASONALITY[8] = 0.6              # Agosto
+_SEASONALITY[12] = 1.4             # Dicembre
+_SEASONALITY[[6, 7]] = 0.9         # Estate pre-agosto
+
 def generate_realistic_series(start_date, months=36, base_value=50000, trend_factor=1.0, volatility=0.05):
     """
     Genera una serie temporale con:
@@ -57,39 +70,174 @@ def generate_realistic_series(start_date, months=36, base_value=50000, trend_fac
         
     return dates, values
 
+def generate_realistic_panel(start_date, months, base_values, trend_factors, volatilities, rng=None):
+    """
+    Versione vettoriale di generate_realistic_series per molti clienti insieme
+    (stesso modello: trend lineare, stagionalità Agosto/Dicembre/estate, rumore gaussiano).
+    base_values, trend_factors, volatilities: array (n_clienti,).
+    Restituisce (dates (months,), values (n_clienti, months)).
+    """
+    rng = rng or np.random.default_rng()
+    base = np.asarray(base_values, dtype="float64")[:, None]
+    trend = np.asarray(trend_factors, dtype="float64")[:, None]
+    vol = np.asarray(volatilities, dtype="float64")[:, None]
+    n = base.shape[0]
+
+    # Stesse date della versione a ciclo: passi di 30 giorni
+    dates = np.datetime64(pd.Timestamp(start_date).date()) + np.arange(months) * np.timedelta64(30, "D")
+    month_idx = pd.DatetimeIndex(dates).month.to_numpy()
+
+    # 1. Trend lineare
+    i = np.arange(months)[None, :]
+    trend_component = base * (1 + (trend - 1) * (i / months))
+
+    # 2. Stagionalità: fissa nei mesi speciali, 1 ± 5% negli altri
+    fixed = _SEASONALITY[month_idx][None, :]
+    seasonality = np.where(np.isnan(fixed), 1.0 + rng.uniform(-0.05, 0.05, size=(n, months)), fixed)
+
+    # 3. Rumore
+    noise = rng.normal(0.0, 1.0, size=(n, months)) * (vol * base)
+
+    values = np.maximum(trend_component * seasonality + noise, 0.0)
+    return dates, np.round(values, 2)
+
+
+def make_client_profiles(n_clients, rng=None):
+    """Profili casuali (nome, settore, base, trend, volatilità) per i dataset di carico"""
+    rng = rng or np.random.default_rng()
+    width = len(str(n_clients))
+    return pd.DataFrame({
+        "name": [f"Cliente_{i:0{width}d}" for i in range(1, n_clients + 1)],
+        "sector": rng.choice(SETTORI, size=n_clients),
+        "base": rng.integers(40000, 80000, size=n_clients),
+        "trend": rng.uniform(0.8, 1.5, size=n_clients),
+        "volatility": rng.uniform(0.02, 0.15, size=n_clients),
+    })
+
+
+def iter_panel_blocks(profiles, start_date, months, seed=None, block_clients=2000):
+    """
+    Dataset in formato lungo (colonne del CSV commesse), un blocco di clienti alla volta:
+    la memoria dipende da block_clients × months, non dalla dimensione totale.
+    Ogni blocco ha un generatore derivato dal seed: stesso seed e block_clients -> stesso dataset.
+    """
+    seed_seq = np.random.SeedSequence(seed)
+    for block_rng_seed, block_start in zip(seed_seq.spawn((len(profiles) + block_clients - 1) // block_clients),
+                                           range(0, len(profiles), block_clients)):
+        block = profiles.iloc[block_start:block_start + block_clients]
+        rng = np.random.default_rng(block_rng_seed)
+        dates, values = generate_realistic_panel(
+            start_date, months, block["base"].to_numpy(), block["trend"].to_numpy(),
+            block["volatility"].to_numpy(), rng
+        )
+        k = len(block)
+        yield pd.DataFrame({
+            "data_commessa": np.tile(dates, k),
+            "cliente": np.repeat(block["name"].to_numpy(), months),
+            "settore": np.repeat(block["sector"].to_numpy(), months),
+            "fatturato": values.ravel(),
+            # Aggiungiamo margine finto
+            "margine_pct": np.round(rng.uniform(10, 25, size=k * months), 1),
+        })
+
+
+def write_dataset(blocks, output_path, fmt="csv"):
+    """
+    Scrittura in streaming, un blocco alla volta.
+    csv: un unico file. parquet: cartella con un part per blocco + indice del backend colonnare
+    (stesso layout delle versioni create da app.data.ingestion, utilizzabile con entrambi i backend).
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    if fmt == "parquet":
+        from app.data.history_store import build_history_index
+        from app.core.config import settings
+        os.makedirs(output_path, exist_ok=True)
+
+    try:
+        for part, block in enumerate(blocks):
+            if fmt == "csv":
+                # Date come YYYY-MM-DD (date32), come nel CSV demo
+                table = pa.Table.from_pandas(block, preserve_index=False)
+                table = table.set_column(0, "data_commessa", table["data_commessa"].cast(pa.date32()))
+                if writer is None:
+                    # Header scritto a mano: pyarrow metterebbe i nomi di colonna tra virgolette
+                    sink = pa.OSFile(output_path, "wb")
+                    sink.write((",".join(table.column_names) + "\n").encode("utf-8"))
+                    writer = pacsv.CSVWriter(sink, table.schema, write_options=pacsv.WriteOptions(
+                        include_header=False, quoting_style="none"))
+                writer.write_table(table)
+            else:
+                table = pa.Table.from_pandas(block, preserve_index=False)
+                table = table.set_column(0, "data_commessa", table["data_commessa"].cast(pa.timestamp("ns")))
+                pq.write_table(table, os.path.join(output_path, f"part-{part:05d}.parquet"),
+                               row_group_size=settings.HISTORY_ROW_GROUP_ROWS)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+            sink.close()
+
+    if fmt == "parquet":
+        build_history_index(output_path)
+    return rows
+
+
+def default_output_path(fmt, clients, months):
+    """Percorso derivato dai parametri, fuori dal CSV demo: app/data/generated/commesse_<clienti>c_<mesi>m[.csv]"""
+    name = f"commesse_{clients if clients is not None else 'demo'}c_{months}m"
+    return os.path.join("app", "data", "generated", name + (".csv" if fmt == "csv" else ""))
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Generatore di dataset commesse sintetici")
+    parser.add_argument("--clients", type=int, default=None,
+                        help="Numero di clienti sintetici (default: i 5 clienti demo di CLIENTI)")
+    parser.add_argument("--months", type=int, default=48)
+    parser.add_argument("--start", default="2022-01-15")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--output", default=None,
+                        help="File CSV oppure cartella per il formato parquet "
+                             "(default: app/data/generated/commesse_<clienti>c_<mesi>m[.csv])")
+    parser.add_argument("--force", action="store_true", help="Sovrascrive l'output se esiste già")
+    parser.add_argument("--block-clients", type=int, default=2000)
+    args = parser.parse_args()
+
+    output = args.output or default_output_path(args.format, args.clients, args.months)
+    if os.path.exists(output):
+        if not args.force:
+            parser.error(f"{output} esiste già: usa --force per sovrascriverlo o scegli un altro --output")
+        if os.path.isdir(output):
+            # Niente part di un dataset precedente mescolati a quelli nuovi
+            shutil.rmtree(output)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
     print("🌱 Generazione dati sintetici in corso...")
-    
-    all_data = []
-    start_date = datetime(2022, 1, 15) # Partiamo da 3 anni fa
-    
-    for client in CLIENTI:
-        dates, revenues = generate_realistic_series(
-            start_date=start_date,
-            months=48, # 36 storici + 12 futuri (per testare noi, ma salveremo tutto)
-            base_value=np.random.randint(40000, 80000),
-            trend_factor=client["trend"],
-            volatility=client["volatility"]
-        )
-        
-        for d, r in zip(dates, revenues):
-            all_data.append({
-                "data_commessa": d.strftime("%Y-%m-%d"),
-                "cliente": client["name"],
-                "settore": client["sector"],
-                "fatturato": r,
-                # Aggiungiamo margine finto
-                "margine_pct": round(np.random.uniform(10, 25), 1)
-            })
-            
-    df = pd.DataFrame(all_data)
-    
-    # Salviamo nella cartella data
-    output_path = "app/data/storico_commesse.csv"
-    df.to_csv(output_path, index=False)
-    print(f"✅ Dataset creato con successo: {output_path}")
-    print(f"   Totale righe: {len(df)}")
-    print(df.head())
+    start = time.perf_counter()
+
+    if args.clients is None:
+        # Dataset demo: i clienti della POC con i loro profili
+        rng = np.random.default_rng(args.seed)
+        profiles = pd.DataFrame({
+            "name": [c["name"] for c in CLIENTI],
+            "sector": [c["sector"] for c in CLIENTI],
+            "base": rng.integers(40000, 80000, size=len(CLIENTI)),
+            "trend": [c["trend"] for c in CLIENTI],
+            "volatility": [c["volatility"] for c in CLIENTI],
+        })
+    else:
+        profiles = make_client_profiles(args.clients, np.random.default_rng(args.seed))
+
+    blocks = iter_panel_blocks(profiles, args.start, args.months, args.seed, args.block_clients)
+    rows = write_dataset(blocks, output, args.format)
+
+    print(f"✅ Dataset creato con successo: {output}")
+    print(f"   Totale righe: {rows} ({len(profiles)} clienti × {args.months} mesi) in {time.perf_counter() - start:.2f}s")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
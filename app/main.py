@@ -2,10 +2,17 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 import requests
+import json
 import time
 
 # CONFIGURAZIONE API
 API_URL = "http://127.0.0.1:8000"
+NODE_LABELS = {
+    "analyst": "Analista finanziario",
+    "internal_researcher": "Ricerca interna (RAG)",
+    "researcher": "Ricerca web",
+    "director": "Direttore",
+}
 
 st.set_page_config(page_title="Progetto Manhattan", page_icon="☢️", layout="wide")
 
@@ -37,8 +44,25 @@ def fetch_clients():
     except:
         return []
 
+def iter_sse(resp):
+    """Eventi (tipo, dati) da una risposta Server-Sent Events letta in streaming"""
+    event, data = "message", []
+    # chunk_size=None: le righe arrivano appena il server le invia (niente buffer da 512 byte)
+    for line in resp.iter_lines(chunk_size=None, decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
 def plot_forecast_from_json(forecast_data, client_name):
     df = pd.DataFrame(forecast_data)
+    # Layout colonnare: date come epoch in millisecondi
+    if isinstance(forecast_data, dict):
+        df['ds'] = pd.to_datetime(df['ds'], unit='ms')
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=df['ds'], y=df['yhat'], mode='lines', name='Previsione', line=dict(color='#007bff', width=3)))
     fig.add_trace(go.Scatter(
@@ -90,34 +114,51 @@ def run_dashboard(client, sector):
     # Logica di calcolo (eseguita una volta sola al click)
     metrics = None
     
-    with st.spinner("⏳ Elaborazione Prophet & Agenti..."):
-        try:
-            # 1. Forecast
-            payload = {"client_name": client, "months": 12}
+    try:
+        # 1. Forecast
+        with st.spinner("⏳ Elaborazione Prophet..."):
+            payload = {"client_name": client, "months": 12, "layout": "columnar"}
             resp = requests.post(f"{API_URL}/forecast", json=payload)
-            if resp.status_code != 200:
-                st.error("Errore Forecast")
-                return
-            data = resp.json()
-            metrics = data["metrics"]
-            st.session_state.forecast_data = data["forecast_data"]
-            st.session_state.metrics = metrics
-
-            # 2. Agenti
-            agent_payload = {"client_name": client, "sector": sector, "metrics": metrics}
-            agent_resp = requests.post(f"{API_URL}/agent/analyze", json=agent_payload)
-            if agent_resp.status_code != 200:
-                st.error("Errore Agenti")
-                return
-            
-            agent_data = agent_resp.json()
-            st.session_state.agent_data = agent_data
-            # Salviamo il report per il contesto della chat
-            st.session_state.final_report_context = agent_data["final_report"]
-            st.session_state.analysis_done = True
-            
-        except Exception as e:
-            st.error(f"Errore Critico: {e}")
+        if resp.status_code != 200:
+            st.error("Errore Forecast")
+            return
+        data = resp.json()
+        metrics = data["metrics"]
+        st.session_state.forecast_data = data["forecast_data"]
+        st.session_state.metrics = metrics
+
+        # 2. Agenti (streaming: avanzamento per agente e report del Direttore mentre viene scritto)
+        agent_payload = {"client_name": client, "sector": sector, "metrics": metrics}
+        agent_data = None
+        with st.status("🧠 Agenti al lavoro...", expanded=True) as status:
+            report_box = st.empty()
+            report = ""
+            with requests.post(f"{API_URL}/agent/analyze/stream", json=agent_payload, stream=True) as agent_resp:
+                if agent_resp.status_code != 200:
+                    st.error("Errore Agenti")
+                    return
+                for event, data in iter_sse(agent_resp):
+                    if event == "node":
+                        st.write(f"✅ {NODE_LABELS.get(data['node'], data['node'])} ({data['seconds']}s)")
+                    elif event == "token":
+                        report += data["text"]
+                        report_box.markdown(report + "▌")
+                    elif event == "done":
+                        agent_data = data
+                    elif event == "error":
+                        st.error(f"Errore Agenti: {data['detail']}")
+                        return
+            report_box.empty()
+            status.update(label=f"🧠 Analisi completata in {agent_data['node_timings']['total']}s",
+                          state="complete", expanded=False)
+
+        st.session_state.agent_data = agent_data
+        # Salviamo il report per il contesto della chat
+        st.session_state.final_report_context = agent_data["final_report"]
+        st.session_state.analysis_done = True
+        
+    except Exception as e:
+        st.error(f"Errore Critico: {e}")
 
 def render_persistent_ui(client):
     """Renderizza la dashboard usando i dati salvati in Session State"""
@@ -193,22 +234,34 @@ def render_persistent_ui(client):
         # 1. Aggiungi messaggio utente
         st.session_state.chat_history.append({"role": "user", "content": prompt})
         
-        # 2. Chiama API Backend
-        with st.spinner("Il Direttore sta riflettendo..."):
-            try:
-                chat_payload = {
-                    "question": prompt,
-                    "context_report": st.session_state.final_report_context
-                }
-                resp = requests.post(f"{API_URL}/agent/chat", json=chat_payload)
+        st.markdown(f'<div class="chat-user">👤 <b>Tu:</b> {prompt}</div>', unsafe_allow_html=True)
+
+        # 2. Chiama API Backend (la risposta compare token per token)
+        answer_box = st.empty()
+        answer_box.markdown("_Il Direttore sta riflettendo..._")
+        try:
+            chat_payload = {
+                "question": prompt,
+                "context_report": st.session_state.final_report_context
+            }
+            with requests.post(f"{API_URL}/agent/chat/stream", json=chat_payload, stream=True) as resp:
                 if resp.status_code == 200:
-                    answer = resp.json()["answer"]
+                    answer = ""
+                    for event, data in iter_sse(resp):
+                        if event == "token":
+                            answer += data["text"]
+                            answer_box.markdown(f'<div class="chat-bot">👔 <b>Direttore:</b> {answer}▌</div>', unsafe_allow_html=True)
+                        elif event == "done":
+                            answer = data["answer"]
+                        elif event == "error":
+                            raise RuntimeError(data["detail"])
                     st.session_state.chat_history.append({"role": "assistant", "content": answer})
                     st.rerun() # Ricarica per mostrare il nuovo messaggio
                 else:
+                    answer_box.empty()
                     st.error("Errore API Chat")
-            except Exception as e:
-                st.error(f"Errore connessione: {e}")
+        except Exception as e:
+            st.error(f"Errore connessione: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,9 @@
 import os
-from typing import TypedDict, Optional
+import time
+import operator
+import threading
+from functools import wraps
+from typing import Annotated, Callable, Dict, Iterator, List, Tuple, TypedDict, Optional
 from dotenv import load_dotenv
 
 # Carica esplicitamente le variabili d'ambiente subito
@@ -8,8 +12,7 @@ load_dotenv()
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langgraph.graph import StateGraph, END
-from langchain_community.tools.tavily_search import TavilySearchResults
+from langgraph.graph import StateGraph, START, END
 
 # Importiamo i nostri prompt puliti e le config
 from app.core.prompts import ANALYST_SYSTEM_PROMPT, RESEARCHER_SYSTEM_PROMPT, DIRECTOR_SYSTEM_PROMPT
@@ -17,6 +20,9 @@ from app.core.config import settings
 
 # ✅ RAG Service (Repo-based)
 from app.services.rag_service import RAGService
+from app.services.http_clients import get_async_http_client, get_http_client
+from app.services.llm_cache import get_llm_cache
+from app.services.web_search import CachedSearch, SearchProvider, get_web_search
 
 
 # --- 1. Definizione dello Stato ---
@@ -35,21 +41,59 @@ class AgentState(TypedDict):
     researcher_output: Optional[str]
     final_report: Optional[str]
 
+    # Tempi per nodo (secondi): i rami paralleli scrivono insieme, il reducer unisce i dizionari
+    node_timings: Annotated[Dict[str, float], operator.or_]
+    # Dettagli di esecuzione per nodo (es. cache della ricerca web), uniti come node_timings
+    node_metadata: Annotated[Dict[str, dict], operator.or_]
+
+
+# Campo dello stato prodotto da ciascun nodo (per gli eventi di avanzamento in streaming)
+_NODE_OUTPUTS = {
+    "analyst": "analyst_output",
+    "internal_researcher": "internal_research_output",
+    "researcher": "researcher_output",
+    "director": "final_report",
+}
+
+
+def _timed(name: str, node: Callable[[AgentState], dict]) -> Callable[[AgentState], dict]:
+    """Aggiunge all'output del nodo il suo tempo di esecuzione in node_timings"""
+    @wraps(node)
+    def wrapper(state: AgentState) -> dict:
+        start = time.perf_counter()
+        update = node(state)
+        return {**update, "node_timings": {name: round(time.perf_counter() - start, 3)}}
+    return wrapper
+
 
 class AgentEngine:
-    def __init__(self):
-        # Inizializziamo il modello LLM
+    """
+    Motore degli agenti. Va creato una volta per processo (vedi get_agent_engine):
+    LLM, tool di ricerca, RAG e grafo compilato sono condivisi tra le richieste.
+    I nodi non modificano l'istanza (tutto lo stato della singola esecuzione è in AgentState),
+    quindi più richieste possono usare lo stesso motore in parallelo.
+    """
+
+    def __init__(self, search_provider: Optional[SearchProvider] = None):
+        # Inizializziamo il modello LLM (pool di connessioni condiviso)
         self.llm = ChatOpenAI(
-            api_key=settings.OPENAI_API_KEY,
+            api_key=settings.require("OPENAI_API_KEY"),
             model="gpt-5-mini-2025-08-07",
-            temperature=0
+            temperature=0,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client()
         )
 
-        # Tool di ricerca web (Tavily)
-        self.search_tool = TavilySearchResults(
-            tavily_api_key=settings.TAVILY_API_KEY,
-            k=3
-        )
+        # Ricerca web (Tavily o sostituto locale) con cache TTL e coalescenza delle richieste identiche:
+        # quella condivisa del processo, oppure una dedicata al provider passato (test, benchmark)
+        if search_provider is None:
+            self.web_search = get_web_search()
+        else:
+            self.web_search = CachedSearch(
+                search_provider,
+                max_items=settings.WEB_SEARCH_CACHE_SIZE,
+                ttl_seconds=settings.WEB_SEARCH_CACHE_TTL_SECONDS
+            )
 
         # ✅ RAG interno (repo indicizzato in Chroma)
         self.rag = RAGService(
@@ -58,6 +102,17 @@ class AgentEngine:
             top_k=settings.RAG_TOP_K
         )
 
+        # Grafo compilato una volta sola: ogni invoke parte da uno stato nuovo
+        self.graph = self.build_graph()
+
+    def _llm_for(self, node: str):
+        """Modello del nodo: con la cache delle risposte se il nodo è in LLM_CACHE_NODES"""
+        cache = get_llm_cache(node)
+        if cache is None:
+            return self.llm
+        # Copia superficiale: stessi client HTTP, cambia solo la cache consultata da invoke
+        return self.llm.model_copy(update={"cache": cache})
+
     # --- 2. Definizione dei Nodi (Gli Agenti) ---
 
     def analyst_node(self, state: AgentState):
@@ -68,7 +123,7 @@ class AgentEngine:
             ("system", ANALYST_SYSTEM_PROMPT),
             ("user", "Ecco le metriche finanziarie: {metrics}")
         ])
-        chain = prompt | self.llm | StrOutputParser()
+        chain = prompt | self._llm_for("analyst") | StrOutputParser()
 
         metrics_str = str(state["financial_metrics"])
         result = chain.invoke({"metrics": metrics_str})
@@ -130,7 +185,7 @@ class AgentEngine:
             )
         ])
 
-        chain = prompt | self.llm | StrOutputParser()
+        chain = prompt | self._llm_for("internal_researcher") | StrOutputParser()
         out = chain.invoke({"q": user_q or "(nessuna domanda fornita)", "ev": evidence})
 
         return {
@@ -139,30 +194,31 @@ class AgentEngine:
         }
 
     def researcher_node(self, state: AgentState):
-        """Il Ricercatore usa Tavily per cercare news"""
+        """Il Ricercatore cerca news sul web (Tavily, con cache dei risultati)"""
         print(f"   ... 🌍 Ricercatore sta scansionando il web per {state['client_name']} ...")
 
         query = f"Latest business news and financial trends for {state['client_name']} in {state['sector']} sector"
 
         try:
-            search_results = self.search_tool.invoke(query)
+            search_results, search_info = self.web_search.search(query)
+            search_info["results"] = len(search_results)
             content = "\n".join([f"- {res['content']} (Fonte: {res['url']})" for res in search_results])
+            if not content:
+                content = "Nessun risultato dalla ricerca web."
         except Exception as e:
+            search_info = {"cache": "error", "error": str(e)}
             content = f"Nessuna news trovata o errore API: {str(e)}"
 
         prompt = ChatPromptTemplate.from_messages([
             ("system", RESEARCHER_SYSTEM_PROMPT),
             ("user", "Ecco i risultati grezzi della ricerca: {raw_data}")
         ])
-        chain = prompt | self.llm | StrOutputParser()
+        chain = prompt | self._llm_for("researcher") | StrOutputParser()
         final_summary = chain.invoke({"raw_data": content})
 
-        return {"researcher_output": final_summary}
-
-    def director_node(self, state: AgentState):
-        """Il Direttore legge tutto e decide"""
-        print("   ... 👔 Il Direttore sta scrivendo la strategia ...")
+        return {"researcher_output": final_summary, "node_metadata": {"researcher": {"web_search": search_info}}}
 
+    def _director_chain(self):
         # Passiamo sia evidenze grezze sia sintesi interna
         prompt = ChatPromptTemplate.from_messages([
             ("system", DIRECTOR_SYSTEM_PROMPT),
@@ -182,9 +238,13 @@ REPORT RICERCATORE (News Esterne):
 {researcher_doc}
             """)
         ])
-        chain = prompt | self.llm | StrOutputParser()
+        return prompt | self._llm_for("director") | StrOutputParser()
+
+    def director_node(self, state: AgentState):
+        """Il Direttore legge tutto e decide"""
+        print("   ... 👔 Il Direttore sta scrivendo la strategia ...")
 
-        final_report = chain.invoke({
+        final_report = self._director_chain().invoke({
             "client": state["client_name"],
             "analyst_doc": state.get("analyst_output") or "",
             "internal_evidence": state.get("internal_research_evidence") or "",
@@ -196,25 +256,31 @@ REPORT RICERCATORE (News Esterne):
 
     # --- 3. Costruzione del Grafo ---
     def build_graph(self):
+        """
+        Fan-out / fan-in: analista, ricerca interna e ricerca web non dipendono l'uno dall'altro
+        e partono insieme (LangGraph li esegue in parallelo nello stesso superstep);
+        il Direttore parte quando tutti e tre hanno finito.
+        """
         workflow = StateGraph(AgentState)
 
-        workflow.add_node("analyst", self.analyst_node)
-        workflow.add_node("internal_researcher", self.internal_researcher_node)
-        workflow.add_node("researcher", self.researcher_node)
-        workflow.add_node("director", self.director_node)
+        branches = {
+            "analyst": self.analyst_node,
+            "internal_researcher": self.internal_researcher_node,
+            "researcher": self.researcher_node,
+        }
+        for name, node in branches.items():
+            workflow.add_node(name, _timed(name, node))
+            workflow.add_edge(START, name)
+        workflow.add_node("director", _timed("director", self.director_node))
 
-        workflow.set_entry_point("analyst")
-        workflow.add_edge("analyst", "internal_researcher")
-        workflow.add_edge("internal_researcher", "researcher")
-        workflow.add_edge("researcher", "director")
+        workflow.add_edge(list(branches), "director")
         workflow.add_edge("director", END)
 
         return workflow.compile()
 
-    def run_analysis(self, client: str, sector: str, metrics: dict, user_question: Optional[str] = None):
-        app = self.build_graph()
-
-        inputs: AgentState = {
+    @staticmethod
+    def _initial_state(client: str, sector: str, metrics: dict, user_question: Optional[str]) -> AgentState:
+        return {
             "client_name": client,
             "sector": sector,
             "financial_metrics": metrics,
@@ -226,10 +292,61 @@ REPORT RICERCATORE (News Esterne):
             "internal_research_evidence": None,
             "internal_research_output": None,
             "researcher_output": None,
-            "final_report": None
+            "final_report": None,
+            "node_timings": {},
+            "node_metadata": {}
         }
 
-        return app.invoke(inputs)
+    def run_analysis(self, client: str, sector: str, metrics: dict, user_question: Optional[str] = None):
+        inputs = self._initial_state(client, sector, metrics, user_question)
+
+        start = time.perf_counter()
+        result = self.graph.invoke(inputs)
+        result["node_timings"] = {**result.get("node_timings", {}), "total": round(time.perf_counter() - start, 3)}
+        return result
+
+    def stream_analysis(
+        self, client: str, sector: str, metrics: dict, user_question: Optional[str] = None
+    ) -> Iterator[Tuple[str, dict]]:
+        """
+        Come run_analysis, ma produce eventi (tipo, dati) man mano che la pipeline avanza:
+        - "start": subito, prima di qualsiasi chiamata (primo byte immediato per il client);
+        - "node": un agente ha finito (nome, secondi, output, metadata del nodo);
+        - "token": frammento del report del Direttore, appena generato dal modello;
+        - "done": stato finale con node_timings (come la risposta di /agent/analyze).
+        Ogni evento riporta "elapsed" (secondi dall'avvio).
+        """
+        inputs = self._initial_state(client, sector, metrics, user_question)
+        state = dict(inputs)
+        start = time.perf_counter()
+        yield "start", {"client_name": client, "nodes": list(_NODE_OUTPUTS), "elapsed": 0.0}
+
+        # "updates": output di ogni nodo al termine; "messages": token dei modelli chiamati nei nodi
+        for mode, chunk in self.graph.stream(inputs, stream_mode=["updates", "messages"]):
+            elapsed = round(time.perf_counter() - start, 3)
+            if mode == "messages":
+                message, metadata = chunk
+                # Solo il Direttore arriva all'utente token per token: gli altri nodi arrivano interi
+                if metadata.get("langgraph_node") == "director" and message.content:
+                    yield "token", {"node": "director", "text": message.content, "elapsed": elapsed}
+                continue
+            for node, update in chunk.items():
+                update = update or {}
+                timings = update.get("node_timings", {})
+                metadata = update.get("node_metadata", {})
+                state.update({k: v for k, v in update.items() if k not in ("node_timings", "node_metadata")})
+                state["node_timings"] = {**state["node_timings"], **timings}
+                state["node_metadata"] = {**state["node_metadata"], **metadata}
+                yield "node", {
+                    "node": node,
+                    "seconds": timings.get(node),
+                    "metadata": metadata.get(node, {}),
+                    "output": update.get(_NODE_OUTPUTS.get(node, ""), None),
+                    "elapsed": elapsed,
+                }
+
+        state["node_timings"]["total"] = round(time.perf_counter() - start, 3)
+        yield "done", {**state, "elapsed": state["node_timings"]["total"]}
 
     def chat_with_director(self, user_question: str, context_report: str):
         """
@@ -239,9 +356,32 @@ REPORT RICERCATORE (News Esterne):
         """
         print(f"   ... 💬 Chat in corso: {user_question} ...")
 
+        chain, inputs, _ = self._chat_chain(user_question, context_report)
+        return chain.invoke(inputs)
+
+    def stream_chat(self, user_question: str, context_report: str) -> Iterator[Tuple[str, dict]]:
+        """chat_with_director in streaming: eventi "rag" (fonti recuperate), "token" e "done" (risposta intera)"""
+        print(f"   ... 💬 Chat in streaming: {user_question} ...")
+        start = time.perf_counter()
+
+        chain, inputs, sources = self._chat_chain(user_question, context_report)
+        yield "rag", {"sources": sources, "elapsed": round(time.perf_counter() - start, 3)}
+
+        parts = []
+        for text in chain.stream(inputs):
+            if text:
+                parts.append(text)
+                yield "token", {"text": text, "elapsed": round(time.perf_counter() - start, 3)}
+        yield "done", {"answer": "".join(parts), "elapsed": round(time.perf_counter() - start, 3)}
+
+    def _chat_chain(self, user_question: str, context_report: str):
+        """Catena del Direttore per la chat, input (con RAG live sulla domanda) e fonti recuperate"""
+        sources: List[str] = []
+
         # ✅ RAG live sulla domanda
         try:
             docs = self.rag.retrieve(user_question)
+            sources = list(dict.fromkeys(d.metadata.get('source', 'unknown') for d in docs))
             if docs:
                 rag_evidence = "\n\n".join(
                     [f"[{d.metadata.get('source','unknown')}]\n{d.page_content}" for d in docs]
@@ -269,9 +409,27 @@ Rispondi in italiano, professionale e sintetico.
         ])
 
         chain = prompt | self.llm | StrOutputParser()
-        response = chain.invoke({"report": context_report, "rag": rag_evidence, "q": user_question})
+        return chain, {"report": context_report, "rag": rag_evidence, "q": user_question}, sources
+
+
+_engine: Optional[AgentEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_agent_engine() -> AgentEngine:
+    """Motore condiviso nel processo, creato alla prima richiesta (o all'avvio dell'API)"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AgentEngine()
+        return _engine
+
 
-        return response
+def reset_agent_engine() -> None:
+    """Rilascia il motore condiviso (shutdown dell'app): il prossimo get_agent_engine ne crea uno nuovo"""
+    global _engine
+    with _engine_lock:
+        _engine = None
 
 
 # Test locale
@@ -0,0 +1,311 @@
+"""
+Backtesting rolling-origin dei motori di forecasting.
+
+Per ogni cliente e per ogni motore il modello viene addestrato su finestre di storico
+crescenti (origine mobile) e valutato sui mesi immediatamente successivi.
+Le fold girano su un pool di processi; i risultati sono salvati per hash dei dati
+usati dalla fold, quindi un nuovo run ricalcola solo le fold i cui dati sono cambiati
+(es. i clienti modificati, o le nuove fold create dall'arrivo di un nuovo mese).
+
+Uso:
+    python -m app.services.backtesting --engines prophet holt_winters --horizon 6
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import as_completed
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.engines import AVAILABLE_ENGINES, get_engine
+from app.services.forecasting import ForecastingService, process_pool
+from app.services.model_cache import hash_dataframe
+
+
+def _fold_metrics(actual: np.ndarray, forecast: pd.DataFrame) -> Dict[str, Optional[float]]:
+    """
+    MAPE, sMAPE e copertura dell'intervallo yhat_lower/yhat_upper sui mesi di test.
+    MAPE è None se tutti i valori reali sono zero (non definito): niente NaN nella risposta JSON.
+    """
+    yhat = forecast["yhat"].to_numpy()
+    lower = forecast["yhat_lower"].to_numpy()
+    upper = forecast["yhat_upper"].to_numpy()
+
+    abs_err = np.abs(actual - yhat)
+    nonzero = actual != 0
+    mape = round(float(np.mean(abs_err[nonzero] / np.abs(actual[nonzero])) * 100), 4) if nonzero.any() else None
+    denom = np.abs(actual) + np.abs(yhat)
+    smape = float(np.mean(np.where(denom == 0, 0.0, 2 * abs_err / np.where(denom == 0, 1, denom))) * 100)
+    coverage = float(np.mean((actual >= lower) & (actual <= upper)))
+
+    return {"mape": mape, "smape": round(smape, 4), "coverage": round(coverage, 4)}
+
+
+def _run_fold(engine: str, train: pd.DataFrame, actual: np.ndarray, horizon: int) -> Dict[str, Any]:
+    """
+    Una fold: fit sul train, previsione di `horizon` mesi, confronto con i valori reali.
+    A livello di modulo per poter essere eseguita nei processi del pool.
+    """
+    try:
+        if engine == "prophet":
+            start = time.perf_counter()
+            model = ForecastingService.fit_model(train)
+            fit_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            future = model.make_future_dataframe(periods=horizon, freq="M")
+            forecast = model.predict(future)
+            predict_seconds = time.perf_counter() - start
+        else:
+            # I motori NumPy fanno fit e predizione in un'unica passata: il tempo finisce tutto in fit
+            start = time.perf_counter()
+            forecast = get_engine(engine).forecast(train, horizon)
+            fit_seconds = time.perf_counter() - start
+            predict_seconds = 0.0
+
+        result = _fold_metrics(actual, forecast.tail(horizon))
+        result.update({
+            "status": "ok",
+            "fit_seconds": round(fit_seconds, 6),
+            "predict_seconds": round(predict_seconds, 6),
+        })
+        return result
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+
+# Condiviso da tutte le istanze: ogni richiesta /backtest crea il proprio BacktestService
+_save_lock = threading.Lock()
+
+
+class BacktestCache:
+    """
+    Risultati delle fold su disco, un file JSON per (motore, orizzonte).
+    La chiave di fold contiene l'hash dei dati di train + test della fold: la versione
+    del dataset è implicita e le fold con dati invariati non vengono ricalcolate.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def fold_key(fold_data: pd.DataFrame, cutoff: int) -> str:
+        return f"{hash_dataframe(fold_data)[:16]}:{cutoff}"
+
+    def _path(self, engine: str, horizon: int) -> str:
+        return os.path.join(self.cache_dir, f"{engine}_h{horizon}.json")
+
+    def load(self, engine: str, horizon: int) -> Dict[str, Dict[str, Any]]:
+        path = self._path(engine, horizon)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, engine: str, horizon: int, new_folds: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Aggiunge le fold calcolate al file: rilettura e scrittura avvengono sotto lo stesso lock,
+        così due backtest concorrenti non si sovrascrivono a vicenda le fold nuove.
+        """
+        if not new_folds:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(engine, horizon)
+        with _save_lock:
+            folds = self.load(engine, horizon)
+            folds.update(new_folds)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(folds, f)
+            os.replace(tmp_path, path)
+
+
+class BacktestService:
+    """Cross-validation rolling-origin di tutti i clienti del dataset, per uno o più motori"""
+
+    def __init__(self, forecasting: Optional[ForecastingService] = None, cache_dir: Optional[str] = None):
+        self.forecasting = forecasting or ForecastingService()
+        self.cache = BacktestCache(cache_dir or settings.BACKTEST_CACHE_DIR)
+
+    @staticmethod
+    def cutoffs(n_points: int, horizon: int, initial: int, period: int) -> List[int]:
+        """Indici di fine train di ogni fold (il test sono gli `horizon` punti successivi)"""
+        return list(range(initial, n_points - horizon + 1, period))
+
+    def run(
+        self,
+        engines: List[str],
+        clients: Union[List[str], str] = "all",
+        horizon: int = 6,
+        initial: int = 30,
+        period: int = 3,
+        max_workers: Optional[int] = None,
+        include_folds: bool = False,
+    ) -> Dict[str, Any]:
+        for engine in engines:
+            if engine not in AVAILABLE_ENGINES:
+                raise ValueError(f"Motore di forecasting sconosciuto: {engine}")
+        if clients == "all":
+            clients = self.forecasting.list_clients()
+
+        dataset = self.forecasting.dataset
+        start = time.perf_counter()
+
+        # 1. Pianificazione: tutte le fold, separando quelle già in cache
+        cached = {engine: self.cache.load(engine, horizon) for engine in engines}
+        folds: List[Dict[str, Any]] = []
+        pending: List[Dict[str, Any]] = []
+        client_errors: Dict[str, str] = {}
+        for client in clients:
+            try:
+                df = self.forecasting._prepare_data(client)
+            except ValueError as e:
+                client_errors[client] = str(e)
+                continue
+            for cutoff in self.cutoffs(len(df), horizon, initial, period):
+                key = self.cache.fold_key(df.iloc[:cutoff + horizon], cutoff)
+                for engine in engines:
+                    fold = {"client_name": client, "engine": engine, "cutoff": cutoff,
+                            "cutoff_date": str(pd.Timestamp(df["ds"].iloc[cutoff - 1]).date()), "_key": key}
+                    if key in cached[engine] and cached[engine][key].get("status") == "ok":
+                        fold.update(cached[engine][key], cached=True)
+                    else:
+                        fold["_train"] = df.iloc[:cutoff]
+                        fold["_actual"] = df["y"].iloc[cutoff:cutoff + horizon].to_numpy()
+                        pending.append(fold)
+                    folds.append(fold)
+
+        # 2. Esecuzione delle fold mancanti sul pool di processi
+        workers = max_workers or settings.FORECAST_MAX_WORKERS or os.cpu_count() or 1
+        workers = max(1, min(workers, len(pending) or 1))
+        if workers == 1:
+            for fold in pending:
+                fold.update(_run_fold(fold["engine"], fold["_train"], fold["_actual"], horizon), cached=False)
+        else:
+            with process_pool(workers) as pool:
+                futures = {
+                    pool.submit(_run_fold, fold["engine"], fold["_train"], fold["_actual"], horizon): fold
+                    for fold in pending
+                }
+                for future in as_completed(futures):
+                    fold = futures[future]
+                    try:
+                        fold.update(future.result(), cached=False)
+                    except Exception as e:
+                        fold.update({"status": "error", "error": str(e)}, cached=False)
+
+        # 3. Aggiornamento della cache con le fold appena calcolate
+        for engine in engines:
+            self.cache.save(engine, horizon, {
+                fold["_key"]: {
+                    k: v for k, v in fold.items()
+                    if k in ("status", "mape", "smape", "coverage", "fit_seconds", "predict_seconds")
+                }
+                for fold in pending if fold["engine"] == engine and fold.get("status") == "ok"
+            })
+
+        for fold in folds:
+            for private in ("_key", "_train", "_actual"):
+                fold.pop(private, None)
+
+        report = {
+            "dataset_version": dataset.version,
+            "horizon": horizon,
+            "initial": initial,
+            "period": period,
+            "workers": workers,
+            "folds_total": len(folds),
+            "folds_computed": len(pending),
+            "folds_cached": len(folds) - len(pending),
+            "total_seconds": round(time.perf_counter() - start, 3),
+            "summary": _aggregate(folds, ["engine"]),
+            "per_client": _aggregate(folds, ["engine", "client_name"]),
+            "client_errors": client_errors,
+        }
+        if include_folds:
+            report["folds"] = folds
+        return report
+
+
+def _aggregate(folds: List[Dict[str, Any]], by: List[str]) -> List[Dict[str, Any]]:
+    """Medie di accuratezza e tempi per gruppo (motore, o motore + cliente)"""
+    if not folds:
+        return []
+    df = pd.DataFrame(folds)
+    if "status" not in df:
+        return []
+    ok = df[df["status"] == "ok"].copy()
+    for col in ("mape", "smape", "coverage", "fit_seconds", "predict_seconds"):
+        if col in ok:
+            # MAPE None (valori reali tutti a zero) -> NaN, ignorato dalla media
+            ok[col] = pd.to_numeric(ok[col], errors="coerce")
+    errors = df[df["status"] != "ok"].groupby(by).size().rename("folds_failed")
+    if ok.empty:
+        return errors.reset_index().to_dict(orient="records")
+
+    grouped = ok.groupby(by).agg(
+        folds=("mape", "size"),
+        mape=("mape", "mean"),
+        smape=("smape", "mean"),
+        coverage=("coverage", "mean"),
+        fit_seconds=("fit_seconds", "mean"),
+        predict_seconds=("predict_seconds", "mean"),
+    )
+    grouped = grouped.join(errors, how="outer").fillna({"folds": 0, "folds_failed": 0})
+    grouped = grouped.round({"mape": 3, "smape": 3, "coverage": 3, "fit_seconds": 6, "predict_seconds": 6})
+    records = grouped.reset_index().to_dict(orient="records")
+    for r in records:
+        r["folds"], r["folds_failed"] = int(r["folds"]), int(r["folds_failed"])
+        # Gruppi con sole fold in errore (join esterno) o MAPE non definito: None, non NaN
+        # (la risposta JSON di Starlette rifiuta i NaN)
+        for k, v in r.items():
+            if isinstance(v, float) and np.isnan(v):
+                r[k] = None
+    return records
+
+
+if __name__ == "__main__":
+    import logging
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Backtesting rolling-origin dei motori di forecasting")
+    parser.add_argument("--data", default=None, help="Default: versione attiva del dataset")
+    parser.add_argument("--engines", nargs="+", default=AVAILABLE_ENGINES, choices=AVAILABLE_ENGINES)
+    parser.add_argument("--clients", nargs="*", default=None, help="Default: tutti i clienti")
+    parser.add_argument("--horizon", type=int, default=6)
+    parser.add_argument("--initial", type=int, default=30)
+    parser.add_argument("--period", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Salva il report completo in JSON")
+    args = parser.parse_args()
+
+    service = BacktestService(ForecastingService(args.data))
+    report = service.run(
+        args.engines, args.clients or "all", args.horizon, args.initial, args.period,
+        args.workers, include_folds=bool(args.output),
+    )
+
+    print(f"🧪 Backtest (dataset {report['dataset_version']}): {report['folds_total']} fold "
+          f"({report['folds_computed']} calcolate, {report['folds_cached']} da cache) in {report['total_seconds']}s")
+    print(f"{'Motore':<16}{'Fold':>6}{'MAPE %':>10}{'sMAPE %':>10}{'Cover.':>8}{'Fit (s)':>10}{'Pred (s)':>10}")
+    def _num(row, key):
+        value = row.get(key)
+        return float("nan") if value is None else value
+
+    for row in report["summary"]:
+        print(f"{row['engine']:<16}{row['folds']:>6}{_num(row, 'mape'):>10.2f}"
+              f"{_num(row, 'smape'):>10.2f}{_num(row, 'coverage'):>8.2f}"
+              f"{_num(row, 'fit_seconds'):>10.4f}{_num(row, 'predict_seconds'):>10.4f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"✅ Report salvato in {args.output}")
@@ -0,0 +1,256 @@
+"""
+Embedding con cache su disco e chiamate in batch concorrenti.
+
+- CachedEmbeddings avvolge un qualunque backend LangChain (OpenAI o locale): ogni testo viene
+  embeddato una volta sola per modello, chiave (modello, sha256 del testo), vettori float32 in SQLite.
+  La cache è condivisa tra indicizzazione e retrieval e sopravvive ai riavvii.
+- I testi mancanti vengono divisi in batch e inviati con concorrenza limitata.
+- HashingEmbeddings è un backend locale deterministico (feature hashing di parole e bigrammi):
+  nessuna rete né chiave API, utile per benchmark e sviluppo offline.
+"""
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+
+EMBEDDING_BACKENDS = ["openai", "local"]
+# Parametri per ogni statement IN (...): sotto il limite delle versioni vecchie di SQLite
+_SQL_CHUNK = 500
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Backend locale: parole e bigrammi (minuscoli) proiettati su `dim` componenti con segno
+    dato dall'hash, poi normalizzati L2. Coglie solo la sovrapposizione lessicale,
+    ma è deterministico e velocissimo.
+    """
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim or settings.EMBEDDING_LOCAL_DIM
+        self.model_name = f"local-hash-{self.dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vec = np.zeros(self.dim, dtype="float32")
+        for feature in features:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec /= norm
+        return vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class EmbeddingStore:
+    """
+    Vettori su SQLite: una riga per (modello, hash del testo), vettore float32 come BLOB.
+    Oltre max_entries si eliminano le righe usate meno di recente.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL: letture concorrenti tra processi (API e indicizzatore) mentre si scrive
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text_hash TEXT NOT NULL, dim INTEGER NOT NULL,"
+                " vector BLOB NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (model, text_hash))"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")]
+            if "last_used_at" not in columns:
+                # Cache creata prima del limite di dimensione: ultimo uso = data di inserimento
+                self._conn.execute("ALTER TABLE embeddings ADD COLUMN last_used_at REAL NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE embeddings SET last_used_at = created_at")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used_at)")
+            self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(hashes), _SQL_CHUNK):
+                chunk = hashes[i:i + _SQL_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype="float32")
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used_at = ? WHERE model = ? AND text_hash IN ({placeholders})",
+                        [now, model, *chunk],
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[str, np.ndarray]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, created_at, last_used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(model, h, len(v), v.astype("float32").tobytes(), now, now) for h, v in items],
+            )
+            if self.max_entries is not None:
+                excess = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN"
+                        " (SELECT rowid FROM embeddings ORDER BY last_used_at LIMIT ?)",
+                        (excess,),
+                    )
+                    self.evictions += excess
+            self._conn.commit()
+
+    def count(self, model: Optional[str] = None) -> int:
+        with self._lock:
+            if model is None:
+                return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings LangChain con cache su disco davanti al backend.
+    Stesso testo -> stesso vettore (float32) sia da cache sia da backend, anche tra documenti e query.
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        model_name: str,
+        store: Optional[EmbeddingStore] = None,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.base = base
+        self.model_name = model_name
+        self.store = store
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.max_concurrency = max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.backend_calls = 0
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.base.embed_documents(texts)
+        with self._stats_lock:
+            self.backend_calls += 1
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        hashes = [_text_hash(t) for t in texts]
+        # Duplicati nella stessa richiesta (chunk ripetuti tra documenti): un solo embedding
+        unique: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            unique.setdefault(h, t)
+
+        vectors = self.store.get_many(self.model_name, list(unique)) if self.store else {}
+        missing = [h for h in unique if h not in vectors]
+        with self._stats_lock:
+            self.hits += len(unique) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            workers = min(self.max_concurrency, len(batches))
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(lambda b: self._embed_batch([unique[h] for h in b]), batches))
+            else:
+                results = [self._embed_batch([unique[h] for h in b]) for b in batches]
+
+            fresh = [(h, np.asarray(v, dtype="float32")) for b, res in zip(batches, results) for h, v in zip(b, res)]
+            if self.store:
+                self.store.put_many(self.model_name, fresh)
+            vectors.update(fresh)
+
+        return [vectors[h].tolist() for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses, "backend_calls": self.backend_calls}
+
+
+def embedding_model_name(backend: Optional[str] = None) -> str:
+    """Nome del modello usato come chiave della cache e nella configurazione dell'indice"""
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "local":
+        return f"local-hash-{settings.EMBEDDING_LOCAL_DIM}"
+    return settings.EMBEDDING_MODEL
+
+
+def _base_embeddings(backend: str) -> Embeddings:
+    if backend == "local":
+        return HashingEmbeddings()
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=settings.EMBEDDING_MODEL, api_key=settings.require("OPENAI_API_KEY"))
+    raise ValueError(f"Backend di embedding sconosciuto: {backend}. Disponibili: {EMBEDDING_BACKENDS}")
+
+
+_stores: Dict[str, EmbeddingStore] = {}
+_instances: Dict[str, Embeddings] = {}
+_factory_lock = threading.Lock()
+
+
+def get_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """
+    Embeddings condivisi nel processo per il backend richiesto (default: EMBEDDING_BACKEND),
+    con la cache su disco se EMBEDDING_CACHE_ENABLED.
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    with _factory_lock:
+        instance = _instances.get(backend)
+        if instance is None:
+            base = _base_embeddings(backend)
+            store = None
+            if settings.EMBEDDING_CACHE_ENABLED:
+                path = settings.EMBEDDING_CACHE_PATH
+                store = _stores.get(path) or EmbeddingStore(path, settings.EMBEDDING_CACHE_MAX_ENTRIES)
+                _stores[path] = store
+            instance = CachedEmbeddings(base, embedding_model_name(backend), store)
+            _instances[backend] = instance
+        return instance
@@ -0,0 +1,289 @@
+"""
+Motori di forecasting alternativi a Prophet, in puro NumPy.
+
+Pensati per uso interattivo e screening: nessun fit bayesiano, tutti i clienti
+con la stessa lunghezza di storico vengono elaborati insieme come una matrice
+(righe = clienti, colonne = mesi), quindi la latenza resta nell'ordine dei millisecondi.
+
+Ogni motore restituisce un DataFrame con le stesse colonne usate da Prophet
+(ds, yhat, yhat_lower, yhat_upper, trend), storico + orizzonte futuro.
+Le colonne della matrice devono essere mesi consecutivi: lo storico viene prima ordinato e
+ridotto a un valore per mese (vedi monthly_series), qualunque sia l'ordine delle righe nel file.
+"""
+from collections import defaultdict
+from itertools import product
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Stagionalità annuale su dati mensili
+SEASON_LENGTH = 12
+# Quantile normale per un intervallo all'80% (come interval_width di default di Prophet)
+Z_80 = 1.2815515655446004
+
+
+def future_dates(last_ds: pd.Timestamp, months: int) -> pd.DatetimeIndex:
+    """Stesse date future di Prophet.make_future_dataframe(periods=months, freq='M')"""
+    dates = pd.date_range(start=last_ds, periods=months + 1, freq="ME")
+    return dates[dates > last_ds][:months]
+
+
+def monthly_series(ds: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Storico come mesi consecutivi in ordine cronologico: commesse dello stesso mese sommate,
+    0 per i mesi senza commesse. Ogni mese mantiene la sua ultima data (le date future partono da lì,
+    come in Prophet); un mese vuoto è etichettato con il suo ultimo giorno.
+    Il CSV non è garantito ordinato (Prophet riordina da sé, i motori NumPy no).
+    """
+    if len(ds) == 0:
+        raise ValueError("Serie vuota: nessuna commessa da prevedere")
+    ds = np.asarray(ds, dtype="datetime64[ns]")
+    y = np.asarray(y, dtype="float64")
+    month_idx = ds.astype("datetime64[M]").astype("int64")
+    if np.all(np.diff(month_idx) == 1):
+        # Caso comune: già un valore per mese, in ordine
+        return ds, y
+
+    first = month_idx.min()
+    offsets = month_idx - first
+    values = np.bincount(offsets, weights=y)
+    months = np.arange(first, first + len(values)).astype("datetime64[M]")
+    month_ends = ((months + 1).astype("datetime64[D]") - np.timedelta64(1, "D")).astype("datetime64[ns]")
+    last_seen = np.full(len(values), np.iinfo("int64").min)
+    np.maximum.at(last_seen, offsets, ds.astype("int64"))
+    labels = np.where(last_seen == np.iinfo("int64").min, month_ends.astype("int64"), last_seen)
+    return labels.astype("datetime64[ns]"), values
+
+
+class ForecastEngine:
+    """
+    Interfaccia comune dei motori vettoriali.
+    Le sottoclassi implementano _fit_predict su una matrice (n_clienti, n_mesi).
+    """
+    name = "base"
+
+    def fit_predict(self, Y: np.ndarray, months: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Passata vettoriale su serie già allineate (righe = serie, colonne = mesi consecutivi),
+        per chi costruisce la matrice da sé (gerarchia, scenari). Vedi _fit_predict per l'output.
+        """
+        Y = np.asarray(Y, dtype="float64")
+        if Y.ndim != 2:
+            raise ValueError(f"Attesa una matrice (serie, mesi), ricevuto un array con {Y.ndim} dimensioni")
+        return self._fit_predict(Y, months)
+
+    def _fit_predict(self, Y: np.ndarray, months: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Restituisce (fitted, forecast, trend, sigma):
+        - fitted:   (n, T) previsioni one-step-ahead sullo storico
+        - forecast: (n, H) previsioni future
+        - trend:    (n, T + H) componente di fondo (senza stagionalità)
+        - sigma:    (n,) deviazione standard dei residui one-step
+        """
+        raise NotImplementedError
+
+    def forecast(self, df: pd.DataFrame, months: int) -> pd.DataFrame:
+        return self.forecast_many({"_": df}, months)["_"]
+
+    def forecast_many(self, frames: Dict[str, pd.DataFrame], months: int) -> Dict[str, pd.DataFrame]:
+        """Forecast di molti clienti in un colpo: un'unica passata vettoriale per ogni lunghezza di storico"""
+        series = {name: monthly_series(df["ds"].to_numpy(dtype="datetime64[ns]"), df["y"].to_numpy(dtype="float64"))
+                  for name, df in frames.items()}
+        by_length = defaultdict(list)
+        for name, (_, values) in series.items():
+            by_length[len(values)].append(name)
+
+        out: Dict[str, pd.DataFrame] = {}
+        horizon_steps = np.sqrt(np.arange(1, months + 1))
+        future_by_last: Dict[np.datetime64, np.ndarray] = {}
+
+        for length, names in by_length.items():
+            Y = np.vstack([series[n][1] for n in names])
+            fitted, forecast, trend, sigma = self._fit_predict(Y, months)
+
+            # Intervalli: ±z·σ sullo storico, ±z·σ·√h sull'orizzonte futuro
+            yhat = np.hstack([fitted, forecast])
+            half_width = Z_80 * sigma[:, None] * np.hstack([np.ones((1, length)), horizon_steps[None, :]])
+            lower, upper = yhat - half_width, yhat + half_width
+
+            for i, name in enumerate(names):
+                history_ds = series[name][0]
+                # Le date future dipendono solo dall'ultima data: calcolate una volta per valore
+                last_ds = history_ds[-1]
+                if last_ds not in future_by_last:
+                    future_by_last[last_ds] = future_dates(pd.Timestamp(last_ds), months).to_numpy(dtype="datetime64[ns]")
+                out[name] = pd.DataFrame({
+                    "ds": np.concatenate([history_ds, future_by_last[last_ds]]),
+                    "yhat": yhat[i],
+                    "yhat_lower": lower[i],
+                    "yhat_upper": upper[i],
+                    "trend": trend[i],
+                }, copy=False)
+
+        return out
+
+
+def _linear_trend(Y: np.ndarray, months: int) -> np.ndarray:
+    """Retta OLS per ogni riga, estesa sull'orizzonte futuro"""
+    n, T = Y.shape
+    t = np.arange(T, dtype="float64")
+    t_centered = t - t.mean()
+    denom = (t_centered ** 2).sum() or 1.0
+    slope = (Y - Y.mean(axis=1, keepdims=True)) @ t_centered / denom
+    intercept = Y.mean(axis=1) - slope * t.mean()
+    t_all = np.arange(T + months, dtype="float64")
+    return intercept[:, None] + slope[:, None] * t_all[None, :]
+
+
+class SeasonalNaiveEngine(ForecastEngine):
+    """Ogni mese futuro ripete lo stesso mese dell'ultimo anno osservato"""
+    name = "seasonal_naive"
+
+    def _fit_predict(self, Y, months):
+        n, T = Y.shape
+        m = SEASON_LENGTH if T > SEASON_LENGTH else 1
+
+        fitted = np.empty_like(Y)
+        fitted[:, :m] = Y[:, :m]
+        fitted[:, m:] = Y[:, :-m]
+
+        residuals = (Y - fitted)[:, m:]
+        sigma = residuals.std(axis=1) if residuals.shape[1] else np.zeros(n)
+
+        # Ultimo ciclo osservato, ripetuto per tutto l'orizzonte
+        last_cycle = Y[:, T - m:]
+        forecast = last_cycle[:, np.arange(months) % m]
+
+        return fitted, forecast, _linear_trend(Y, months), sigma
+
+
+# Griglie dei parametri di smoothing: la scelta avviene per cliente (minimo SSE one-step)
+_ALPHAS = (0.1, 0.3, 0.5, 0.8)
+_BETAS = (0.01, 0.05, 0.15)
+_GAMMAS = (0.05, 0.2, 0.4)
+
+
+def _smoothing_pass(
+    Y: np.ndarray,
+    alpha: np.ndarray,
+    beta: np.ndarray,
+    gamma: Optional[np.ndarray],
+    m: int,
+    keep_fitted: bool = False,
+):
+    """
+    Una passata di Holt (gamma=None) o Holt-Winters additivo.
+    alpha/beta/gamma hanno shape (n, G): G combinazioni di parametri per cliente,
+    tutte aggiornate insieme a ogni passo temporale.
+    Restituisce sse (n, G), stati finali e, se richiesto, fitted e livelli (T, n, G).
+    Gli array sono organizzati con il tempo sul primo asse: ogni passo legge/scrive memoria contigua.
+    """
+    n, T = Y.shape
+    G = alpha.shape[1]
+    seasonal = gamma is not None
+
+    # Inizializzazione classica: livello e trend dai primi due cicli (o dai primi due punti)
+    if seasonal:
+        first, second = Y[:, :m], Y[:, m:2 * m]
+        level0 = first.mean(axis=1)
+        trend0 = (second.mean(axis=1) - level0) / m
+        season = np.repeat((first - level0[:, None]).T[:, :, None], G, axis=2)  # (m, n, G)
+    else:
+        level0 = Y[:, 0]
+        trend0 = Y[:, 1] - Y[:, 0] if T > 1 else np.zeros(n)
+        season = None
+
+    level = np.repeat(level0[:, None], G, axis=1)
+    trend = np.repeat(trend0[:, None], G, axis=1)
+    sse = np.zeros((n, G))
+    fitted = np.empty((T, n, G)) if keep_fitted else None
+    levels = np.empty((T, n, G)) if keep_fitted else None
+    burn_in = m if seasonal else 1
+    Y_by_time = np.ascontiguousarray(Y.T)
+
+    for t in range(T):
+        y = Y_by_time[t][:, None]
+        s = season[t % m] if seasonal else 0.0
+        pred = level + trend + s
+
+        if t >= burn_in:
+            sse += (y - pred) ** 2
+
+        new_level = alpha * (y - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+        if seasonal:
+            season[t % m] = gamma * (y - level) + (1 - gamma) * s
+
+        if keep_fitted:
+            fitted[t] = pred
+            levels[t] = level
+
+    return sse, level, trend, season, fitted, levels
+
+
+class _SmoothingEngine(ForecastEngine):
+    seasonal = False
+
+    def _fit_predict(self, Y, months):
+        n, T = Y.shape
+        m = SEASON_LENGTH
+        seasonal = self.seasonal and T >= 2 * m
+        rows = np.arange(n)
+
+        # 1. Grid search vettoriale: tutte le combinazioni per tutti i clienti in una passata
+        grid = list(product(_ALPHAS, _BETAS, _GAMMAS if seasonal else (None,)))
+        alpha = np.tile([g[0] for g in grid], (n, 1))
+        beta = np.tile([g[1] for g in grid], (n, 1))
+        gamma = np.tile([g[2] for g in grid], (n, 1)) if seasonal else None
+        sse, *_ = _smoothing_pass(Y, alpha, beta, gamma, m)
+        best = sse.argmin(axis=1)
+
+        # 2. Passata finale con i parametri scelti, conservando fitted e livelli
+        pick = lambda p: p[rows, best][:, None] if p is not None else None
+        sse, level, trend, season, fitted, levels = _smoothing_pass(
+            Y, pick(alpha), pick(beta), pick(gamma), m, keep_fitted=True
+        )
+        level, trend = level[:, 0], trend[:, 0]
+        fitted, levels = fitted[:, :, 0].T, levels[:, :, 0].T
+
+        burn_in = m if seasonal else 1
+        sigma = np.sqrt(sse[:, 0] / max(T - burn_in, 1))
+
+        # 3. Proiezione: livello + h·trend (+ stagionalità del mese corrispondente)
+        h = np.arange(1, months + 1)
+        future_trend = level[:, None] + h[None, :] * trend[:, None]
+        forecast = future_trend.copy()
+        if seasonal:
+            forecast += season[(T + h - 1) % m, :, 0].T
+
+        return fitted, forecast, np.hstack([levels, future_trend]), sigma
+
+
+class HoltEngine(_SmoothingEngine):
+    """ETS(A,A,N): livello + trend additivo, senza stagionalità"""
+    name = "ets"
+    seasonal = False
+
+
+class HoltWintersEngine(_SmoothingEngine):
+    """ETS(A,A,A) / Holt-Winters additivo con stagionalità annuale"""
+    name = "holt_winters"
+    seasonal = True
+
+
+ENGINES: Dict[str, ForecastEngine] = {
+    engine.name: engine
+    for engine in (HoltWintersEngine(), SeasonalNaiveEngine(), HoltEngine())
+}
+
+# "prophet" è gestito direttamente da ForecastingService (fit bayesiano + cache dei modelli)
+AVAILABLE_ENGINES = ["prophet"] + list(ENGINES)
+
+
+def get_engine(name: str) -> ForecastEngine:
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Motore di forecasting sconosciuto: {name}. Disponibili: {', '.join(AVAILABLE_ENGINES)}")
@@ -0,0 +1,245 @@
+"""
+Store materializzato dei forecast + scheduler di precalcolo.
+
+Lo scheduler ricalcola tutti i clienti quando il dataset cambia (o a intervalli regolari)
+e scrive metriche e forecast_data già tagliato nello store: le richieste /forecast
+delle 9 del mattino diventano una lettura invece di un fit Prophet ciascuna.
+
+Può girare dentro il processo API (avviato dal lifespan di FastAPI) oppure come worker separato:
+    python -m app.services.forecast_store
+"""
+import os
+import json
+import hashlib
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.core.config import settings
+from app.data.dataset_registry import dataset_registry
+from app.data.ingestion import active_dataset_path
+from app.services.forecasting import ForecastingService
+
+logger = logging.getLogger(__name__)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _serializable_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Date in ISO 8601 (stesso formato che FastAPI produce per i Timestamp)"""
+    out = []
+    for r in records:
+        r = dict(r)
+        if isinstance(r.get("ds"), (pd.Timestamp, datetime)):
+            r["ds"] = r["ds"].isoformat()
+        out.append(r)
+    return out
+
+
+class ForecastStore:
+    """
+    Forecast materializzati, una cartella per (motore, orizzonte) con un file JSON per cliente:
+    scrivere il forecast di un cliente non riscrive quelli degli altri.
+    Ogni entry ricorda l'hash della serie del cliente con cui è stata calcolata:
+    se i dati del cliente cambiano l'entry diventa stale anche prima della scadenza.
+    """
+
+    def __init__(self, store_dir: str, max_age_seconds: int):
+        self.store_dir = store_dir
+        self.max_age_seconds = max_age_seconds
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _dir(self, engine: str, months: int) -> str:
+        return os.path.join(self.store_dir, f"{engine}_m{months}")
+
+    def _path(self, client_name: str, months: int, engine: str) -> str:
+        # Nome file dall'hash: i nomi dei clienti possono contenere caratteri non validi nei path
+        digest = hashlib.sha1(client_name.encode("utf-8")).hexdigest()
+        return os.path.join(self._dir(engine, months), f"{digest}.json")
+
+    def _load(self, path: str) -> Optional[Dict[str, Any]]:
+        """Entry dal disco, riletta solo se il file è stato riscritto (es. da un worker separato)"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self._entries.pop(path, None)
+            return None
+
+        cached = self._entries.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._entries[path] = (mtime, entry)
+        return entry
+
+    def _save(self, path: str, entry: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        self._entries[path] = (os.path.getmtime(path), entry)
+
+    def get(self, client_name: str, months: int, engine: str = "prophet") -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load(self._path(client_name, months, engine))
+
+    def is_fresh(self, entry: Dict[str, Any], series_hash: Optional[str]) -> bool:
+        if series_hash is None or entry.get("series_hash") != series_hash:
+            return False
+        computed_at = datetime.fromisoformat(entry["computed_at"])
+        age = (datetime.now(timezone.utc) - computed_at).total_seconds()
+        return age <= self.max_age_seconds
+
+    def stale_clients(self, months: int, engine: str, series_hashes: Dict[str, str]) -> List[str]:
+        """Clienti senza entry o con entry scaduta / calcolata su dati diversi"""
+        stale = []
+        for client, series_hash in series_hashes.items():
+            entry = self.get(client, months, engine)
+            if entry is None or not self.is_fresh(entry, series_hash):
+                stale.append(client)
+        return stale
+
+    def put_many(self, months: int, engine: str, entries: Dict[str, Dict[str, Any]]) -> None:
+        """entries: cliente -> {metrics, forecast_data, series_hash, dataset_version}"""
+        computed_at = _now_iso()
+        with self._lock:
+            for client, entry in entries.items():
+                self._save(self._path(client, months, engine), {
+                    "client_name": client,
+                    "metrics": entry["metrics"],
+                    "forecast_data": _serializable_records(entry["forecast_data"]),
+                    "series_hash": entry["series_hash"],
+                    "dataset_version": entry["dataset_version"],
+                    "computed_at": computed_at,
+                })
+
+    def put(self, client_name: str, months: int, engine: str, entry: Dict[str, Any]) -> None:
+        self.put_many(months, engine, {client_name: entry})
+
+
+forecast_store = ForecastStore(settings.FORECAST_STORE_DIR, settings.FORECAST_STORE_MAX_AGE_SECONDS)
+
+
+def refresh_store(data_path: Optional[str] = None, stop: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    Ricalcola i clienti con entry mancante o non fresca e li scrive nello store.
+    Se sono tutti freschi non parte nessun fit (e nessun pool di processi).
+    stop interrompe il batch (vedi generate_batch_forecast): i clienti già calcolati vengono salvati.
+    Restituisce il riepilogo del batch.
+    """
+    service = ForecastingService(data_path)
+    months = settings.FORECAST_STORE_MONTHS
+    engine = settings.FORECAST_STORE_ENGINE
+
+    stale = forecast_store.stale_clients(months, engine, service.dataset.series_hashes)
+    skipped = len(service.dataset.series_hashes) - len(stale)
+    if not stale:
+        return {"months": months, "engine": engine, "workers": 0, "succeeded": 0, "failed": 0,
+                "skipped": skipped, "total_seconds": 0.0}
+
+    batch = service.generate_batch_forecast(stale, months, engine=engine, stop=stop)
+    entries = {
+        r["client_name"]: {
+            "metrics": r["metrics"],
+            "forecast_data": r["forecast_data"],
+            "series_hash": service.dataset.series_hashes[r["client_name"]],
+            "dataset_version": service.dataset.version,
+        }
+        for r in batch["results"] if r["status"] == "ok"
+    }
+    forecast_store.put_many(months, engine, entries)
+
+    return {**{k: v for k, v in batch.items() if k != "results"}, "skipped": skipped}
+
+
+class ForecastPrecomputer:
+    """
+    Scheduler in background: controlla periodicamente la versione del dataset e
+    rigenera lo store quando cambia o quando è passato FORECAST_REFRESH_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, data_path: Optional[str] = None):
+        # None = segue la versione attiva del dataset (cambia dopo ogni upload)
+        self.data_path = data_path
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_version: Optional[str] = None
+        self.last_run_at: float = 0.0
+        self.last_summary: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="forecast-precomputer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Annulla i fit non ancora partiti del batch in corso; si attendono solo quelli già sui worker"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def trigger(self) -> None:
+        """Forza un controllo immediato (es. dopo un upload di dati)"""
+        self._wakeup.set()
+
+    def run_once(self) -> bool:
+        """Rigenera lo store se serve. True se è stato eseguito un refresh."""
+        data_path = self.data_path or active_dataset_path()
+        version = dataset_registry.get(data_path).version
+        expired = time.time() - self.last_run_at >= settings.FORECAST_REFRESH_INTERVAL_SECONDS
+        if version == self.last_version and not expired:
+            return False
+
+        logger.info("Precalcolo forecast (dataset %s) ...", version)
+        self.last_summary = refresh_store(data_path, stop=self._stop)
+        if self._stop.is_set():
+            logger.info("Precalcolo interrotto dallo shutdown: %s clienti salvati", self.last_summary["succeeded"])
+            return True
+        self.last_version = version
+        self.last_run_at = time.time()
+        logger.info("Store aggiornato: %s clienti in %ss (%s già freschi)", self.last_summary["succeeded"],
+                    self.last_summary["total_seconds"], self.last_summary["skipped"])
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # Lo scheduler non deve mai morire: le richieste ricadono sul fit on-demand
+                logger.exception("Precalcolo forecast fallito")
+            self._wakeup.wait(settings.FORECAST_REFRESH_POLL_SECONDS)
+            self._wakeup.clear()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+
+    precomputer = ForecastPrecomputer()
+    logger.info("Worker di precalcolo avviato (CTRL+C per uscire)")
+    try:
+        while True:
+            try:
+                precomputer.run_once()
+            except Exception:
+                logger.exception("Precalcolo forecast fallito")
+            time.sleep(settings.FORECAST_REFRESH_POLL_SECONDS)
+    except KeyboardInterrupt:
+        logger.info("Worker fermato")
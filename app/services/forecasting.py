@@ -1,9 +1,51 @@
+import os
+import time
+import threading
+import multiprocessing
+import numpy as np
 import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from prophet import Prophet
 from prophet.plot import plot_plotly
 import json
 import plotly.graph_objects as go
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.data.dataset_registry import dataset_registry
+from app.data.ingestion import active_dataset_path
+from app.services.engines import get_engine
+from app.services.model_cache import model_cache, hash_dataframe
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Pool di processi per i fit. Avvio "spawn" invece del fork di default su Linux: il processo API
+    ha thread (richieste, precalcolo) e pool HTTP/SQLite attivi, e un figlio creato con fork può
+    ereditare un lock tenuto da un altro thread (logging, registry, cache dei modelli) e bloccarsi.
+    I worker restano funzioni di modulo, importabili dal processo figlio.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def warm_start_params(model: Prophet) -> Dict[str, Any]:
+    """
+    Parametri Stan (k, m, delta, beta, sigma_obs) di un modello già addestrato,
+    nel formato accettato da Prophet.fit(df, init=...).
+    Se le shape non coincidono (es. numero di changepoint diverso) Prophet usa i default.
+    """
+    params = {}
+    for name in ["k", "m", "sigma_obs"]:
+        if model.mcmc_samples == 0:
+            params[name] = model.params[name][0][0]
+        else:
+            params[name] = np.mean(model.params[name])
+    for name in ["delta", "beta"]:
+        if model.mcmc_samples == 0:
+            params[name] = model.params[name][0]
+        else:
+            params[name] = np.mean(model.params[name], axis=0)
+    return params
+
 
 class ForecastingService:
     """
@@ -11,76 +53,115 @@ class ForecastingService:
     Incapsula la logica di Facebook Prophet per renderla agnostica all'UI.
     """
 
-    def __init__(self, data_path: str = "app/data/storico_commesse.csv"):
-        self.data_path = data_path
-        # Carichiamo il dataset una volta sola all'inizializzazione
-        self.raw_df = pd.read_csv(data_path)
+    # Configurazione del modello (fa parte della chiave di cache)
+    # yearly_seasonality=True forza Prophet a cercare pattern annuali
+    MODEL_CONFIG = {
+        "yearly_seasonality": True,
+        "daily_seasonality": False,
+        "weekly_seasonality": False,
+    }
 
-    def _prepare_data(self, client_name: str) -> pd.DataFrame:
-        """Filtra i dati per cliente e li formatta per Prophet (ds, y)"""
-        
-        # Filtriamo per cliente
-        df_client = self.raw_df[self.raw_df["cliente"] == client_name].copy()
+    def __init__(self, data_path: Optional[str] = None):
+        # Senza path esplicito si usa la versione attiva del dataset (ultimo upload o CSV di default)
+        self.data_path = data_path or active_dataset_path()
+        # Il dataset è letto una volta per processo dal registry (ricaricato solo se il file cambia)
+        self.dataset = dataset_registry.get(self.data_path)
+
+    @property
+    def raw_df(self) -> pd.DataFrame:
+        # Con il backend colonnare carica l'intero dataset: evitare nei percorsi caldi
+        return self.dataset.raw_df
+
+    def _prepare_data(self, client_name: str, start=None, end=None) -> pd.DataFrame:
+        """Restituisce la serie del cliente nel formato Prophet (ds, y), opzionalmente in [start, end]"""
         
-        if df_client.empty:
+        # Lookup su dizionario (backend in memoria) o lettura dei soli row group del cliente (colonnare)
+        try:
+            return self.dataset.client_frame(client_name, start, end)
+        except KeyError:
             raise ValueError(f"Nessun dato trovato per il cliente: {client_name}")
 
-        # Prophet vuole tassativamente due colonne: 'ds' (data) e 'y' (valore)
-        df_prophet = df_client[["data_commessa", "fatturato"]].rename(
-            columns={"data_commessa": "ds", "fatturato": "y"}
-        )
-        
-        return df_prophet
+    @classmethod
+    def fit_model(cls, df: pd.DataFrame, warm_from: Optional[Prophet] = None) -> Prophet:
+        """
+        Addestra un nuovo Prophet sui dati.
+        Con warm_from, Stan parte dai parametri del modello precedente invece che dai default:
+        aggiungere un mese di storico costa una frazione di un fit a freddo.
+        """
+        model = Prophet(**cls.MODEL_CONFIG)
+        if warm_from is not None:
+            model.fit(df, init=warm_start_params(warm_from))
+        else:
+            model.fit(df)
+        return model
 
-    def generate_forecast(self, client_name: str, months: int = 12) -> Dict[str, Any]:
+    def _get_fitted_model(
+        self, client_name: str, df: pd.DataFrame, months: int, incremental: bool = False
+    ) -> Prophet:
         """
-        Esegue il training on-the-fly e genera la predizione.
+        Restituisce un modello addestrato sui dati correnti del cliente.
+        Se la cache ha già un modello per (cliente, dati, config, orizzonte) si salta il fit.
+        In modalità incrementale, un modello addestrato sulla versione precedente dei dati
+        viene usato per il warm start.
+        """
+        data_hash = self.dataset.series_hashes.get(client_name) or hash_dataframe(df)
+        key = model_cache.make_key(client_name, data_hash, self.MODEL_CONFIG, months)
+
+        model = model_cache.get(key)
+        if model is None:
+            previous = model_cache.find_previous(key) if incremental else None
+            model = self.fit_model(df, warm_from=previous)
+            model_cache.put(key, model)
+
+        return model
+
+    def generate_forecast(
+        self,
+        client_name: str,
+        months: int = 12,
+        include_plot: bool = True,
+        incremental: Optional[bool] = None,
+        engine: str = "prophet",
+    ) -> Dict[str, Any]:
+        """
+        Esegue il training (o lo recupera dalla cache) e genera la predizione.
+        engine: "prophet" (default) oppure uno dei motori NumPy di app.services.engines.
+        incremental=None usa FORECAST_WARM_START dalle settings (solo Prophet).
         Restituisce un dizionario con:
-        - Il grafico Plotly (oggetto JSON)
+        - Il grafico Plotly (oggetto JSON), None se include_plot=False
         - I KPI numerici (per l'Agente AI)
         """
+        if incremental is None:
+            incremental = settings.FORECAST_WARM_START
         
         # 1. Preparazione Dati
         df = self._prepare_data(client_name)
         
-        # 2. Configurazione Modello
-        # yearly_seasonality=True forza Prophet a cercare pattern annuali
-        model = Prophet(yearly_seasonality=True, daily_seasonality=False, weekly_seasonality=False)
-        
-        # 3. Training
-        model.fit(df)
-        
-        # 4. Predizione
-        future = model.make_future_dataframe(periods=months, freq='M')
-        forecast = model.predict(future)
+        model = None
+        if engine == "prophet":
+            # 2-3. Configurazione e Training (predict-only se il modello è in cache)
+            model = self._get_fitted_model(client_name, df, months, incremental=incremental)
+            
+            # 4. Predizione
+            future = model.make_future_dataframe(periods=months, freq='M')
+            forecast = model.predict(future)
+        else:
+            # 2-4. Motore vettoriale: fit e predizione in un'unica chiamata (millisecondi)
+            forecast = get_engine(engine).forecast(df, months)
         
         # 5. Estrazione KPI per l'IA (Analista Quantitativo)
-        # Prendiamo gli ultimi 12 mesi storici e i 12 predetti
-        last_history_val = df['y'].iloc[-12:].sum()
-        predicted_val = forecast['yhat'].iloc[-months:].sum()
-        
-        growth_pct = ((predicted_val - last_history_val) / last_history_val) * 100
-        
-        # Trend dell'ultimo mese previsto
-        trend_direction = "Crescente" if forecast['trend'].iloc[-1] > forecast['trend'].iloc[0] else "Decrescente"
-
-        kpi_metrics = {
-            "storico_ultimo_anno": round(last_history_val, 2),
-            "previsione_prossimo_anno": round(predicted_val, 2),
-            "crescita_percentuale": round(growth_pct, 2),
-            "trend_di_fondo": trend_direction,
-            "confidenza_min": round(forecast['yhat_lower'].iloc[-1], 2), # Worst case
-            "confidenza_max": round(forecast['yhat_upper'].iloc[-1], 2)  # Best case
-        }
+        kpi_metrics = compute_kpi_metrics(df['y'], forecast, months)
 
-        # 6. Generazione Grafico Interattivo
-        fig = plot_plotly(model, forecast)
-        fig.update_layout(
-            title=f"Forecast Fatturato: {client_name}",
-            xaxis_title="Data",
-            yaxis_title="Fatturato (€)",
-            template="plotly_white"
-        )
+        # 6. Generazione Grafico Interattivo (saltata nei batch: costa e non serve alle API)
+        fig = None
+        if include_plot:
+            fig = plot_plotly(model, forecast) if model is not None else plot_forecast(df, forecast)
+            fig.update_layout(
+                title=f"Forecast Fatturato: {client_name}",
+                xaxis_title="Data",
+                yaxis_title="Fatturato (€)",
+                template="plotly_white"
+            )
 
         return {
             "plot": fig,        # Oggetto grafico per Streamlit
@@ -88,6 +169,212 @@ class ForecastingService:
             "raw_forecast": forecast # DataFrame completo (opzionale)
         }
 
+    @staticmethod
+    def forecast_records(forecast: pd.DataFrame, months: int) -> List[Dict[str, Any]]:
+        """Ultimi 12 mesi storici + orizzonte previsto, nel formato usato dal frontend"""
+        trimmed = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(months + 12)
+        return trimmed.to_dict(orient="records")
+
+    def list_clients(self) -> List[str]:
+        # Copie: lo snapshot è condiviso tra le richieste e non va modificato dai chiamanti
+        return list(self.dataset.clients)
+
+    def list_sectors(self) -> Dict[str, str]:
+        return dict(self.dataset.sectors)
+
+    def generate_batch_forecast(
+        self,
+        clients: Union[List[str], str] = "all",
+        months: int = 12,
+        max_workers: Optional[int] = None,
+        engine: str = "prophet",
+        stop: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        """
+        Forecast di un intero portafoglio clienti.
+        Con Prophet i fit girano su un pool di processi; i motori NumPy elaborano
+        tutti i clienti insieme nel processo corrente.
+        Ogni cliente è isolato: un errore finisce nel suo risultato senza fermare gli altri.
+        stop: se viene impostato (es. shutdown dell'API) i fit non ancora partiti vengono annullati
+        e si attendono solo quelli in corso; i clienti annullati hanno status "cancelled".
+        """
+        if clients == "all":
+            clients = self.list_clients()
+        clients = list(dict.fromkeys(clients))  # dedup mantenendo l'ordine
+
+        if engine != "prophet":
+            return self._generate_vectorized_batch(clients, months, engine)
+        if stop is not None and stop.is_set():
+            clients_cancelled = [_cancelled(c) for c in clients]
+            return {"months": months, "engine": engine, "workers": 0, "succeeded": 0,
+                    "failed": len(clients), "total_seconds": 0.0, "results": clients_cancelled}
+
+        workers = max_workers or settings.FORECAST_MAX_WORKERS or os.cpu_count() or 1
+        workers = max(1, min(workers, len(clients) or 1))
+
+        start = time.perf_counter()
+        results: Dict[str, Dict[str, Any]] = {}
+
+        if workers == 1:
+            # Niente pool per un solo worker: evitiamo il costo di spawn dei processi
+            for client in clients:
+                if stop is not None and stop.is_set():
+                    results[client] = _cancelled(client)
+                    continue
+                results[client] = _forecast_client_worker(self.data_path, client, months)
+        else:
+            with process_pool(workers) as pool:
+                futures = {
+                    pool.submit(_forecast_client_worker, self.data_path, client, months): client
+                    for client in clients
+                }
+                pending = set(futures)
+                while pending:
+                    # Attesa a intervalli brevi per accorgersi in fretta di una richiesta di stop
+                    done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        client = futures[future]
+                        try:
+                            results[client] = future.result()
+                        except Exception as e:
+                            # Es. worker terminato in modo anomalo (BrokenProcessPool)
+                            results[client] = {"client_name": client, "status": "error", "error": str(e), "elapsed_seconds": None}
+                    if pending and stop is not None and stop.is_set():
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        for future in pending:
+                            results[futures[future]] = _cancelled(futures[future])
+                        break
+
+        ordered = [results[c] for c in clients]
+        return {
+            "months": months,
+            "engine": engine,
+            "workers": workers,
+            "succeeded": sum(1 for r in ordered if r["status"] == "ok"),
+            "failed": sum(1 for r in ordered if r["status"] != "ok"),
+            "total_seconds": round(time.perf_counter() - start, 3),
+            "results": ordered,
+        }
+
+    def _generate_vectorized_batch(self, clients: List[str], months: int, engine: str) -> Dict[str, Any]:
+        """Batch con un motore NumPy: una sola passata vettoriale per tutti i clienti"""
+        forecast_engine = get_engine(engine)
+        start = time.perf_counter()
+        results: Dict[str, Dict[str, Any]] = {}
+
+        # Una sola lettura per tutti i clienti (ogni row group letto una volta con il backend colonnare)
+        frames = {
+            client: pd.DataFrame({"ds": ds, "y": y})
+            for client, ds, y in self.dataset.iter_series(clients)
+        }
+        for client in clients:
+            if client not in frames:
+                results[client] = {"client_name": client, "status": "error",
+                                   "error": f"Nessun dato trovato per il cliente: {client}", "elapsed_seconds": 0.0}
+
+        try:
+            forecasts = forecast_engine.forecast_many(frames, months)
+        except Exception:
+            # Isoliamo il cliente che fa fallire la passata comune ricalcolando uno per uno
+            forecasts = {}
+            for client, df in frames.items():
+                try:
+                    forecasts[client] = forecast_engine.forecast(df, months)
+                except Exception as e:
+                    results[client] = {"client_name": client, "status": "error", "error": str(e), "elapsed_seconds": 0.0}
+
+        # Il tempo è condiviso dalla passata vettoriale: riportiamo la quota per cliente
+        per_client = (time.perf_counter() - start) / max(len(forecasts), 1)
+        for client, forecast in forecasts.items():
+            try:
+                results[client] = {
+                    "client_name": client,
+                    "status": "ok",
+                    "metrics": compute_kpi_metrics(frames[client]["y"], forecast, months),
+                    "forecast_data": ForecastingService.forecast_records(forecast, months),
+                    "elapsed_seconds": round(per_client, 6),
+                }
+            except Exception as e:
+                results[client] = {"client_name": client, "status": "error", "error": str(e), "elapsed_seconds": 0.0}
+
+        ordered = [results[c] for c in clients]
+        return {
+            "months": months,
+            "engine": engine,
+            "workers": 1,
+            "succeeded": sum(1 for r in ordered if r["status"] == "ok"),
+            "failed": sum(1 for r in ordered if r["status"] != "ok"),
+            "total_seconds": round(time.perf_counter() - start, 3),
+            "results": ordered,
+        }
+
+
+def compute_kpi_metrics(history_y: pd.Series, forecast: pd.DataFrame, months: int) -> Dict[str, Any]:
+    """
+    KPI per l'IA (Analista Quantitativo), identici per ogni motore.
+    Prendiamo gli ultimi 12 mesi storici e i mesi predetti.
+    """
+    last_history_val = history_y.iloc[-12:].sum()
+    predicted_val = forecast['yhat'].iloc[-months:].sum()
+    
+    growth_pct = ((predicted_val - last_history_val) / last_history_val) * 100
+    
+    # Trend dell'ultimo mese previsto
+    trend_direction = "Crescente" if forecast['trend'].iloc[-1] > forecast['trend'].iloc[0] else "Decrescente"
+
+    return {
+        "storico_ultimo_anno": round(last_history_val, 2),
+        "previsione_prossimo_anno": round(predicted_val, 2),
+        "crescita_percentuale": round(growth_pct, 2),
+        "trend_di_fondo": trend_direction,
+        "confidenza_min": round(forecast['yhat_lower'].iloc[-1], 2), # Worst case
+        "confidenza_max": round(forecast['yhat_upper'].iloc[-1], 2)  # Best case
+    }
+
+
+def plot_forecast(history: pd.DataFrame, forecast: pd.DataFrame) -> go.Figure:
+    """Grafico equivalente a plot_plotly per i motori che non sono Prophet"""
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=history['ds'], y=history['y'], mode='markers', name='Storico',
+                             marker=dict(color='black', size=4)))
+    fig.add_trace(go.Scatter(x=forecast['ds'], y=forecast['yhat_upper'], mode='lines',
+                             line=dict(width=0), showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=forecast['ds'], y=forecast['yhat_lower'], mode='lines',
+                             line=dict(width=0), fill='tonexty', fillcolor='rgba(0,114,178,0.2)',
+                             name='Confidenza'))
+    fig.add_trace(go.Scatter(x=forecast['ds'], y=forecast['yhat'], mode='lines', name='Previsione',
+                             line=dict(color='#0072B2', width=2)))
+    return fig
+
+
+def _cancelled(client_name: str) -> Dict[str, Any]:
+    return {"client_name": client_name, "status": "cancelled", "error": "Batch interrotto", "elapsed_seconds": None}
+
+
+def _forecast_client_worker(data_path: str, client_name: str, months: int, engine: str = "prophet") -> Dict[str, Any]:
+    """
+    Unità di lavoro eseguita nei processi del pool (deve stare a livello di modulo per il pickling).
+    Restituisce solo dati serializzabili: niente grafico, forecast già tagliato.
+    """
+    start = time.perf_counter()
+    try:
+        service = ForecastingService(data_path)
+        result = service.generate_forecast(client_name, months, include_plot=False, engine=engine)
+        return {
+            "client_name": client_name,
+            "status": "ok",
+            "metrics": result["metrics"],
+            "forecast_data": ForecastingService.forecast_records(result["raw_forecast"], months),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+        }
+    except Exception as e:
+        return {
+            "client_name": client_name,
+            "status": "error",
+            "error": str(e),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+        }
+
 # Esempio di utilizzo locale (per debug)
 if __name__ == "__main__":
     service = ForecastingService()
@@ -0,0 +1,198 @@
+"""
+Forecast gerarchico Totale → Settore → Cliente con riconciliazione.
+
+Tutta la gerarchia è calcolata in una sola passata:
+1. le serie dei clienti vengono allineate in una matrice e aggregate con un'unica
+   moltiplicazione per la matrice di somma S (clienti → settori → totale);
+2. un motore NumPy produce le previsioni base di tutti i nodi insieme;
+3. le previsioni vengono riconciliate (bottom-up o MinT) così che ogni settore sia
+   la somma dei suoi clienti e il totale la somma dei settori.
+
+MinT usa la forma a proiezione  ỹ = ŷ − W Cᵀ (C W Cᵀ)⁻¹ C ŷ  con C matrice dei vincoli:
+il sistema da invertire ha dimensione (settori + 1) e la covarianza shrink non viene mai
+materializzata, quindi il costo resta lineare nel numero di clienti.
+"""
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.engines import ENGINES, SEASON_LENGTH, Z_80, future_dates, get_engine
+from app.services.forecasting import ForecastingService, compute_kpi_metrics
+
+RECONCILIATION_METHODS = ["bottom_up", "mint_wls", "mint_shrink"]
+UNKNOWN_SECTOR = "N/D"
+
+
+def _shrinkage_lambda(X: np.ndarray) -> float:
+    """
+    Intensità di shrinkage di Schäfer-Strimmer verso la diagonale (come in hts::MinT).
+    X: residui (T, m). Calcolato in O(m·T²) senza costruire la matrice m×m.
+    """
+    T = X.shape[0]
+    if T < 2:
+        return 1.0
+    scale = np.sqrt((X ** 2).mean(axis=0))
+    scale[scale == 0] = 1.0
+    Z = X / scale                               # colonne con media dei quadrati = 1
+    gram_t = Z @ Z.T                            # (T, T): ||ZᵀZ||_F = ||Z Zᵀ||_F
+    corr_sq_total = (gram_t ** 2).sum() / T ** 2
+    corr_sq_diag = Z.shape[1]                   # corr_ii = 1
+    sum_d = corr_sq_total - corr_sq_diag        # Σ_{i≠j} corr_ij²
+
+    Z2 = Z ** 2
+    z4_total = (Z2.sum(axis=1) ** 2).sum()      # Σ_ij Σ_t z_ti² z_tj²
+    z4_diag = (Z2 ** 2).sum()
+    cross_total = (gram_t ** 2).sum()           # Σ_ij (Σ_t z_ti z_tj)²
+    cross_diag = (Z2.sum(axis=0) ** 2).sum()
+    sum_v = ((z4_total - z4_diag) - (cross_total - cross_diag) / T) / (T * (T - 1))
+
+    if sum_d <= 0:
+        return 1.0
+    return float(min(max(sum_v / sum_d, 0.0), 1.0))
+
+
+class HierarchicalForecaster:
+    """Forecast riconciliato dell'intero portafoglio (clienti, settori, totale)"""
+
+    def __init__(self, forecasting: Optional[ForecastingService] = None):
+        self.forecasting = forecasting or ForecastingService()
+
+    # --- 1. Struttura ---
+    def _bottom_matrix(self) -> Tuple[List[str], pd.DatetimeIndex, np.ndarray]:
+        """
+        Serie mensili dei clienti allineate sugli stessi mesi (0 dove un cliente non ha commesse).
+        Le commesse hanno giorni del mese diversi (15/01, 14/02, ...): si raggruppano per mese,
+        altrimenti ogni data diventerebbe una colonna a sé e i clienti non si sommerebbero.
+        Ogni mese è rappresentato dal suo ultimo giorno, come le date future (freq="M").
+        """
+        series = list(self.forecasting.dataset.iter_series())
+        clients = [client for client, _, _ in series]
+        periods = [pd.DatetimeIndex(ds).to_period("M") for _, ds, _ in series]
+        all_months = pd.period_range(min(p.min() for p in periods), max(p.max() for p in periods), freq="M")
+
+        B = np.zeros((len(clients), len(all_months)))
+        for i, ((_, _, y), months) in enumerate(zip(series, periods)):
+            # np.add.at somma le commesse multiple dello stesso mese
+            np.add.at(B[i], all_months.get_indexer(months), y)
+        return clients, all_months.to_timestamp(how="end").normalize(), B
+
+    def _aggregation(self, clients: List[str]) -> Tuple[List[str], np.ndarray]:
+        """Matrice A (settori + totale) × clienti: ogni riga somma i clienti del nodo"""
+        sectors_map = self.forecasting.dataset.sectors
+        client_sectors = [sectors_map.get(c, UNKNOWN_SECTOR) for c in clients]
+        sectors = list(dict.fromkeys(client_sectors))
+
+        A = np.zeros((1 + len(sectors), len(clients)))
+        A[0, :] = 1.0
+        sector_idx = {s: i for i, s in enumerate(sectors)}
+        A[1 + np.array([sector_idx[s] for s in client_sectors]), np.arange(len(clients))] = 1.0
+        return sectors, A
+
+    # --- 3. Riconciliazione ---
+    @staticmethod
+    def _reconcile(
+        base: np.ndarray, residuals: np.ndarray, A: np.ndarray, method: str
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        base: (k + n, H) previsioni base, prima i k nodi aggregati poi gli n clienti.
+        residuals: (k + n, T') residui in-sample degli stessi nodi.
+        """
+        k = A.shape[0]
+        if method == "bottom_up":
+            bottom = base[k:]
+            return np.vstack([A @ bottom, bottom]), {"method": method}
+
+        # Vincoli: C ŷ = 0  con  C = [I_k, −A]
+        C = np.hstack([np.eye(k), -A])
+        X = residuals.T                          # (T', m)
+        T = X.shape[0]
+        variances = (X ** 2).mean(axis=0)
+        variances[variances <= 0] = variances[variances > 0].min() if (variances > 0).any() else 1.0
+
+        if method == "mint_wls":
+            lam = 1.0
+        else:
+            lam = _shrinkage_lambda(X)
+
+        # W Cᵀ = λ·D·Cᵀ + (1−λ)·Xᵀ(X Cᵀ)/T   (nessuna matrice m×m)
+        WCt = lam * variances[:, None] * C.T
+        if lam < 1.0:
+            WCt += (1 - lam) * (X.T @ (X @ C.T)) / T
+        CWCt = C @ WCt                           # (k, k)
+
+        correction = WCt @ np.linalg.solve(CWCt, C @ base)
+        return base - correction, {"method": method, "shrinkage_lambda": round(lam, 4)}
+
+    # --- API ---
+    def forecast(
+        self,
+        months: int = 12,
+        engine: str = "holt_winters",
+        method: str = "mint_shrink",
+        include_forecast_data: bool = False,
+    ) -> Dict[str, Any]:
+        if engine not in ENGINES:
+            raise ValueError(
+                f"Il forecast gerarchico richiede un motore vettoriale ({', '.join(ENGINES)}): "
+                "un fit Prophet per ogni nodo annullerebbe il calcolo in una passata"
+            )
+        if method not in RECONCILIATION_METHODS:
+            raise ValueError(f"Metodo di riconciliazione sconosciuto: {method}. Disponibili: {RECONCILIATION_METHODS}")
+
+        start = time.perf_counter()
+
+        # 1. Aggregazione vettoriale: tutti i nodi con una sola matmul
+        clients, all_ds, B = self._bottom_matrix()
+        sectors, A = self._aggregation(clients)
+        Y = np.vstack([A @ B, B])                # (k + n, T): totale, settori, clienti
+
+        # 2. Previsioni base di tutti i nodi in una passata
+        fitted, base, trend, _ = get_engine(engine).fit_predict(Y, months)
+        burn_in = SEASON_LENGTH if Y.shape[1] > 2 * SEASON_LENGTH else 0
+        residuals = (Y - fitted)[:, burn_in:]
+        sigma = residuals.std(axis=1)
+
+        # 3. Riconciliazione
+        reconciled, info = self._reconcile(base, residuals, A, method)
+
+        # 4. Metriche per ogni nodo (intervalli ±z·σ·√h attorno alla previsione riconciliata)
+        future = future_dates(all_ds[-1], months)
+        ds = pd.DatetimeIndex(list(all_ds) + list(future))
+        half_width = Z_80 * sigma[:, None] * np.sqrt(np.arange(1, months + 1))[None, :]
+        names = ["Totale"] + sectors + clients
+
+        nodes = {}
+        for i, name in enumerate(names):
+            yhat = np.concatenate([fitted[i], reconciled[i]])
+            lower = np.concatenate([fitted[i] - half_width[i, 0], reconciled[i] - half_width[i]])
+            upper = np.concatenate([fitted[i] + half_width[i, 0], reconciled[i] + half_width[i]])
+            frame = pd.DataFrame({"ds": ds, "yhat": yhat, "yhat_lower": lower, "yhat_upper": upper, "trend": trend[i]})
+            node = {"name": name, "metrics": compute_kpi_metrics(pd.Series(Y[i]), frame, months)}
+            if include_forecast_data:
+                node["forecast_data"] = ForecastingService.forecast_records(frame, months)
+            nodes[i] = node
+
+        # 5. Albero Totale → Settori → Clienti
+        k = A.shape[0]
+        tree = {**nodes[0], "level": "total", "children": []}
+        for s_idx, sector in enumerate(sectors):
+            members = np.flatnonzero(A[1 + s_idx])
+            tree["children"].append({
+                **nodes[1 + s_idx],
+                "level": "sector",
+                "children": [{**nodes[k + j], "level": "client"} for j in members],
+            })
+
+        # Verifica di coerenza: il totale riconciliato deve essere la somma dei clienti
+        coherence_error = float(np.abs(reconciled[0] - reconciled[k:].sum(axis=0)).max())
+
+        return {
+            "engine": engine,
+            "months": months,
+            "reconciliation": {**info, "coherence_error": round(coherence_error, 6)},
+            "nodes": {"total": 1, "sectors": len(sectors), "clients": len(clients)},
+            "elapsed_seconds": round(time.perf_counter() - start, 4),
+            "tree": tree,
+        }
@@ -0,0 +1,70 @@
+"""
+Client HTTP condivisi dal processo (pool di connessioni keep-alive).
+
+Un client per richiesta apre ogni volta nuove connessioni TCP/TLS verso OpenAI e Tavily:
+con i client condivisi le chiamate successive riusano le connessioni già aperte.
+- httpx.Client / httpx.AsyncClient: passati a ChatOpenAI (chiamate sync e async);
+- requests.Session: usata dal wrapper Tavily (la libreria chiama requests.post senza sessione).
+Tutti i client sono thread-safe e vengono chiusi allo shutdown dell'applicazione.
+"""
+import threading
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+
+_lock = threading.Lock()
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_session: Optional[requests.Session] = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+    )
+
+
+def get_http_client() -> httpx.Client:
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(limits=_limits(), timeout=settings.HTTP_TIMEOUT_SECONDS)
+        return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    global _async_client
+    with _lock:
+        if _async_client is None or _async_client.is_closed:
+            _async_client = httpx.AsyncClient(limits=_limits(), timeout=settings.HTTP_TIMEOUT_SECONDS)
+        return _async_client
+
+
+def get_requests_session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.HTTP_MAX_KEEPALIVE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+async def aclose_http_clients() -> None:
+    """Chiude i pool (shutdown dell'app); una richiesta successiva li ricrea"""
+    global _client, _async_client, _session
+    with _lock:
+        client, async_client, session = _client, _async_client, _session
+        _client = _async_client = _session = None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.aclose()
+    if session is not None:
+        session.close()
@@ -0,0 +1,183 @@
+"""
+Cache su disco delle risposte LLM dei nodi agente.
+
+Con temperature=0 lo stesso prompt produce (in pratica) la stessa risposta: l'analista riceve
+le stesse metriche a ogni rerun di un cliente invariato, e il Direttore gli stessi input.
+La chiave è (hash della configurazione del modello, hash del prompt renderizzato):
+- configurazione: nome del modello, temperatura e parametri (la stringa che LangChain usa per le sue cache);
+- prompt: i messaggi finali serializzati, quindi cambia se cambiano dati, evidenze RAG o news.
+Si integra come BaseCache di LangChain sul modello del singolo nodo (vedi AgentEngine._llm_for):
+un'istanza per nodo, con i propri contatori, sullo stesso database SQLite.
+Le voci scadono dopo LLM_CACHE_TTL_SECONDS e oltre LLM_CACHE_MAX_ENTRIES si eliminano
+quelle usate meno di recente.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+from app.core.config import settings
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LLMResponseStore:
+    """Tabella SQLite (llm_hash, prompt_hash) -> testi delle generazioni, con TTL e limite di voci"""
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl_seconds: Optional[int] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.expired = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                " llm_hash TEXT NOT NULL, prompt_hash TEXT NOT NULL, node TEXT NOT NULL,"
+                " generations TEXT NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL,"
+                " PRIMARY KEY (llm_hash, prompt_hash))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_responses_lru ON llm_responses (last_used_at)")
+            self._conn.commit()
+
+    def get(self, llm_hash: str, prompt_hash: str) -> Optional[list]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generations, created_at FROM llm_responses WHERE llm_hash = ? AND prompt_hash = ?",
+                (llm_hash, prompt_hash),
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_responses WHERE llm_hash = ? AND prompt_hash = ?",
+                                   (llm_hash, prompt_hash))
+                self._conn.commit()
+                self.expired += 1
+                return None
+            self._conn.execute("UPDATE llm_responses SET last_used_at = ? WHERE llm_hash = ? AND prompt_hash = ?",
+                               (now, llm_hash, prompt_hash))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, llm_hash: str, prompt_hash: str, node: str, generations: list) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (llm_hash, prompt_hash, node, generations, created_at, last_used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (llm_hash, prompt_hash, node, json.dumps(generations, ensure_ascii=False), now, now),
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_responses WHERE rowid IN"
+                    " (SELECT rowid FROM llm_responses ORDER BY last_used_at LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+            self._conn.commit()
+
+    def clear(self, node: Optional[str] = None) -> None:
+        with self._lock:
+            if node is None:
+                self._conn.execute("DELETE FROM llm_responses")
+            else:
+                self._conn.execute("DELETE FROM llm_responses WHERE node = ?", (node,))
+            self._conn.commit()
+
+    def count(self, node: Optional[str] = None) -> int:
+        with self._lock:
+            if node is None:
+                return self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM llm_responses WHERE node = ?", (node,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class NodeLLMCache(BaseCache):
+    """BaseCache LangChain per un nodo: salva solo il testo delle risposte (i nodi usano StrOutputParser)"""
+
+    def __init__(self, store: LLMResponseStore, node: str):
+        self.store = store
+        self.node = node
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        texts = self.store.get(_sha256(llm_string), _sha256(prompt))
+        with self._stats_lock:
+            if texts is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if texts is None:
+            return None
+        return [ChatGeneration(message=AIMessage(content=text)) for text in texts]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        texts = [g.message.content if isinstance(g, ChatGeneration) else g.text for g in return_val]
+        self.store.put(_sha256(llm_string), _sha256(prompt), self.node, texts)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear(self.node)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_store: Optional[LLMResponseStore] = None
+_caches: Dict[str, NodeLLMCache] = {}
+_factory_lock = threading.Lock()
+
+
+def enabled_nodes() -> Sequence[str]:
+    if not settings.LLM_CACHE_ENABLED:
+        return ()
+    return tuple(n.strip() for n in settings.LLM_CACHE_NODES.split(",") if n.strip())
+
+
+def get_llm_cache(node: str) -> Optional[NodeLLMCache]:
+    """Cache del nodo se abilitata in LLM_CACHE_NODES, altrimenti None (chiamata diretta al modello)"""
+    global _store
+    if node not in enabled_nodes():
+        return None
+    with _factory_lock:
+        cache = _caches.get(node)
+        if cache is None:
+            if _store is None:
+                _store = LLMResponseStore(settings.LLM_CACHE_PATH, settings.LLM_CACHE_MAX_ENTRIES,
+                                          settings.LLM_CACHE_TTL_SECONDS)
+            cache = _caches[node] = NodeLLMCache(_store, node)
+        return cache
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    """Contatori per nodo e stato del database (voci, scadute, eliminate per il limite di dimensione)"""
+    with _factory_lock:
+        caches, store = dict(_caches), _store
+    return {
+        "enabled_nodes": list(enabled_nodes()),
+        "nodes": {node: {**cache.stats(), "entries": store.count(node)} for node, cache in caches.items()},
+        "entries": store.count() if store is not None else 0,
+        "expired": store.expired if store is not None else 0,
+        "evictions": store.evictions if store is not None else 0,
+    }
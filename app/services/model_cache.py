@@ -0,0 +1,162 @@
+import os
+import glob
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import pandas as pd
+from prophet import Prophet
+from prophet.serialize import model_to_json, model_from_json
+
+from app.core.config import settings
+
+
+def hash_dataframe(df: pd.DataFrame) -> str:
+    """Hash stabile del contenuto (valori, non indice) di un DataFrame"""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+
+class ForecastModelCache:
+    """
+    Cache dei modelli Prophet già addestrati.
+    - Livello 1: memoria, con eviction LRU.
+    - Livello 2: disco, tramite la serializzazione JSON nativa di Prophet.
+
+    La chiave contiene l'hash delle righe del cliente: se il dataset cambia
+    (es. dopo un upload) la chiave cambia e il modello vecchio non viene più servito.
+    """
+
+    def __init__(self, cache_dir: str, max_items: int = 64):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self._memory: "OrderedDict[str, Prophet]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # --- Chiavi ---
+    @staticmethod
+    def make_key(client_name: str, data_hash: str, model_config: Dict[str, Any], horizon: int) -> str:
+        """
+        Chiave nel formato <cliente>__<scope>__<dati>.
+        Lo scope (configurazione + orizzonte) è separato dall'hash dei dati
+        così da poter ritrovare/eliminare le versioni precedenti dello stesso modello.
+        """
+        client_part = hashlib.sha1(client_name.encode("utf-8")).hexdigest()[:12]
+        scope = json.dumps({"config": model_config, "horizon": horizon}, sort_keys=True)
+        scope_part = hashlib.sha1(scope.encode("utf-8")).hexdigest()[:12]
+        return f"{client_part}__{scope_part}__{data_hash[:16]}"
+
+    @staticmethod
+    def _scope_prefix(key: str) -> str:
+        return key.rsplit("__", 1)[0]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    # --- API ---
+    def get(self, key: str) -> Optional[Prophet]:
+        with self._lock:
+            model = self._memory.get(key)
+            if model is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return model
+
+        # Fallback su disco (es. dopo un riavvio del processo)
+        path = self._path(key)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    model = model_from_json(f.read())
+            except Exception:
+                # File corrotto o scritto da una versione incompatibile di Prophet
+                model = None
+            if model is not None:
+                with self._lock:
+                    self._remember(key, model)
+                    self.hits += 1
+                return model
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, model: Prophet) -> None:
+        with self._lock:
+            self._remember(key, model)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Scrittura atomica: tmp + rename, così un lettore concorrente non vede file parziali
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(model_to_json(model))
+        os.replace(tmp_path, self._path(key))
+
+        self._prune_stale_versions(key)
+
+    def find_previous(self, key: str) -> Optional[Prophet]:
+        """
+        Modello dello stesso scope (cliente, config, orizzonte) addestrato su una versione
+        precedente dei dati: è il punto di partenza per un refit incrementale (warm start).
+        """
+        prefix = self._scope_prefix(key)
+        with self._lock:
+            for other_key in reversed(self._memory):
+                if other_key != key and self._scope_prefix(other_key) == prefix:
+                    return self._memory[other_key]
+
+        candidates = [
+            p for p in glob.glob(os.path.join(self.cache_dir, f"{prefix}__*.json"))
+            if os.path.basename(p) != f"{key}.json"
+        ]
+        for path in sorted(candidates, key=os.path.getmtime, reverse=True):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return model_from_json(f.read())
+            except Exception:
+                continue
+        return None
+
+    def clear(self, disk: bool = True) -> None:
+        with self._lock:
+            self._memory.clear()
+        if disk:
+            for path in glob.glob(os.path.join(self.cache_dir, "*.json")):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_memory": len(self._memory), "hits": self.hits, "misses": self.misses}
+
+    # --- Interni ---
+    def _remember(self, key: str, model: Prophet) -> None:
+        """Inserisce in memoria con politica LRU (chiamare con il lock acquisito)"""
+        self._memory[key] = model
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _prune_stale_versions(self, key: str) -> None:
+        """Elimina i modelli dello stesso scope addestrati su una versione precedente dei dati"""
+        prefix = self._scope_prefix(key)
+        with self._lock:
+            for stale in [k for k in self._memory if k != key and self._scope_prefix(k) == prefix]:
+                del self._memory[stale]
+
+        for path in glob.glob(os.path.join(self.cache_dir, f"{prefix}__*.json")):
+            if os.path.basename(path) != f"{key}.json":
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+# Istanza condivisa a livello di processo (le richieste API creano più ForecastingService)
+model_cache = ForecastModelCache(settings.FORECAST_CACHE_DIR, settings.FORECAST_CACHE_SIZE)
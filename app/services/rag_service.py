@@ -1,5 +1,24 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
+import os
+import re
+import copy
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.data.lexical_index import LexicalIndex, tokenize
+from app.data.rag_index_repo import MANIFEST_FILE, chunk_sources, load_manifest, manifest_backend, open_vector_store
+from app.services.embeddings import get_embeddings
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Stessa domanda a meno di maiuscole e spazi -> stessa chiave di cache"""
+    return _WHITESPACE_RE.sub(" ", query).strip().lower()
+
 
 class RAGService:
     def __init__(self, persist_dir: str, collection_name: str, top_k: int = 4):
@@ -7,14 +26,121 @@ class RAGService:
         self.collection_name = collection_name
         self.top_k = top_k
 
-        self._vs = Chroma(
-            persist_directory=persist_dir,
-            embedding_function=OpenAIEmbeddings(
-                model="text-embedding-3-small"
-            ),
-            collection_name=collection_name
-        )
-
-    def retrieve(self, query: str):
-        retriever = self._vs.as_retriever(search_kwargs={"k": self.top_k})
-        return retriever.invoke(query)
+        # Backend dal manifest: l'indice può essere stato costruito con un RAG_VECTOR_BACKEND diverso
+        self._open_store(manifest_backend(load_manifest(persist_dir)))
+
+        # Risultati per (query normalizzata, k, versione dell'indice)
+        self._cache = TTLCache(settings.RAG_QUERY_CACHE_SIZE, settings.RAG_QUERY_CACHE_TTL_SECONDS)
+        self._manifest_path = os.path.join(persist_dir, MANIFEST_FILE)
+        self._manifest_mtime: Optional[int] = None
+        self._index_version = 0
+        self._version_lock = threading.Lock()
+        # Indice BM25 pubblicato dall'indicizzatore insieme ai vettori (ricaricato a ogni versione)
+        self._lexical: Optional[LexicalIndex] = None
+        self.modes = {"lexical": 0, "hybrid": 0, "vector": 0}
+        # Chunk deduplicati: tutte le pagine che li contengono
+        self._sources: Dict[str, List[str]] = {}
+
+    def _open_store(self, backend: str) -> None:
+        if backend != settings.RAG_VECTOR_BACKEND:
+            print(f"ℹ️  Indice RAG costruito con '{backend}', diverso da RAG_VECTOR_BACKEND={settings.RAG_VECTOR_BACKEND}: uso '{backend}'")
+        self.backend = backend
+        # Embedding condivisi con l'indicizzatore: le query ripetute non richiamano l'API
+        self._vs = open_vector_store(self.persist_dir, self.collection_name, get_embeddings(), backend)
+        # Retriever costruito una volta sola (fuori dal percorso di ogni richiesta)
+        self._retriever = self._vs.as_retriever(search_kwargs={"k": self.top_k})
+
+    def index_version(self) -> int:
+        """
+        Versione pubblicata dall'indicizzatore: il manifest viene riletto solo se il file è cambiato.
+        A ogni nuova versione la cache dei risultati viene svuotata.
+        """
+        try:
+            mtime = os.stat(self._manifest_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._version_lock:
+            if mtime != self._manifest_mtime:
+                manifest = load_manifest(self.persist_dir)
+                version = int(manifest.get("index_version", 0))
+                self._sources = chunk_sources(manifest)
+                if version != self._index_version:
+                    self._cache.clear()
+                self._lexical = LexicalIndex.load(self.persist_dir) if settings.RAG_HYBRID_ENABLED else None
+                if manifest_backend(manifest) != self.backend:
+                    # Indice ricostruito con un altro backend mentre il servizio era attivo
+                    self._open_store(manifest_backend(manifest))
+                elif hasattr(self._vs, "refresh"):
+                    # Flat store: si riapre la nuova generazione della matrice (Chroma si aggiorna da sé)
+                    self._vs.refresh()
+                self._manifest_mtime, self._index_version = mtime, version
+            return self._index_version
+
+    def retrieve(self, query: str, k: Optional[int] = None) -> List[Document]:
+        k = k or self.top_k
+        key = (normalize_query(query), k, self.index_version())
+        docs = self._cache.get(key)
+        if docs is None:
+            docs, mode = self._search(query, k)
+            for doc in docs:
+                # Un chunk deduplicato cita tutte le sue fonti, non solo la prima indicizzata
+                sources = self._sources.get(doc.id, [doc.metadata.get("source", "unknown")])
+                doc.metadata["sources"] = sources
+                if doc.metadata.get("source") not in sources:
+                    # Pagina canonica rimossa dal repo: si cita una delle pagine che lo contengono ancora
+                    doc.metadata["source"] = sources[0]
+            self.modes[mode] += 1
+            self._cache.put(key, docs)
+        # Copie dei documenti (metadata e lista delle fonti compresi): chi chiama può modificarli senza toccare la cache
+        return [Document(page_content=d.page_content, metadata=copy.deepcopy(d.metadata), id=d.id) for d in docs]
+
+    # --- Ricerca ---
+    def _is_decisive(self, lexical: LexicalIndex, query: str, top_terms: List[str]) -> bool:
+        """
+        Il primo risultato BM25 basta da solo se copre quasi tutta la query (pesata per IDF)
+        e contiene almeno un termine raro del corpus (nome di file, cliente, progetto).
+        """
+        terms = set(tokenize(query))
+        total = sum(lexical.idf(t) for t in terms)
+        if total <= 0:
+            return False
+        coverage = sum(lexical.idf(t) for t in set(top_terms)) / total
+        has_rare = any(lexical.document_frequency(t) <= settings.RAG_LEXICAL_MAX_DF for t in top_terms)
+        return coverage >= settings.RAG_LEXICAL_MIN_COVERAGE and has_rare
+
+    @staticmethod
+    def _doc_key(doc: Document):
+        return doc.id or (doc.metadata.get("source"), doc.page_content)
+
+    def _search(self, query: str, k: int) -> Tuple[List[Document], str]:
+        lexical = self._lexical
+        if not lexical:
+            if k == self.top_k:
+                return self._retriever.invoke(query), "vector"
+            return self._vs.similarity_search(query, k=k), "vector"
+
+        candidates = max(k, settings.RAG_HYBRID_CANDIDATES)
+        lexical_hits = lexical.search(query, candidates)
+        # Percorso veloce: match lessicale netto, nessun embedding della query né ricerca HNSW
+        if lexical_hits and self._is_decisive(lexical, query, lexical_hits[0][2]):
+            return [lexical.document(chunk_id) for chunk_id, _, _ in lexical_hits[:k]], "lexical"
+
+        vector_docs = self._vs.similarity_search(query, k=candidates)
+        if not lexical_hits:
+            return vector_docs[:k], "vector"
+
+        # Reciprocal Rank Fusion: somma di 1 / (RRF_K + rank) sulle due classifiche
+        scores: Dict[object, float] = {}
+        docs: Dict[object, Document] = {}
+        for rank, doc in enumerate(vector_docs):
+            key = self._doc_key(doc)
+            docs[key] = doc
+            scores[key] = scores.get(key, 0.0) + 1.0 / (settings.RAG_RRF_K + rank + 1)
+        for rank, (chunk_id, _, _) in enumerate(lexical_hits):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (settings.RAG_RRF_K + rank + 1)
+            docs.setdefault(chunk_id, None)
+        ranked = sorted(scores, key=lambda key: -scores[key])[:k]
+        return [docs[key] or lexical.document(key) for key in ranked], "hybrid"
+
+    def cache_stats(self):
+        return {**self._cache.stats(), "index_version": self._index_version, "modes": dict(self.modes)}
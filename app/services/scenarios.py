@@ -0,0 +1,252 @@
+"""
+Scenari what-if sulle previsioni, senza rifare il fit.
+
+Per ogni (cliente, motore, orizzonte) si calcolano una sola volta i campioni predittivi
+del modello già addestrato (Prophet: predictive_samples; motori NumPy: campioni gaussiani
+con la σ dei residui) e si tengono in memoria come array NumPy (orizzonte × campioni).
+
+Uno scenario è una trasformazione vettoriale di quei campioni:
+- shocks: variazione percentuale su un intervallo di mesi ("Q3 -20%");
+- growth_pct_annual: sostituisce la pendenza del trend con una crescita annua data;
+- seasonal_multipliers: moltiplicatori per mese dell'anno (1-12).
+Quantili e KPI vengono ricalcolati per tutti gli scenari insieme, in pochi millisecondi.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.engines import SEASON_LENGTH, Z_80, future_dates, get_engine
+from app.services.forecasting import ForecastingService, compute_kpi_metrics
+from app.services.model_cache import model_cache
+
+# Quantili dell'intervallo all'80% (stesso interval_width di default di Prophet)
+LOWER_Q, UPPER_Q = 0.10, 0.90
+
+
+@dataclass
+class SampleSet:
+    """Tutto ciò che serve per valutare uno scenario, già in forma di array"""
+    history_ds: np.ndarray      # (T,) datetime64
+    history_y: np.ndarray       # (T,)
+    fitted: np.ndarray          # (T,) yhat sullo storico
+    fitted_lower: np.ndarray    # (T,)
+    fitted_upper: np.ndarray    # (T,)
+    future_ds: np.ndarray       # (H,) datetime64
+    point: np.ndarray           # (H,) yhat futuro
+    trend: np.ndarray           # (T + H,) componente di trend
+    samples: np.ndarray         # (H, S) campioni predittivi futuri
+    computed_at: float
+
+
+class ScenarioSampleCache:
+    """Cache LRU in memoria dei campioni predittivi, per chiave del modello"""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, SampleSet]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[SampleSet]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key: str, item: SampleSet) -> None:
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_memory": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+sample_cache = ScenarioSampleCache(settings.SCENARIO_CACHE_SIZE)
+
+
+class ScenarioService:
+    """Valutazione interattiva di scenari what-if per un cliente"""
+
+    def __init__(self, forecasting: Optional[ForecastingService] = None):
+        self.forecasting = forecasting or ForecastingService()
+
+    # --- Campioni predittivi (calcolati una volta per modello) ---
+    def _sample_key(self, client_name: str, months: int, engine: str) -> str:
+        data_hash = self.forecasting.dataset.series_hashes.get(client_name, "")
+        key = model_cache.make_key(client_name, data_hash, ForecastingService.MODEL_CONFIG, months)
+        return f"{engine}__{key}"
+
+    def get_samples(self, client_name: str, months: int, engine: str = "prophet") -> Tuple[SampleSet, bool]:
+        """Campioni del cliente e flag che indica se arrivano dalla cache"""
+        key = self._sample_key(client_name, months, engine)
+        cached = sample_cache.get(key)
+        if cached is not None:
+            return cached, True
+
+        df = self.forecasting._prepare_data(client_name)
+        if engine == "prophet":
+            sample_set = self._prophet_samples(client_name, df, months)
+        else:
+            sample_set = self._engine_samples(df, months, engine, seed=key)
+        sample_cache.put(key, sample_set)
+        return sample_set, False
+
+    def _prophet_samples(self, client_name: str, df: pd.DataFrame, months: int) -> SampleSet:
+        # Il modello arriva dalla cache dei modelli: nessun fit se è già stato addestrato
+        model = self.forecasting._get_fitted_model(client_name, df, months)
+        future = model.make_future_dataframe(periods=months, freq='M')
+        forecast = model.predict(future)
+        samples = model.predictive_samples(future)["yhat"]      # (T + H, S)
+
+        T = len(df)
+        return SampleSet(
+            history_ds=df["ds"].to_numpy(dtype="datetime64[ns]"),
+            history_y=df["y"].to_numpy(dtype="float64"),
+            fitted=forecast["yhat"].to_numpy()[:T],
+            fitted_lower=forecast["yhat_lower"].to_numpy()[:T],
+            fitted_upper=forecast["yhat_upper"].to_numpy()[:T],
+            future_ds=forecast["ds"].to_numpy(dtype="datetime64[ns]")[T:],
+            point=forecast["yhat"].to_numpy()[T:],
+            trend=forecast["trend"].to_numpy(),
+            samples=np.ascontiguousarray(samples[T:]),
+            computed_at=time.time(),
+        )
+
+    @staticmethod
+    def _engine_samples(df: pd.DataFrame, months: int, engine: str, seed: str) -> SampleSet:
+        # Motori NumPy: campioni gaussiani con varianza crescente come √h (stessi intervalli del motore)
+        y = df["y"].to_numpy(dtype="float64")
+        fitted, forecast, trend, sigma = get_engine(engine).fit_predict(y[None, :], months)
+        rng = np.random.default_rng(int(hashlib.sha1(seed.encode("utf-8")).hexdigest()[:8], 16))
+        noise = rng.standard_normal((months, settings.SCENARIO_SAMPLES))
+        spread = sigma[0] * np.sqrt(np.arange(1, months + 1))[:, None]
+        samples = forecast[0][:, None] + spread * noise
+
+        history_ds = df["ds"].to_numpy(dtype="datetime64[ns]")
+        return SampleSet(
+            history_ds=history_ds,
+            history_y=y,
+            fitted=fitted[0],
+            fitted_lower=fitted[0] - Z_80 * sigma[0],
+            fitted_upper=fitted[0] + Z_80 * sigma[0],
+            future_ds=future_dates(pd.Timestamp(history_ds[-1]), months).to_numpy(dtype="datetime64[ns]"),
+            point=forecast[0],
+            trend=trend[0],
+            samples=samples,
+            computed_at=time.time(),
+        )
+
+    # --- Trasformazioni ---
+    @staticmethod
+    def _scenario_factors(sample_set: SampleSet, scenarios: List[Dict[str, Any]]):
+        """
+        Per ogni scenario: moltiplicatore (K, H) e termine additivo di trend (K, H).
+        campioni_scenario = (campioni + additivo) · moltiplicatore
+        """
+        H = len(sample_set.future_ds)
+        K = len(scenarios)
+        mult = np.ones((K, H))
+        add = np.zeros((K, H))
+
+        future = pd.DatetimeIndex(sample_set.future_ds)
+        future_months = future.to_period("M")
+        month_of_year = future.month.to_numpy()
+        h = np.arange(1, H + 1)
+
+        # Pendenza attuale del trend (per mese) sull'orizzonte futuro
+        trend_future = sample_set.trend[-H:]
+        base_slope = (trend_future[-1] - trend_future[0]) / max(H - 1, 1)
+        trend_origin = sample_set.trend[-H - 1] if len(sample_set.trend) > H else trend_future[0]
+
+        for i, scenario in enumerate(scenarios):
+            for shock in scenario.get("shocks") or []:
+                start = pd.Period(shock["start"], freq="M")
+                end = pd.Period(shock.get("end") or shock["start"], freq="M")
+                mask = (future_months >= start) & (future_months <= end)
+                mult[i, mask] *= 1 + shock["pct"] / 100
+
+            growth = scenario.get("growth_pct_annual")
+            if growth is not None:
+                new_slope = trend_origin * growth / 100 / SEASON_LENGTH
+                add[i] = (new_slope - base_slope) * h
+
+            for month, factor in (scenario.get("seasonal_multipliers") or {}).items():
+                mult[i, month_of_year == int(month)] *= factor
+
+        return mult, add
+
+    def evaluate(
+        self,
+        client_name: str,
+        scenarios: List[Dict[str, Any]],
+        months: int = 12,
+        engine: str = "prophet",
+        include_forecast_data: bool = False,
+    ) -> Dict[str, Any]:
+        """Baseline + scenari richiesti, tutti valutati con un'unica operazione sui campioni"""
+        start = time.perf_counter()
+        ss, from_cache = self.get_samples(client_name, months, engine)
+        samples_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        all_scenarios = [{"name": "baseline"}] + list(scenarios)
+        mult, add = self._scenario_factors(ss, all_scenarios)
+
+        # (K, H, S): tutti gli scenari in un colpo, poi quantili lungo i campioni
+        transformed = (ss.samples[None, :, :] + add[:, :, None]) * mult[:, :, None]
+        lower, upper = np.quantile(transformed, [LOWER_Q, UPPER_Q], axis=2)
+        points = (ss.point[None, :] + add) * mult
+        T = len(ss.history_y)
+
+        history_y = pd.Series(ss.history_y)
+        ds = np.concatenate([ss.history_ds, ss.future_ds])
+        results = []
+        for i, scenario in enumerate(all_scenarios):
+            trend = ss.trend.copy()
+            trend[T:] += add[i]
+            frame = pd.DataFrame({
+                "ds": ds,
+                "yhat": np.concatenate([ss.fitted, points[i]]),
+                "yhat_lower": np.concatenate([ss.fitted_lower, lower[i]]),
+                "yhat_upper": np.concatenate([ss.fitted_upper, upper[i]]),
+                "trend": trend,
+            }, copy=False)
+            result = {"name": scenario.get("name") or f"scenario_{i}", "metrics": compute_kpi_metrics(history_y, frame, months)}
+            if include_forecast_data:
+                result["forecast_data"] = ForecastingService.forecast_records(frame, months)
+            results.append(result)
+
+        baseline = results[0]
+        base_total = baseline["metrics"]["previsione_prossimo_anno"]
+        for result in results[1:]:
+            total = result["metrics"]["previsione_prossimo_anno"]
+            result["delta_vs_baseline"] = round(total - base_total, 2)
+            result["delta_vs_baseline_pct"] = round((total - base_total) / base_total * 100, 2) if base_total else None
+
+        return {
+            "client_name": client_name,
+            "engine": engine,
+            "months": months,
+            "samples": int(ss.samples.shape[1]),
+            "samples_cached": from_cache,
+            "samples_seconds": round(samples_seconds, 4),
+            "scenario_seconds": round(time.perf_counter() - start, 4),
+            "baseline": baseline,
+            "scenarios": results[1:],
+        }
@@ -0,0 +1,194 @@
+"""
+Ricerca web per il nodo ricercatore.
+
+- SearchProvider: interfaccia minima (query -> lista di risultati {title, url, content, ...});
+  TavilySearchProvider chiama l'API, StaticSearchProvider è il sostituto locale (sviluppo offline, test).
+- CachedSearch: cache TTL dei risultati per query normalizzata + single-flight: richieste identiche
+  contemporanee (più utenti che analizzano lo stesso cliente) aspettano un'unica chiamata al provider.
+  Gli errori non vengono messi in cache e arrivano a tutte le richieste in attesa.
+  L'istanza del processo (get_web_search) è condivisa dai motori agenti e sopravvive al loro riavvio.
+"""
+import re
+import time
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from langchain_community.utilities.tavily_search import TAVILY_API_URL, TavilySearchAPIWrapper
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.http_clients import get_requests_session
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class SearchProvider(ABC):
+    @abstractmethod
+    def search(self, query: str) -> List[Dict]:
+        """Risultati della ricerca (solleva eccezione in caso di errore: niente risultati "finti")"""
+
+
+class _PooledTavilyWrapper(TavilySearchAPIWrapper):
+    """Wrapper Tavily che riusa la sessione HTTP condivisa invece di aprire una connessione per ricerca"""
+
+    def raw_results(
+        self,
+        query: str,
+        max_results: Optional[int] = 5,
+        search_depth: Optional[str] = "advanced",
+        include_domains: Optional[List[str]] = [],
+        exclude_domains: Optional[List[str]] = [],
+        include_answer: Optional[bool] = False,
+        include_raw_content: Optional[bool] = False,
+        include_images: Optional[bool] = False,
+    ) -> Dict:
+        params = {
+            "api_key": self.tavily_api_key.get_secret_value(),
+            "query": query,
+            "max_results": max_results,
+            "search_depth": search_depth,
+            "include_domains": include_domains,
+            "exclude_domains": exclude_domains,
+            "include_answer": include_answer,
+            "include_raw_content": include_raw_content,
+            "include_images": include_images,
+        }
+        response = get_requests_session().post(
+            f"{TAVILY_API_URL}/search", json=params, timeout=settings.HTTP_TIMEOUT_SECONDS
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+class TavilySearchProvider(SearchProvider):
+    """
+    Tavily via API wrapper (non il tool LangChain: il tool trasforma gli errori in una stringa,
+    che finirebbe in cache come se fosse un risultato)
+    """
+
+    def __init__(self, api_key: str, max_results: int = 5, search_depth: str = "advanced"):
+        self._wrapper = _PooledTavilyWrapper(tavily_api_key=api_key)
+        self.max_results = max_results
+        self.search_depth = search_depth
+
+    def search(self, query: str) -> List[Dict]:
+        return self._wrapper.results(query, max_results=self.max_results, search_depth=self.search_depth)
+
+
+class StaticSearchProvider(SearchProvider):
+    """Sostituto locale: risultati fissi per query (o di default), con latenza simulata opzionale"""
+
+    def __init__(self, results: Optional[Dict[str, List[Dict]]] = None, default: Optional[List[Dict]] = None,
+                 latency_s: float = 0.0):
+        self.results = results or {}
+        self.default = default or []
+        self.latency_s = latency_s
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def search(self, query: str) -> List[Dict]:
+        with self._lock:
+            self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return list(self.results.get(query, self.default))
+
+
+class CachedSearch:
+    """Provider con cache TTL per query e coalescenza delle richieste identiche in corso"""
+
+    def __init__(self, provider: SearchProvider, max_items: int = 256, ttl_seconds: float = 1800):
+        self.provider = provider
+        self._cache = TTLCache(max_items, ttl_seconds)
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(query: str) -> str:
+        return _WHITESPACE_RE.sub(" ", query).strip().lower()
+
+    def search(self, query: str) -> Tuple[List[Dict], Dict]:
+        """
+        (risultati, info) con info["cache"]:
+        "hit" (dalla cache), "coalesced" (atteso la chiamata già in corso di un'altra richiesta)
+        o "miss" (chiamata al provider); info["seconds"] è l'attesa di questa richiesta.
+        """
+        key = self._key(query)
+        start = time.perf_counter()
+        with self._lock:
+            # Controllo e registrazione sotto lo stesso lock: una sola richiesta diventa "leader"
+            results = self._cache.get(key)
+            if results is not None:
+                self.hits += 1
+                return list(results), {"cache": "hit", "seconds": round(time.perf_counter() - start, 4)}
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Solleva la stessa eccezione del leader se la chiamata fallisce
+            results = future.result()
+            return list(results), {"cache": "coalesced", "seconds": round(time.perf_counter() - start, 4)}
+
+        try:
+            results = self.provider.search(query)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            # In cache prima di liberare la chiave: nessuna richiesta successiva rifà la chiamata
+            self._cache.put(key, results)
+            self._inflight.pop(key, None)
+            self.misses += 1
+        future.set_result(results)
+        return list(results), {"cache": "miss", "seconds": round(time.perf_counter() - start, 4)}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "errors": self.errors, "in_flight": len(self._inflight)}
+
+
+_web_search: Optional[CachedSearch] = None
+_factory_lock = threading.Lock()
+
+
+def get_search_provider(name: Optional[str] = None) -> SearchProvider:
+    """Provider configurato: "tavily" oppure "local" (nessuna chiamata esterna, nessun risultato)"""
+    name = name or settings.WEB_SEARCH_PROVIDER
+    if name == "tavily":
+        return TavilySearchProvider(settings.require("TAVILY_API_KEY"), max_results=settings.WEB_SEARCH_MAX_RESULTS)
+    if name == "local":
+        return StaticSearchProvider()
+    raise ValueError(f"Provider di ricerca web non supportato: {name} (disponibili: tavily, local)")
+
+
+def get_web_search() -> CachedSearch:
+    """Ricerca web con cache condivisa nel processo, sul provider configurato (creata al primo uso)"""
+    global _web_search
+    with _factory_lock:
+        if _web_search is None:
+            _web_search = CachedSearch(get_search_provider(), max_items=settings.WEB_SEARCH_CACHE_SIZE,
+                                       ttl_seconds=settings.WEB_SEARCH_CACHE_TTL_SECONDS)
+        return _web_search
+
+
+def web_search_stats() -> Dict[str, int]:
+    """Contatori della cache condivisa, senza crearla (né il provider) se non è ancora stata usata"""
+    with _factory_lock:
+        web_search = _web_search
+    if web_search is None:
+        return {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "in_flight": 0}
+    return web_search.stats()
@@ -0,0 +1,49 @@
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app.services.backtesting import BacktestCache, _aggregate, _fold_metrics
+
+
+def _ok(client, mape, engine="holt_winters"):
+    return {"client_name": client, "engine": engine, "status": "ok", "mape": mape, "smape": 10.0,
+            "coverage": 0.8, "fit_seconds": 0.01, "predict_seconds": 0.0}
+
+
+def test_fold_metrics_all_zero_actuals_has_no_nan():
+    forecast = pd.DataFrame({"yhat": [1.0, 2.0], "yhat_lower": [0.0, 0.0], "yhat_upper": [3.0, 3.0]})
+    metrics = _fold_metrics(np.zeros(2), forecast)
+    assert metrics["mape"] is None
+    json.dumps(metrics, allow_nan=False)
+
+
+def test_aggregate_replaces_nan_with_none():
+    folds = [
+        _ok("Alfa", 12.0),
+        _ok("Beta", None),  # valori reali tutti a zero
+        {"client_name": "Gamma", "engine": "holt_winters", "status": "error", "error": "serie troppo corta"},
+    ]
+    per_client = _aggregate(folds, ["engine", "client_name"])
+    by_client = {r["client_name"]: r for r in per_client}
+
+    assert by_client["Alfa"]["mape"] == 12.0
+    assert by_client["Beta"]["mape"] is None
+    assert by_client["Gamma"]["mape"] is None and by_client["Gamma"]["folds"] == 0
+    assert by_client["Gamma"]["folds_failed"] == 1
+    # Starlette serializza con allow_nan=False
+    json.dumps(per_client, allow_nan=False)
+    json.dumps(_aggregate(folds, ["engine"]), allow_nan=False)
+
+
+def test_concurrent_saves_keep_all_folds(tmp_path):
+    def save(i):
+        BacktestCache(str(tmp_path)).save("holt_winters", 6, {f"fold{i}": {"status": "ok", "mape": float(i)}})
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(BacktestCache(str(tmp_path)).load("holt_winters", 6)) == 16
@@ -0,0 +1,74 @@
+from app.data.dedup import ChunkDeduplicator, strip_repeated_lines
+
+CONTRACT = ("Contratto di fornitura tra la società {client} e il fornitore per la manutenzione ordinaria degli "
+            "impianti di produzione presso lo stabilimento principale, con un corrispettivo annuo pari a euro "
+            "{amount} oltre IVA, da corrispondere in rate trimestrali posticipate secondo le condizioni generali "
+            "allegate al presente accordo.")
+FOOTER = ("Documento riservato ad uso interno della direzione commerciale.\nPagina {page} di 12\n"
+          "Tutti i diritti riservati, vietata la riproduzione anche parziale senza autorizzazione.")
+
+
+def test_similar_contracts_with_distinct_facts_are_not_merged():
+    alfa = CONTRACT.format(client="Alfa Srl", amount="120.000")
+    beta = CONTRACT.format(client="Beta Spa", amount="340.000")
+    # Stesso modello di clausola: una soglia di similarità (Jaccard sui bigrammi) li unirebbe
+    dedup = ChunkDeduplicator()
+    alfa_id, alfa_kind = dedup.resolve(alfa, scope="contratti.pdf#1")
+    beta_id, beta_kind = dedup.resolve(beta, scope="contratti.pdf#2")
+
+    assert (alfa_kind, beta_kind) == ("new", "new")
+    assert alfa_id != beta_id
+
+
+def test_same_amount_change_is_not_merged():
+    dedup = ChunkDeduplicator()
+    dedup.resolve(CONTRACT.format(client="Alfa Srl", amount="120.000"), scope="a.pdf#1")
+    assert dedup.resolve(CONTRACT.format(client="Alfa Srl", amount="130.000"), scope="a.pdf#2")[1] == "new"
+
+
+def test_page_numbers_only_are_merged_across_runs():
+    dedup = ChunkDeduplicator()
+    first_id, _ = dedup.resolve(FOOTER.format(page=3), scope="report.pdf#3")
+    assert dedup.resolve(FOOTER.format(page=4), scope="report.pdf#4") == (first_id, "near")
+
+    # Indicizzazione incrementale: il registro riletto dal manifest riconosce ancora il quasi-duplicato
+    reloaded = ChunkDeduplicator(dedup.export([first_id]))
+    assert reloaded.resolve(FOOTER.format(page=5), scope="report.pdf#5") == (first_id, "near")
+
+
+def test_near_duplicates_need_another_page_and_can_be_disabled():
+    dedup = ChunkDeduplicator()
+    dedup.resolve(FOOTER.format(page=3), scope="report.pdf#3")
+    # Stessa pagina: testo parallelo, non ripetuto
+    assert dedup.resolve(FOOTER.format(page=4), scope="report.pdf#3")[1] == "new"
+
+    exact_only = ChunkDeduplicator(near=False)
+    exact_only.resolve(FOOTER.format(page=3), scope="report.pdf#3")
+    assert exact_only.resolve(FOOTER.format(page=4), scope="report.pdf#4")[1] == "new"
+    assert exact_only.resolve(FOOTER.format(page=3), scope="report.pdf#5")[1] == "exact"
+
+
+def _page(number, body):
+    return f"ACME Srl - Relazione annuale 2024\n{body}\nwww.acme.it | riservato\n{number}"
+
+
+def test_repeated_headers_and_footers_are_stripped_before_splitting():
+    bodies = [f"Capitolo {n}: ricavi della linea {n} in crescita rispetto al 2023." for n in range(1, 7)]
+    pages, removed = strip_repeated_lines([_page(n, body) for n, body in enumerate(bodies, start=1)])
+
+    # Intestazione, piè di pagina e numero di pagina restano solo sulla prima pagina
+    assert removed == 3 * 5
+    assert pages[0] == _page(1, bodies[0])
+    assert pages[1:] == bodies[1:]
+
+
+def test_lines_repeated_on_few_pages_or_inside_the_page_are_kept():
+    # Intestazione su 2 pagine su 6: sotto la soglia di ripetizione
+    pages = [_page(1, "a"), _page(2, "b")] + [f"Sezione {n}" for n in range(4)]
+    assert strip_repeated_lines(pages) == (pages, 0)
+
+    # Riga del piè di pagina a metà di una pagina: non è un bordo e resta
+    middle = "Indice\nuno\ndue\ntre\nwww.acme.it | riservato\nquattro\ncinque\nsei\nsette"
+    cleaned, _ = strip_repeated_lines([_page(1, "a"), _page(2, "b"), _page(3, "c"), middle])
+    assert "www.acme.it | riservato" not in cleaned[1]
+    assert cleaned[3] == middle
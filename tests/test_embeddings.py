@@ -0,0 +1,38 @@
+import sqlite3
+import time
+
+import numpy as np
+
+from app.services.embeddings import EmbeddingStore
+
+
+def _vec(x):
+    return np.full(4, x, dtype="float32")
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "emb.sqlite"), max_entries=3)
+    store.put_many("m", [("a", _vec(1)), ("b", _vec(2)), ("c", _vec(3))])
+    time.sleep(0.01)
+    store.get_many("m", ["a"])  # "a" diventa la più recente
+    time.sleep(0.01)
+    store.put_many("m", [("d", _vec(4))])
+
+    assert store.count() == 3
+    assert store.evictions == 1
+    assert sorted(store.get_many("m", ["a", "b", "c", "d"])) == ["a", "c", "d"]
+
+
+def test_store_migrates_cache_without_last_used_at(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE embeddings (model TEXT NOT NULL, text_hash TEXT NOT NULL, dim INTEGER NOT NULL,"
+                 " vector BLOB NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (model, text_hash))")
+    conn.execute("INSERT INTO embeddings VALUES ('m', 'a', 4, ?, 1.0)", (_vec(1).tobytes(),))
+    conn.commit()
+    conn.close()
+
+    store = EmbeddingStore(path, max_entries=1)
+    np.testing.assert_array_equal(store.get_many("m", ["a"])["a"], _vec(1))
+    store.put_many("m", [("b", _vec(2))])
+    assert store.count() == 1
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.engines import ENGINES, get_engine, monthly_series
+
+
+def _history(months=36, seed=1):
+    ds = pd.date_range("2021-01-01", periods=months, freq="MS") + pd.Timedelta(days=14)
+    y = 100 + 10 * np.arange(months) + np.random.default_rng(seed).normal(0, 5, months)
+    return pd.DataFrame({"ds": ds, "y": y})
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_unsorted_history_gives_same_forecast(engine):
+    df = _history()
+    ordered = get_engine(engine).forecast(df, 3)
+    reversed_ = get_engine(engine).forecast(df.iloc[::-1].reset_index(drop=True), 3)
+
+    np.testing.assert_allclose(reversed_["yhat"], ordered["yhat"])
+    assert list(reversed_["ds"]) == list(ordered["ds"])
+    # Le date future seguono l'ultima data reale, non l'ultima riga del file
+    assert list(ordered["ds"].tail(3)) == list(pd.to_datetime(["2023-12-31", "2024-01-31", "2024-02-29"]))
+    # Con le righe in ordine inverso si ripartiva dal 2021 (~100)
+    assert ordered["yhat"].iloc[-1] > 300
+
+
+def test_gaps_and_repeated_months_become_one_value_per_month():
+    ds = pd.to_datetime(["2024-03-20", "2024-01-10", "2024-03-02"]).to_numpy()
+    labels, values = monthly_series(ds, np.array([3.0, 2.0, 1.0]))
+
+    assert list(labels) == list(pd.to_datetime(["2024-01-10", "2024-02-29", "2024-03-20"]))
+    np.testing.assert_allclose(values, [2.0, 0.0, 4.0])
+
+
+def test_gapped_history_is_forecast_on_consecutive_months():
+    df = _history(months=30).drop(index=[10, 11])  # due mesi senza commesse
+    forecast = get_engine("holt_winters").forecast(df, 6)
+
+    assert len(forecast) == 30 + 6
+    assert forecast["ds"].is_monotonic_increasing
+
+
+@pytest.fixture(scope="module")
+def prophet_forecast():
+    from app.services.forecasting import ForecastingService
+
+    model = ForecastingService.fit_model(_history())
+    return model.predict(model.make_future_dataframe(periods=6, freq="ME"))
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_engine_output_matches_prophet_shape(engine, prophet_forecast):
+    from app.services.forecasting import compute_kpi_metrics
+
+    df = _history()
+    forecast = get_engine(engine).forecast(df, 6)
+
+    assert list(forecast.columns) == ["ds", "yhat", "yhat_lower", "yhat_upper", "trend"]
+    assert set(forecast.columns) <= set(prophet_forecast.columns)
+    assert list(forecast["ds"]) == list(prophet_forecast["ds"])
+    assert (forecast["yhat_lower"] <= forecast["yhat"]).all() and (forecast["yhat"] <= forecast["yhat_upper"]).all()
+
+    metrics = compute_kpi_metrics(df["y"], forecast, 6)
+    assert metrics.keys() == compute_kpi_metrics(df["y"], prophet_forecast, 6).keys()
+    assert all(np.isfinite(v) for v in metrics.values() if not isinstance(v, str))
+
+
+def test_forecast_many_matches_single_forecasts():
+    frames = {"Alfa": _history(seed=1), "Beta": _history(seed=2), "Gamma": _history(months=24, seed=3)}
+    batch = get_engine("holt_winters").forecast_many(frames, 6)
+
+    for name, df in frames.items():
+        single = get_engine("holt_winters").forecast(df, 6)
+        pd.testing.assert_frame_equal(batch[name].reset_index(drop=True), single.reset_index(drop=True))
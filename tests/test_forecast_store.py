@@ -0,0 +1,83 @@
+import os
+from types import SimpleNamespace
+
+from app.services import forecast_store as fs_module
+from app.services.forecast_store import ForecastStore
+
+
+def _entry(series_hash):
+    return {"metrics": {"mape": 5.0}, "forecast_data": [{"ds": "2025-01-01", "yhat": 1.0}],
+            "series_hash": series_hash, "dataset_version": "v1"}
+
+
+def test_put_writes_only_the_client_file(tmp_path):
+    store = ForecastStore(str(tmp_path), max_age_seconds=3600)
+    store.put("Alfa Srl", 12, "prophet", _entry("h-alfa"))
+    alfa_path = store._path("Alfa Srl", 12, "prophet")
+    alfa_mtime = os.path.getmtime(alfa_path)
+
+    store.put("Beta/Spa", 12, "prophet", _entry("h-beta"))
+
+    assert len(os.listdir(store._dir("prophet", 12))) == 2
+    assert os.path.getmtime(alfa_path) == alfa_mtime
+    assert store.get("Beta/Spa", 12, "prophet")["series_hash"] == "h-beta"
+    # Un'altra istanza (es. il worker separato) legge le stesse entry
+    assert ForecastStore(str(tmp_path), 3600).get("Alfa Srl", 12, "prophet")["metrics"] == {"mape": 5.0}
+
+
+def test_refresh_skips_batch_when_store_is_fresh(tmp_path, monkeypatch):
+    store = ForecastStore(str(tmp_path), max_age_seconds=3600)
+    hashes = {"Alfa": "h1", "Beta": "h2"}
+    batches = []
+
+    class FakeService:
+        def __init__(self, data_path=None):
+            self.dataset = SimpleNamespace(series_hashes=hashes, version="v1")
+
+        def generate_batch_forecast(self, clients, months, engine="prophet", stop=None):
+            batches.append(list(clients))
+            return {"months": months, "engine": engine, "workers": 1, "succeeded": len(clients), "failed": 0,
+                    "total_seconds": 0.0,
+                    "results": [{"client_name": c, "status": "ok", "metrics": {}, "forecast_data": []}
+                                for c in clients]}
+
+    monkeypatch.setattr(fs_module, "forecast_store", store)
+    monkeypatch.setattr(fs_module, "ForecastingService", FakeService)
+
+    assert fs_module.refresh_store()["succeeded"] == 2
+    summary = fs_module.refresh_store()
+    assert summary["skipped"] == 2 and summary["workers"] == 0
+
+    hashes["Beta"] = "h2-nuovo"
+    fs_module.refresh_store()
+    assert batches == [["Alfa", "Beta"], ["Beta"]]
+
+
+def test_stop_cancels_pending_fits(tmp_path, monkeypatch):
+    import threading
+
+    from app.services.forecasting import ForecastingService
+
+    # I processi del pool leggono le settings dall'ambiente: cache dei modelli nella cartella temporanea
+    monkeypatch.setenv("FORECAST_CACHE_DIR", str(tmp_path / "models"))
+    stop = threading.Event()
+    # Scatta mentre i worker stanno ancora importando Prophet: nessun fit è terminato
+    threading.Timer(0.5, stop.set).start()
+    batch = ForecastingService("app/data/storico_commesse.csv").generate_batch_forecast(
+        "all", 6, max_workers=2, stop=stop)
+
+    statuses = [r["status"] for r in batch["results"]]
+    assert len(statuses) == 5
+    assert "cancelled" in statuses
+    assert set(statuses) <= {"ok", "cancelled"}
+
+
+def test_preset_stop_starts_no_pool(tmp_path):
+    import threading
+
+    stop = threading.Event()
+    stop.set()
+    service = fs_module.ForecastingService("app/data/storico_commesse.csv")
+    batch = service.generate_batch_forecast("all", 6, max_workers=2, stop=stop)
+    assert batch["workers"] == 0
+    assert {r["status"] for r in batch["results"]} == {"cancelled"}
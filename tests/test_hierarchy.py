@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from app.services.hierarchy import HierarchicalForecaster
+
+
+class _FakeDataset:
+    def __init__(self, series, sectors):
+        self.series = series
+        self.sectors = sectors
+
+    def iter_series(self):
+        for client, (ds, y) in self.series.items():
+            yield client, np.array(ds, dtype="datetime64[ns]"), np.asarray(y, dtype="float64")
+
+
+def _forecaster(series, sectors):
+    return HierarchicalForecaster(SimpleNamespace(dataset=_FakeDataset(series, sectors)))
+
+
+def test_bottom_matrix_buckets_mixed_days_by_month():
+    forecaster = _forecaster({
+        "Alfa": (["2024-01-15", "2024-02-14", "2024-03-16"], [10.0, 20.0, 30.0]),
+        # Due commesse a marzo, nessuna a febbraio
+        "Beta": (["2024-01-02", "2024-03-01", "2024-03-28"], [1.0, 2.0, 3.0]),
+    }, {"Alfa": "Retail", "Beta": "Retail"})
+
+    clients, ds, B = forecaster._bottom_matrix()
+
+    assert clients == ["Alfa", "Beta"]
+    assert list(ds) == list(pd.to_datetime(["2024-01-31", "2024-02-29", "2024-03-31"]))
+    np.testing.assert_allclose(B, [[10.0, 20.0, 30.0], [1.0, 0.0, 5.0]])
+
+
+def test_forecast_with_mixed_days_is_coherent():
+    months = pd.date_range("2021-01-01", periods=30, freq="MS")
+    rng = np.random.default_rng(0)
+    series = {
+        f"Cliente {i}": (list(months + pd.Timedelta(days=int(day))), 100 + rng.normal(0, 5, len(months)))
+        for i, day in enumerate([14, 0, 27])
+    }
+    forecaster = _forecaster(series, {"Cliente 0": "A", "Cliente 1": "A", "Cliente 2": "B"})
+
+    result = forecaster.forecast(months=6, engine="holt_winters", method="mint_shrink")
+
+    assert result["reconciliation"]["coherence_error"] < 1e-6
+    assert result["nodes"] == {"total": 1, "sectors": 2, "clients": 3}
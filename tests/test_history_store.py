@@ -0,0 +1,51 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.core.config import settings
+from app.data.history_store import ColumnarSnapshot
+from app.data.ingestion import ingest_csv
+
+
+def _store(tmp_path, monkeypatch, clients=8, months=24):
+    # Row group piccoli: ogni cliente è sparso su più file e più row group
+    monkeypatch.setattr(settings, "HISTORY_ROW_GROUP_ROWS", 16)
+    lines = ["data_commessa,cliente,settore,fatturato"]
+    for m in range(months):
+        for c in range(clients):
+            lines.append(f"{2022 + m // 12}-{m % 12 + 1:02d}-15,Cliente {c},Energia,{c * 1000 + m}.0")
+    data = io.BytesIO("\n".join(lines).encode("utf-8"))
+    manifest = ingest_csv(data, store_dir=str(tmp_path), chunk_rows=50)
+    return os.path.join(tmp_path, manifest["version"]), manifest["version"]
+
+
+def test_concurrent_reads_match_sequential_reads(tmp_path, monkeypatch):
+    path, version = _store(tmp_path, monkeypatch)
+    reference = ColumnarSnapshot(path, version)
+    expected = {c: reference.read_series(c) for c in reference.clients}
+
+    # Cache di un solo cliente: quasi ogni lettura va sul disco, da più thread insieme
+    snapshot = ColumnarSnapshot(path, version, cache_size=1)
+    requests = [c for c in snapshot.clients for _ in range(4)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(snapshot.read_series, requests))
+
+    for client, (ds, y) in zip(requests, results):
+        np.testing.assert_array_equal(ds, expected[client][0])
+        np.testing.assert_array_equal(y, expected[client][1])
+    assert len(snapshot._cache) == 1
+
+
+def test_iter_series_and_date_pushdown(tmp_path, monkeypatch):
+    path, version = _store(tmp_path, monkeypatch)
+    snapshot = ColumnarSnapshot(path, version)
+
+    for client, ds, y in snapshot.iter_series():
+        np.testing.assert_array_equal(y, snapshot.read_series(client)[1])
+        assert len(ds) == 24
+
+    ds, y = snapshot.read_series("Cliente 3", start="2023-01-01", end="2023-06-30")
+    assert len(ds) == 6
+    np.testing.assert_array_equal(y, 3000.0 + np.arange(12, 18))
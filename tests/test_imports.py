@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+
+def test_forecasting_imports_without_pyarrow():
+    # pyarrow serve solo a ingestione Parquet, backend colonnare e risposte Arrow
+    code = (
+        "import sys; sys.modules['pyarrow'] = None\n"
+        "import app.services.forecasting, app.services.forecast_store\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_indexer_and_benchmarks_import_without_api_keys():
+    env = {k: v for k, v in os.environ.items() if k not in ("OPENAI_API_KEY", "TAVILY_API_KEY")}
+    code = "import app.data.rag_index_repo, app.benchmarks.embeddings, app.benchmarks.agent_engine\n"
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)
@@ -0,0 +1,99 @@
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from app.core.config import settings
+from app.data.ingestion import (
+    CURRENT_POINTER, IngestionError, active_dataset_path, active_version, ingest_csv, list_versions, prune_versions,
+)
+
+HEADER = "data_commessa,cliente,settore,fatturato,margine_pct\n"
+
+
+def _csv(*rows):
+    return io.BytesIO((HEADER + "".join(f"{r}\n" for r in rows)).encode("utf-8"))
+
+
+def _rows(client, months=6, start=100):
+    return [f"2024-{m:02d}-15,{client},Energia,{start + m}.5,12.0" for m in range(1, months + 1)]
+
+
+@pytest.fixture(autouse=True)
+def keep_all_versions(monkeypatch):
+    # Il prune automatico di ingest_csv non deve interferire con i test sul versionamento
+    monkeypatch.setattr(settings, "DATASET_KEEP_VERSIONS", 100)
+
+
+def test_invalid_rows_are_rejected_and_counted(tmp_path):
+    data = _csv(
+        *_rows("Alfa"),
+        "non-una-data,Alfa,Energia,10.0,1.0",
+        "2024-07-15,,Energia,10.0,1.0",
+        "2024-08-15,Alfa,Energia,n/d,1.0",
+    )
+    manifest = ingest_csv(data, "alfa.csv", store_dir=str(tmp_path), chunk_rows=4)
+
+    assert manifest["rows"] == 6
+    assert manifest["rows_rejected"] == 3
+    assert manifest["clients"] == 1
+    stored = pd.read_parquet(os.path.join(tmp_path, manifest["version"]))
+    assert len(stored) == 6
+    assert stored["fatturato"].dtype == "float64"
+
+
+def test_missing_columns_leave_no_version(tmp_path):
+    with pytest.raises(IngestionError):
+        ingest_csv(io.BytesIO(b"data_commessa,cliente\n2024-01-15,Alfa\n"), store_dir=str(tmp_path))
+
+    # Né versioni né cartelle di staging rimaste a metà, e nessun puntatore attivo
+    assert os.listdir(tmp_path) == []
+    assert active_version(str(tmp_path)) is None
+
+
+def test_version_is_the_content_hash(tmp_path):
+    store = str(tmp_path)
+    first = ingest_csv(_csv(*_rows("Alfa")), store_dir=store)
+    again = ingest_csv(_csv(*_rows("Alfa")), "copia.csv", store_dir=store)
+    other = ingest_csv(_csv(*_rows("Alfa", start=200)), store_dir=store)
+
+    assert first["reused"] is False
+    assert again["reused"] is True and again["version"] == first["version"]
+    assert other["version"] != first["version"]
+    assert sorted(m["version"] for m in list_versions(store)) == sorted({first["version"], other["version"]})
+
+
+def test_current_pointer_switches_only_on_activation(tmp_path):
+    store = str(tmp_path)
+    first = ingest_csv(_csv(*_rows("Alfa")), store_dir=store)
+    assert active_version(store) == first["version"]
+    assert active_dataset_path(store) == os.path.join(store, first["version"])
+
+    staged = ingest_csv(_csv(*_rows("Beta")), store_dir=store, activate=False)
+    assert staged["active"] is False
+    assert active_version(store) == first["version"]
+
+    second = ingest_csv(_csv(*_rows("Beta")), store_dir=store)
+    assert active_version(store) == second["version"]
+    # Il puntatore viene sostituito con os.replace: nessun file temporaneo rimasto accanto a CURRENT
+    assert [name for name in os.listdir(store) if name.startswith(CURRENT_POINTER)] == [CURRENT_POINTER]
+
+
+def test_without_uploads_the_default_csv_is_used(tmp_path):
+    assert active_dataset_path(str(tmp_path)) == settings.DATA_PATH
+
+
+def test_prune_keeps_recent_versions_and_the_active_one(tmp_path):
+    store = str(tmp_path)
+    oldest = ingest_csv(_csv(*_rows("Alfa")), store_dir=store)
+    middle = ingest_csv(_csv(*_rows("Beta")), store_dir=store, activate=False)
+    newest = ingest_csv(_csv(*_rows("Gamma")), store_dir=store, activate=False)
+    # Le ultime due non sono state attivate: la versione attiva è la più vecchia e va conservata
+    assert active_version(store) == oldest["version"]
+
+    removed = prune_versions(store, keep=1)
+
+    assert removed == [middle["version"]]
+    assert sorted(m["version"] for m in list_versions(store)) == sorted([oldest["version"], newest["version"]])
+    assert not os.path.exists(os.path.join(store, middle["version"]))
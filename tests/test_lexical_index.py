@@ -0,0 +1,118 @@
+import math
+
+import pytest
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.data.lexical_index import BM25_B, BM25_K1, LexicalIndex, tokenize
+from app.services.rag_service import RAGService
+
+
+def _index(texts):
+    index = LexicalIndex()
+    ids = [f"c{i}" for i in range(len(texts))]
+    index.add(ids, [Document(page_content=t, metadata={"source": f"docs/pagina_{i}.md"}) for i, t in enumerate(texts)])
+    return index
+
+
+def _corpus():
+    # 20 chunk: un termine presente in un solo chunk ha df = 0.05, cioè "raro"
+    filler = [f"relazione mensile fatturato commesse reparto {n}" for n in
+              ("uno due tre quattro cinque sei sette otto nove dieci undici dodici tredici "
+               "quattordici quindici sedici diciassette").split()]
+    return filler + [
+        "contratto quadro Zephyros manutenzione impianti Torino",
+        "offerta rinnovo flotta aziendale Milano",
+        "manutenzione impianti fatturato trimestre",
+    ]
+
+
+class FakeVectorStore:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = 0
+
+    def similarity_search(self, query, k):
+        self.calls += 1
+        return self.docs[:k]
+
+
+def _service(index, vector_docs):
+    service = RAGService.__new__(RAGService)
+    service._lexical = index
+    service._vs = FakeVectorStore(vector_docs)
+    service.top_k = 2
+    return service
+
+
+def test_tokenize_drops_accents_stopwords_and_underscores():
+    assert tokenize("Qual è il fatturato di Società_Alfa?") == ["fatturato", "societa", "alfa"]
+
+
+def test_bm25_score_matches_formula():
+    index = _index(["impianti impianti Torino", "impianti Milano", "flotta Roma aziendale nuova"])
+    (top_id, score, matched), *rest = index.search("impianti", 3)
+
+    # Il nome del file (pagina_N) fa parte del testo indicizzato: 2 token in più per chunk
+    lengths = [5, 4, 6]
+    avg = sum(lengths) / 3
+    idf = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5))
+    expected = idf * 2 * (BM25_K1 + 1) / (2 + BM25_K1 * (1 - BM25_B + BM25_B * lengths[0] / avg))
+
+    assert top_id == "c0" and matched == ["impianti"]
+    assert score == pytest.approx(expected)
+    assert [r[0] for r in rest] == ["c1"]
+    assert index.idf("impianti") == pytest.approx(idf)
+
+
+def test_file_name_is_searchable():
+    index = _index(["testo senza riferimenti", "altro testo"])
+    assert index.search("pagina 1", 1)[0][0] == "c1"
+
+
+def test_decisive_lexical_hit_skips_vector_search():
+    index = _index(_corpus())
+    service = _service(index, [Document(id="c18", page_content="offerta rinnovo flotta aziendale Milano")])
+
+    docs, mode = service._search("contratto Zephyros", 2)
+
+    assert mode == "lexical"
+    assert docs[0].id == "c17"
+    assert service._vs.calls == 0
+
+
+def test_common_terms_are_not_decisive():
+    index = _index(_corpus())
+    service = _service(index, [])
+    hits = index.search("fatturato commesse", 5)
+
+    # Copertura piena della query ma nessun termine raro: serve anche la ricerca densa
+    assert not service._is_decisive(index, "fatturato commesse", hits[0][2])
+    # Termine raro ma metà della query non coperta dal primo risultato
+    hits = index.search("Zephyros flotta", 5)
+    assert not service._is_decisive(index, "Zephyros flotta", hits[0][2])
+
+
+def test_rrf_merges_vector_and_lexical_rankings(monkeypatch):
+    monkeypatch.setattr(settings, "RAG_RRF_K", 60)
+    index = _index(_corpus())
+    # Ricerca densa: c18 primo, poi c19; lessicale su "manutenzione impianti": c19 e c17
+    vector_docs = [Document(id="c18", page_content="offerta rinnovo flotta aziendale Milano"),
+                   Document(id="c19", page_content="manutenzione impianti fatturato trimestre")]
+    service = _service(index, vector_docs)
+    lexical_ids = [chunk_id for chunk_id, _, _ in index.search("manutenzione impianti", 20)]
+    assert set(lexical_ids) == {"c17", "c19"}
+
+    docs, mode = service._search("manutenzione impianti", 3)
+
+    def rrf(rank):
+        return 1.0 / (60 + rank + 1)
+    scores = {"c18": rrf(0), "c19": rrf(1), "c17": 0.0}
+    for rank, chunk_id in enumerate(lexical_ids):
+        scores[chunk_id] += rrf(rank)
+    assert mode == "hybrid"
+    assert [d.id for d in docs] == sorted(scores, key=lambda c: -scores[c])
+    # c19 compare in entrambe le classifiche: un solo documento, preso dalla ricerca densa
+    assert docs[0].id == "c19" and docs[0] is vector_docs[1]
+    # I documenti trovati solo dal BM25 vengono ricostruiti dall'indice lessicale
+    assert next(d for d in docs if d.id == "c17").page_content.startswith("contratto quadro")
@@ -0,0 +1,140 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+from app.core.config import settings
+from app.services import llm_cache
+from app.services.agent_engine import AgentEngine
+from app.services.llm_cache import LLMResponseStore, NodeLLMCache, get_llm_cache, llm_cache_stats
+from app.services.web_search import CachedSearch, StaticSearchProvider
+
+
+class Clock:
+    """time.time controllato dal test: TTL e ordine LRU non dipendono dalla velocità della macchina"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def fresh_caches(tmp_path, monkeypatch):
+    # Database nella cartella temporanea e nessuna cache di nodo creata dai test precedenti
+    monkeypatch.setattr(settings, "LLM_CACHE_PATH", str(tmp_path / "llm.sqlite"))
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_CACHE_NODES", "analyst,internal_researcher,researcher,director")
+    monkeypatch.setattr(llm_cache, "_store", None)
+    monkeypatch.setattr(llm_cache, "_caches", {})
+    yield
+    if llm_cache._store is not None:
+        llm_cache._store.close()
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    store = LLMResponseStore(str(tmp_path / "llm.sqlite"), ttl_seconds=60)
+    store.put("llm", "prompt", "analyst", ["risposta"])
+
+    clock.now += 59
+    assert store.get("llm", "prompt") == ["risposta"]
+    clock.now += 2
+    assert store.get("llm", "prompt") is None
+    assert store.expired == 1
+    assert store.count() == 0
+    store.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    store = LLMResponseStore(str(tmp_path / "llm.sqlite"), max_entries=2)
+    store.put("llm", "a", "analyst", ["A"])
+    clock.now += 1
+    store.put("llm", "b", "analyst", ["B"])
+    clock.now += 1
+    # "a" letta dopo l'inserimento di "b": la meno recente diventa "b"
+    assert store.get("llm", "a") == ["A"]
+    clock.now += 1
+    store.put("llm", "c", "analyst", ["C"])
+
+    assert store.evictions == 1
+    assert store.get("llm", "b") is None
+    assert store.get("llm", "a") == ["A"] and store.get("llm", "c") == ["C"]
+    store.close()
+
+
+def test_node_cache_counts_hits_and_misses(tmp_path):
+    store = LLMResponseStore(str(tmp_path / "llm.sqlite"))
+    cache = NodeLLMCache(store, "analyst")
+
+    assert cache.lookup("prompt", "llm") is None
+    cache.update("prompt", "llm", [ChatGeneration(message=AIMessage(content="risposta"))])
+    hit = cache.lookup("prompt", "llm")
+
+    assert [g.message.content for g in hit] == ["risposta"]
+    # Stesso prompt, modello o parametri diversi: chiave diversa
+    assert cache.lookup("prompt", "altro-llm") is None
+    assert cache.stats() == {"hits": 1, "misses": 2}
+    store.close()
+
+
+def test_cache_only_for_enabled_nodes(fresh_caches, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CACHE_NODES", "analyst, director")
+
+    assert get_llm_cache("researcher") is None
+    analyst = get_llm_cache("analyst")
+    assert analyst is get_llm_cache("analyst")
+    assert analyst.store is get_llm_cache("director").store
+    assert llm_cache_stats()["enabled_nodes"] == ["analyst", "director"]
+
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+    assert get_llm_cache("analyst") is None
+
+
+class FakeRAG:
+    def retrieve(self, query):
+        return [Document(page_content="Contratto quadro Alfa Srl", metadata={"source": "docs/alfa.md"})]
+
+
+def _engine(llm):
+    # Motore senza OpenAI né indice RAG: stessi nodi e stesso grafo di produzione
+    engine = AgentEngine.__new__(AgentEngine)
+    engine.llm = llm
+    engine.web_search = CachedSearch(StaticSearchProvider(default=[
+        {"title": "Alfa Srl", "url": "https://example.com/alfa", "content": "Nuovo stabilimento"}]))
+    engine.rag = FakeRAG()
+    engine.graph = engine.build_graph()
+    return engine
+
+
+def test_repeated_stream_analysis_is_served_from_cache(fresh_caches):
+    llm = GenericFakeChatModel(messages=iter(["Analisi delle metriche in crescita."] * 8))
+    engine = _engine(llm)
+
+    def run():
+        events = list(engine.stream_analysis("Alfa Srl", "Automotive", {"mape": 5.0}, "Rischi del contratto?"))
+        return events[-1][1]["final_report"]
+
+    first = run()
+    nodes = llm_cache_stats()["nodes"]
+    assert sum(n["misses"] for n in nodes.values()) == 4
+    assert sum(n["hits"] for n in nodes.values()) == 0
+
+    second = run()
+    nodes = llm_cache_stats()["nodes"]
+    assert {name: (n["hits"], n["misses"]) for name, n in nodes.items()} == {
+        name: (1, 1) for name in ("analyst", "internal_researcher", "researcher", "director")}
+    assert second == first
+    # Il modello è stato chiamato solo nel primo run: restano 4 risposte non consumate
+    assert len(list(llm.messages)) == 4
+    assert llm_cache_stats()["entries"] == 4
@@ -0,0 +1,73 @@
+import os
+
+from app.core.config import settings
+from app.data.rag_index_repo import MANIFEST_FILE, build_vectorstore, chunk_sources, load_manifest, open_vector_store
+from app.services.embeddings import HashingEmbeddings
+from app.services.rag_service import RAGService
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _build(repo, persist, embedding):
+    return build_vectorstore(str(repo), str(persist), "test", embedding=embedding, backend="flat")
+
+
+def test_missing_manifest_rebuilds_store_from_scratch(tmp_path, monkeypatch):
+    # Configurazione di default uguale a quella dell'indice: senza manifest non scatta il rebuild per config
+    monkeypatch.setattr(settings, "EMBEDDING_BACKEND", "local")
+    monkeypatch.setattr(settings, "RAG_VECTOR_BACKEND", "flat")
+    repo, persist = tmp_path / "repo", tmp_path / "rag"
+    embedding = HashingEmbeddings()
+    _write(str(repo / "docs" / "alfa.md"), "Contratto quadro Alfa Srl per la manutenzione degli impianti di Torino.")
+    _write(str(repo / "docs" / "beta.md"), "Offerta Beta Spa per il rinnovo della flotta aziendale di Milano e Roma.")
+    _build(repo, persist, embedding)
+    assert len(open_vector_store(str(persist), "test", embedding, "flat").get()["ids"]) == 2
+
+    # Manifest perso e un file rimosso nel frattempo: i vettori di beta non devono restare orfani
+    os.remove(persist / MANIFEST_FILE)
+    os.remove(repo / "docs" / "beta.md")
+    _build(repo, persist, embedding)
+
+    stored = open_vector_store(str(persist), "test", embedding, "flat").get(include=["documents"])
+    assert sorted(stored["ids"]) == sorted(chunk_sources(load_manifest(str(persist))))
+    assert not any("Beta" in text for text in stored["documents"])
+
+
+def test_rag_service_uses_backend_from_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_BACKEND", "local")
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_ENABLED", False)
+    repo, persist = tmp_path / "repo", tmp_path / "rag"
+    _write(str(repo / "docs" / "alfa.md"), "Contratto quadro Alfa Srl per la manutenzione degli impianti di Torino.")
+    _build(repo, persist, HashingEmbeddings())
+
+    # Servizio configurato per Chroma, indice costruito con il flat store
+    monkeypatch.setattr(settings, "RAG_VECTOR_BACKEND", "chroma")
+    service = RAGService(str(persist), "test", top_k=1)
+
+    assert service.backend == "flat"
+    assert "Alfa Srl" in service.retrieve("manutenzione impianti Torino")[0].page_content
+
+
+def test_retrieve_returns_copies_of_cached_documents(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_BACKEND", "local")
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_ENABLED", False)
+    repo, persist = tmp_path / "repo", tmp_path / "rag"
+    _write(str(repo / "docs" / "alfa.md"), "Contratto quadro Alfa Srl per la manutenzione degli impianti di Torino.")
+    _build(repo, persist, HashingEmbeddings())
+    service = RAGService(str(persist), "test", top_k=1)
+
+    first = service.retrieve("manutenzione impianti Torino")
+    first[0].metadata["sources"].append("iniettato.md")
+    first[0].metadata["source"] = "modificato.md"
+    first[0].page_content = ""
+
+    # Seconda chiamata servita dalla cache: non deve vedere le modifiche del primo chiamante
+    second = service.retrieve("manutenzione impianti Torino")
+    assert service.cache_stats()["hits"] == 1
+    assert second[0].metadata["source"] != "modificato.md"
+    assert "iniettato.md" not in second[0].metadata["sources"]
+    assert "Alfa Srl" in second[0].page_content
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.config import settings
+from app.services.forecasting import ForecastingService
+from app.services.scenarios import ScenarioService
+
+CLIENT = "Stellantis"
+MONTHS = 12
+
+
+@pytest.fixture(scope="module")
+def service():
+    return ScenarioService(ForecastingService("app/data/storico_commesse.csv"))
+
+
+def _future(result):
+    # forecast_data: ultimi 12 mesi storici + orizzonte, si tengono solo i mesi previsti
+    return pd.DataFrame(result["forecast_data"]).tail(MONTHS).reset_index(drop=True)
+
+
+def _evaluate(service, scenario):
+    result = service.evaluate(CLIENT, [scenario], MONTHS, engine="holt_winters", include_forecast_data=True)
+    return _future(result["baseline"]), _future(result["scenarios"][0])
+
+
+def test_numpy_engine_samples_are_cached(service):
+    first, _ = service.get_samples(CLIENT, MONTHS, "holt_winters")
+    second, cached = service.get_samples(CLIENT, MONTHS, "holt_winters")
+
+    assert cached and second is first
+    assert first.samples.shape == (MONTHS, settings.SCENARIO_SAMPLES)
+    assert list(pd.DatetimeIndex(first.future_ds).is_month_end) == [True] * MONTHS
+
+
+def test_shock_scales_only_its_months(service):
+    ss, _ = service.get_samples(CLIENT, MONTHS, "holt_winters")
+    months = pd.DatetimeIndex(ss.future_ds).to_period("M")
+    shock = {"start": str(months[1]), "end": str(months[3]), "pct": -20}
+    base, shocked = _evaluate(service, {"name": "shock", "shocks": [shock]})
+
+    hit = np.zeros(MONTHS, dtype=bool)
+    hit[1:4] = True
+    for col in ("yhat", "yhat_lower", "yhat_upper"):
+        np.testing.assert_allclose(shocked[col][hit], base[col][hit] * 0.8)
+        np.testing.assert_allclose(shocked[col][~hit], base[col][~hit])
+
+
+def test_seasonal_multiplier_scales_matching_calendar_month(service):
+    ss, _ = service.get_samples(CLIENT, MONTHS, "holt_winters")
+    month = int(pd.DatetimeIndex(ss.future_ds).month[5])
+    base, scaled = _evaluate(service, {"name": "picco", "seasonal_multipliers": {str(month): 1.5}})
+
+    hit = base["ds"].dt.month.to_numpy() == month
+    assert hit.sum() == 1
+    for col in ("yhat", "yhat_lower", "yhat_upper"):
+        np.testing.assert_allclose(scaled[col][hit], base[col][hit] * 1.5)
+        np.testing.assert_allclose(scaled[col][~hit], base[col][~hit])
+
+
+def test_growth_shifts_quantiles_by_the_new_trend_slope(service):
+    ss, _ = service.get_samples(CLIENT, MONTHS, "holt_winters")
+    base, grown = _evaluate(service, {"name": "crescita", "growth_pct_annual": 24})
+
+    # Stessa traslazione per punto e quantili: (nuova pendenza - pendenza attuale) · h
+    trend_future = ss.trend[-MONTHS:]
+    base_slope = (trend_future[-1] - trend_future[0]) / (MONTHS - 1)
+    new_slope = ss.trend[-MONTHS - 1] * 0.24 / 12
+    expected = (new_slope - base_slope) * np.arange(1, MONTHS + 1)
+    for col in ("yhat", "yhat_lower", "yhat_upper"):
+        np.testing.assert_allclose(grown[col] - base[col], expected, atol=1e-6)
+
+
+def test_quantiles_come_from_the_samples(service):
+    ss, _ = service.get_samples(CLIENT, MONTHS, "holt_winters")
+    base, _ = _evaluate(service, {"name": "nessuna modifica"})
+
+    lower, upper = np.quantile(ss.samples, [0.10, 0.90], axis=1)
+    np.testing.assert_allclose(base["yhat_lower"], lower)
+    np.testing.assert_allclose(base["yhat_upper"], upper)
+    assert (base["yhat_lower"] < base["yhat"]).all() and (base["yhat"] < base["yhat_upper"]).all()
@@ -0,0 +1,16 @@
+from fastapi.testclient import TestClient
+
+from app.api import server
+from app.core.config import settings
+from app.services import agent_engine
+
+
+def test_shutdown_releases_agent_engine(monkeypatch):
+    monkeypatch.setattr(settings, "FORECAST_PRECOMPUTE_ENABLED", False)
+    engine = object()
+    monkeypatch.setattr(agent_engine, "_engine", engine)
+
+    with TestClient(server.app):
+        assert agent_engine._engine is engine
+
+    assert agent_engine._engine is None
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from app.services import web_search
+from app.services.web_search import CachedSearch, StaticSearchProvider
+
+RESULTS = [{"title": "Alfa Srl", "url": "https://example.com/alfa", "content": "Nuovo stabilimento"}]
+
+
+class FailingSearchProvider(StaticSearchProvider):
+    def search(self, query):
+        super().search(query)
+        raise RuntimeError("quota esaurita")
+
+
+def _concurrent(search, query, n):
+    barrier = threading.Barrier(n)
+    outcomes = [None] * n
+
+    def run(i):
+        barrier.wait()
+        try:
+            outcomes[i] = search.search(query)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return outcomes
+
+
+def test_identical_concurrent_queries_share_one_call():
+    provider = StaticSearchProvider(default=RESULTS, latency_s=0.2)
+    search = CachedSearch(provider)
+
+    outcomes = _concurrent(search, "Alfa Srl notizie", 8)
+
+    assert provider.calls == 1
+    assert all(results == RESULTS for results, _ in outcomes)
+    assert sorted(info["cache"] for _, info in outcomes) == ["coalesced"] * 7 + ["miss"]
+    # Query uguale a meno di maiuscole e spazi: dalla cache
+    assert search.search("  alfa srl   NOTIZIE")[1]["cache"] == "hit"
+    assert search.stats() == {"hits": 1, "misses": 1, "coalesced": 7, "errors": 0, "in_flight": 0}
+
+
+def test_errors_reach_all_waiters_and_are_not_cached():
+    provider = FailingSearchProvider(latency_s=0.2)
+    search = CachedSearch(provider)
+
+    outcomes = _concurrent(search, "Beta Spa", 4)
+
+    assert provider.calls == 1
+    assert all(isinstance(o, RuntimeError) and str(o) == "quota esaurita" for o in outcomes)
+    with pytest.raises(RuntimeError):
+        search.search("Beta Spa")
+    assert provider.calls == 2
+    assert search.stats()["errors"] == 2 and search.stats()["in_flight"] == 0
+
+
+def test_cache_endpoint_does_not_build_engine_or_search(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.api import server
+    from app.services import agent_engine
+
+    monkeypatch.setattr(agent_engine, "_engine", None)
+    monkeypatch.setattr(web_search, "_web_search", None)
+
+    response = TestClient(server.app).get("/agent/cache")
+
+    assert response.status_code == 200
+    assert response.json()["web_search"]["misses"] == 0
+    assert agent_engine._engine is None and web_search._web_search is None
+
+
+def test_get_web_search_is_shared(monkeypatch):
+    monkeypatch.setattr(web_search, "_web_search", None)
+    monkeypatch.setattr(web_search.settings, "WEB_SEARCH_PROVIDER", "local")
+
+    assert web_search.get_web_search() is web_search.get_web_search()
+    web_search.get_web_search().search("Gamma")
+    assert web_search.web_search_stats()["misses"] == 1